@@ -27,13 +27,21 @@ License: MIT license.
 """
 import sys
 import os
-from xml.dom.minidom import parse
+try:
+	import xml.etree.cElementTree as ElementTree
+except ImportError:
+	import xml.etree.ElementTree as ElementTree
 import struct
 from base64 import b64decode, b64encode
 import re
 import zlib
+import bisect
 import gzip
+import array
+import shutil
+import tempfile
 from copy import deepcopy
+from xml.sax.saxutils import escape, unescape
 try: 
 	import json
 except ImportError:
@@ -41,628 +49,594 @@ except ImportError:
 		import simplejson as json
 	except:
 		json = False
+try:
+	import numpy
+except ImportError:
+	numpy = None
+try:
+	from hashlib import sha1
+except ImportError:
+	from sha import sha as sha1
 
 VERSION = "0.2.1.2012.02.27"
 
-class RawData( object ):
-
-	def __init__( self, _input=None ):
-		if type( _input ) == RawData:
-			# copy the passed in object
-			self.data = deepcopy( _input.data )
-
-		elif type( _input ) == str:
-			# read the passed in file name
-			self.read( _input )
+# The layout of the header of the binary format written by RawData.writeBinary:
+# the magic string, format version, reserved, scan count, peak count, then the 
+# offsets of the scan table, the scan start and stop offsets, the m/z values, 
+# the intensity values and the JSON file metadata, and the length of the 
+# metadata. All values are little endian.
+_BINARY_MAGIC = b'PYMZLIB\x00'
+_BINARY_VERSION = 2
+_BINARY_HEADER = struct.Struct( '<8sII9Q' )
+# The key of the JSON file metadata of the binary format holding, for each
+# scan, the keys not stored in the ScanTable and the ScanTable keys the scan
+# does not have, if there are any.
+_BINARY_SCAN_KEYS = '_scanKeys'
 
-		else:
-			self.data = { 'scans' : [] }
+# The version of the scan dicts produced by the readers. Increase this when 
+# the readers change, so the snapshots kept by DataCache are not reused.
+_READER_VERSION = 1
 
-	def getScan( self, retentionTime ):
-		"""
-		Gets a scan from the data by retention time.
-		:Parameters:
-			retentionTime : float
-				A float indicating the retention time of the scan to retrieve. The scan
-				closest to that time is returned.
+# The layout of the header of the files written by MzIndex.write: the magic 
+# string, format version, reserved, peak count and scan count. The header is
+# followed by the m/z, intensity and scan position of each peak and the 
+# retention time and msLevel of each scan. All values are little endian.
+_MZINDEX_MAGIC = b'PYMZIDX\x00'
+_MZINDEX_VERSION = 1
+_MZINDEX_HEADER = struct.Struct( '<8sIIQQ' )
 
-		rtype: dict
-		return: A dict containing the scan points & metadata
-		"""
-		difference = 1048576
-		returnvalue = None
-		for scan in self.data[ 'scans' ]:
-			currentDifference = abs( scan[ 'retentionTime' ] - retentionTime )
-			if currentDifference < difference:
-				difference = currentDifference
-				returnvalue = scan
-		return returnvalue
-		
-	def __getitem__( self, value ):	
-		"""
-		Returns a list indicating the sic intensity for each scan in order. Only for
-		level 1 scans - other scans are omitted.
-		:Parameters:
-			value : slice
-				The m/z indices to retrieve intensity values between.
+# The scan keys of values recorded in the scan headers which are calculated 
+# from all of the peaks of a scan, and so no longer apply once peaks are removed.
+_HEADER_PEAK_KEYS = ( 'totIonCurrent', 'basePeakIntensity' )
 
-		rtype: list
-		return: A list of intensity values.
-		"""
-		returnvalue = []
-		if type( value ) == slice:
-			if ( value.start ):
-				start = value.start 
-			else:
-				start = 0
-			if ( value.stop ):
-				stop = value.stop 
-			else:
-				stop = 1048576
-			return self.sic( start, stop, 1 )
-		else:
-			return self.sic( value - 0.1, value + 0.1, 1 )
+# The keys of the scan dicts produced by the readers.
+_STANDARD_SCAN_KEYS = ( 'retentionTime', 'polarity', 'msLevel', 'id', 'mzRange',
+	'parentScan', 'precursorMz', 'collisionEnergy', 'totIonCurrent', 
+	'basePeakIntensity', 'mzArray', 'intensityArray' )
 
-	def __iter__( self ):
-		return iter( self.data['scans'] )
+# Set this to True to have the readers store the peak arrays of each scan
+# ('mzArray' and 'intensityArray') as numpy arrays instead of lists. The arrays
+# are read only views of the decoded data in its original type and byte order.
+# Has no effect if numpy is not installed.
+USE_NUMPY = False
 
-	def removeScans( self, minTime=0, maxTime=sys.maxint ):
-		"""
-		Discards all scans in the given time range.
+# Set this to a directory to have RawData.read keep a binary snapshot of each
+# file it parses there, and load the snapshot instead of parsing the file again
+# while the file is unchanged, see DataCache. Defaults to the value of the 
+# MZLIB_CACHE_DIR environment variable, or no caching. Requires numpy.
+CACHE_DIR = os.environ.get( 'MZLIB_CACHE_DIR' ) or None
+# The maximum total size of the snapshots in CACHE_DIR in bytes. The least
+# recently used snapshots are removed when it is exceeded.
+CACHE_SIZE = 2 * 1024 * 1024 * 1024
 
-		:Parameters:
-			minTime : float
-				The minimum retention time for the scans to remove
-			maxTime : float
-				The maximum retention time for the scans to remove
-		"""
-		if minTime < maxTime:
-			self.data[ 'scans' ] = [ scan for scan in self.data['scans'] if 
-						scan[ 'retentionTime' ] < minTime or 
-						scan[ 'retentionTime' ] >= maxTime ]
+# The number of results of tic, bpc, sic, minMz and maxMz each RawData object
+# remembers, see RawData.memoHits. Set to 0 to disable memoization.
+MEMO_SIZE = 16
 
-	def onlyScans( self, minTime=0, maxTime=sys.maxint ):
-		"""
-		Keeps only the scans specified in the time range, discarding all others.
+# The number of scans handed to a pool of worker processes at a time when
+# decoding peak data in parallel, and the number sent to each worker per task.
+DECODE_BATCH_SIZE = 512
+DECODE_CHUNK_SIZE = 16
 
-		:Parameters:
-			minTime : float
-				The minimum retention time for the scans to remove
-			maxTime : float
-				The maximum retention time for the scans to remove
-		"""
-		if minTime < maxTime:
-			self.data[ 'scans' ] = [ scan for scan in self.data['scans'] if 
-					scan[ 'retentionTime' ] >= minTime and
-					scan[ 'retentionTime' ] < maxTime ]
+def iterScans( filename, info=None, workers=None, lazy=False, **criteria ):
+	"""
+	Iterates over the scans in a file one at a time. For file types which
+	support it the file is parsed incrementally, so only a single scan is held
+	in memory at any time. The file type is detected from the file extension.
 
-	def removeMz( self,  mz, tolerance=0.1 ):
-		"""
-		Discards all data points with the specified m/z +/- the specified tolerance
+	:Parameters:
+		filename : str
+			The name of the file to read.
+		info : dict
+			An optional dict which will be filled in with file level metadata, such
+			as 'sourceFile', as it is encountered.
+		workers : int
+			The number of worker processes to decode the peak data with, or a
+			multiprocessing Pool or ThreadPool to use. Defaults to decoding in 
+			this process. Only used for the xml formats.
+		lazy : bool
+			If True, the peak data of each scan is only decoded when its 'mzArray'
+			or 'intensityArray' is first accessed, see LazyScan. Only used for the
+			xml formats. Defaults to False.
+		criteria : keywords
+			Optional selection criteria: minTime and maxTime, the retention time 
+			range of the scans to read (maxTime is exclusive); level, the msLevel 
+			of the scans; polarity, 1 or -1; and minMz and maxMz, the m/z range of 
+			the peaks to keep (maxMz is exclusive). Scans which do not match are 
+			skipped before their peak data is decoded, see _selectScans.
 
-		:Parameters:
-			mz : float
-				The m/z value of the mass to be removed from all scans.
-			tolerance : float
-				The tolerance to use for determining if the data point should be removed.
-				Defaults to 0.1.
-		"""
-		for scan in self.data[ 'scans' ]:
-			try:
-				scan[ 'mzArray' ], scan[ 'intensityArray' ] = list( zip( 
-							*[ point for point in zip( scan[ 'mzArray' ], scan[ 'intensityArray' ]) 
-							if point[ 0 ] < mz - tolerance or
-							point[ 0 ] >= mz + tolerance ]))
-			except ValueError:
-				scan[ 'mzArray' ] = []
-				scan[ 'intensityArray' ] = []
+	rtype: generator
+	return: A generator yielding one scan dict at a time, in file order.
+	"""
+	lowerName = filename.lower( )
+	if lowerName.endswith( ".mzxml" ):
+		return iterMzXml( filename, info, workers, lazy, **criteria )
 
-	def onlyMz( self, mz, tolerance=0.1 ):
-		"""
-		Keeps only data points with the specified m/z +/- the specified tolerance,
-		discarding all others.
+	elif ( lowerName.endswith( ".mzdata" ) or lowerName.endswith( ".mzdata.xml" ) or
+	       lowerName.endswith( ".mzdata.gz" ) or 
+	       lowerName.endswith( ".mzdata.xml.gz" )):
+		return iterMzData( filename, info, workers, lazy, **criteria )
 
-		:Parameters:
-			mz : float
-				The m/z value of the mass to be retained from all scans.
-			tolerance : float
-				The tolerance to use for determining if the data point should be removed.
-				Defaults to 0.1.
-		"""
-		for scan in self.data[ 'scans' ]:
-			try:
-				scan[ 'mzArray' ], scan[ 'intensityArray' ] = list( zip( 
-							*[ point for point in zip( scan[ 'mzArray' ], scan[ 'intensityArray' ]) 
-							if point[ 0 ] >= mz - tolerance and
-							point[ 0 ] < mz + tolerance ]))
-			except ValueError:
-				scan[ 'mzArray' ] = []
-				scan[ 'intensityArray' ] = []
+	elif lowerName.endswith( ".mzml" ):
+		return iterMzMl( filename, info, workers, lazy, **criteria )
 
-	def sic( self, start=0, stop=1048576, level=1 ):
-		"""
-		Returns a list indicating the selected intensity for each scan in order. 
-		:Parameters:
-			start : float
-				The m/z indices to retrieve intensity values higher than or equal to.
-			stop : float
-				The m/z indecies to retrieve intensity values less than.
-			level : int
-				The msLevel of the scans to get intensity values for. A value of 0 
-				uses all scans.
+	elif lowerName.endswith( ".csv" ) or lowerName.endswith( ".csv.gz" ):
+		return iterCsv( filename, info, **criteria )
 
-		rtype: list
-		return: A list of intensity values.
-		"""
-		returnvalue = []
-		for scan in self.data[ 'scans' ]:
-			if not level or ( scan[ 'msLevel' ] == level ):
-				returnvalue.append( sum([ int_ for mz,int_ in 
-				      zip( scan[ 'mzArray' ], scan[ 'intensityArray' ])
-							if mz >= start and mz < stop ]))
-		return returnvalue
+	# else fall back to reading the whole file
+	rawData = RawData( )
+	rawData.read( filename, **criteria )
+	if info is not None and 'sourceFile' in rawData.data:
+		info[ 'sourceFile' ] = rawData.data[ 'sourceFile' ]
+	return iter( rawData )
 
-	def tic( self, level=1 ):
-		"""
-		Returns a list indicating the total intensity for each scan in order. 
-		:Parameters:
-			level : int
-				The msLevel of the scans to get intensity values for. A value of 0 
-				uses all scans.
+def headerChromatogram( filename, level=1, basePeak=False, **criteria ):
+	"""
+	Reads the total ion current or base peak chromatogram of a file from the 
+	values recorded in the scan headers ('totIonCurrent' and 'basePeakIntensity'
+	in mzXML, MS:1000285 and MS:1000505 in mzML), without decoding the peak data.
+	The peak data is only decoded for scans without the value. For other file 
+	types the file is read and the chromatogram computed from the peaks.
 
-		rtype: list
-		return: A list of intensity values.
-		"""
-		return [ sum( scan[ 'intensityArray' ]) for scan in self.data[ 'scans' ]
-		         if ( not level or ( scan[ 'msLevel' ] == level ))]
+	:Parameters:
+		filename : str
+			The name of the file to read.
+		level : int
+			The msLevel of the scans to use. A value of 0 uses all scans. Defaults
+			to 1.
+		basePeak : bool
+			If True, read the base peak chromatogram, otherwise the total ion
+			current. Defaults to False.
+		criteria : keywords
+			Optional selection criteria, see iterScans. minMz and maxMz are not
+			supported, as the header values cover the whole scan.
 
-	def bpc( self, level=1 ):
-		"""
-		Returns a list indicating the base intensity for each scan in order. 
-		:Parameters:
-			level : int
-				The msLevel of the scans to get intensity values for. A value of 0
-				uses all scans
+	rtype: tuple
+	return: A 2 element tuple ( retentionTimes, intensities ) of lists.
+	"""
+	if 'minMz' in criteria or 'maxMz' in criteria:
+		raise ValueError( "The header values cannot be restricted to an m/z range" )
+	if level:
+		criteria[ 'level' ] = level
+	lowerName = filename.lower( )
+	if lowerName.endswith( ".mzxml" ):
+		scans = _iterMzXml( filename, { })
+	elif lowerName.endswith( ".mzml" ):
+		scans = _iterMzMl( filename, { })
+	else:
+		rawData = RawData( )
+		rawData.read( filename, **criteria )
+		if basePeak:
+			intensities = rawData.bpc( 0 )
+		else:
+			intensities = rawData.tic( 0 )
+		return [ scan[ 'retentionTime' ] for scan in rawData ], intensities
 
-		rtype: list
-		return: A list of intensity values.
-		"""
-		try: 
-			return [ self.max_( scan[ 'intensityArray' ]) 
-			         for scan in self.data[ 'scans' ] 
-							 if ( not level or ( scan[ 'msLevel' ] == level ))]
-		except ValueError:
-			return 0;
+	if basePeak:
+		key = 'basePeakIntensity'
+	else:
+		key = 'totIonCurrent'
+	retentionTimes = [ ]
+	intensities = [ ]
+	for scan, payload in _selectScans( scans, **criteria ):
+		value = scan.get( key )
+		if value is None:
+			intensityArray = _decodePeaks( payload )[ 1 ]
+			if basePeak:
+				value = len( intensityArray ) and max( intensityArray ) or 0
+			else:
+				value = sum( intensityArray )
+		retentionTimes.append( scan[ 'retentionTime' ])
+		intensities.append( value )
+	return retentionTimes, intensities
 
-	def minMz( self ):
-		"""
-		Returns the minimum mz value in the data.
+def iterMzXml( filename, info=None, workers=None, lazy=False, **criteria ):
+	"""
+	Iterates over the scans in an mzXML file one at a time. Each <scan> element
+	is discarded as soon as it has been decoded, so memory use does not depend
+	on the size of the file.
 
-		rtype: float
-		return: A float containing the min mz in the data.
-		"""
-		return min([ x[ 'mzRange' ][ 0 ] for x in self.data[ 'scans' ]])
+	:Parameters:
+		filename : str
+			The name of the file to read.
+		info : dict
+			An optional dict which will be filled in with file level metadata, such
+			as 'sourceFile', as it is encountered.
+		workers : int
+			The number of worker processes to decode the peak data with, or a
+			multiprocessing Pool or ThreadPool to use. Defaults to decoding in 
+			this process.
+		lazy : bool
+			If True, the peak data of each scan is only decoded when its 'mzArray'
+			or 'intensityArray' is first accessed, see LazyScan. Defaults to False.
+		criteria : keywords
+			Optional selection criteria, see iterScans. Scans which do not match 
+			are skipped before their peak data is decoded.
 
-	def maxMz( self ):
-		"""
-		Returns the maximum mz value in the data.
+	rtype: generator
+	return: A generator yielding one scan dict at a time, in file order.
+	"""
+	if info is None:
+		info = { }
+	return _decodeScans( _selectScans( _iterMzXml( filename, info ), **criteria ), 
+		workers, lazy, criteria.get( 'minMz' ), criteria.get( 'maxMz' ))
 
-		rtype: float
-		return: A float containing the max mz in the data.
-		"""
-		return ( max([ x[ 'mzRange' ][ 1 ] for x in self.data[ 'scans' ]]))
+def _iterMzXml( filename, info ):
+	"""
+	Internal function. Iterates over the scans in an mzXML file without decoding
+	their peak data, see iterMzXml.
 
+	rtype: generator
+	return: A generator yielding a 2 element tuple ( scan, payload ) for each 
+		scan, see _decodePeaks.
+	"""
+	# the currently open elements, outermost first
+	elements = [ ]
+	for event, elem in ElementTree.iterparse( filename, ( 'start', 'end' )):
+		if event == 'start':
+			elements.append( elem )
+			continue
 
-	def max_( self, sequence ):
-		if len( sequence ):
-			return max( sequence )
-		else:
-			return 0;
+		elements.pop( )
+		tag = _localName( elem.tag )
+		if tag == 'peaks':
+			# everything we need from the enclosing scan precedes <peaks>, so the
+			# scan can be decoded now, ahead of any scans nested inside it.
+			parentScan = None
+			for ancestor in reversed( elements[ :-1 ]):
+				if _localName( ancestor.tag ) == 'scan':
+					parentScan = int( ancestor.get( 'num' ))
+					break
+			yield _mzXmlScan( elements[ -1 ], elem, parentScan )
+			elem.clear( )
 
+		elif tag == 'scan' or tag == 'offset':
+			if elements:
+				elements[ -1 ].remove( elem )
+			elem.clear( )
 
-	def read( self, filename ):
-		"""
-		Load a file into this reference. This method will automatically detect the
-		file type based on the file extension.
+		elif tag == 'parentFile' and not 'sourceFile' in info:
+			info[ 'sourceFile' ] = elem.get( 'fileName' )
 
-		:Parameters:
-			filename : str
-				The name of the file to load.
+def writeMzXml( filename, scans, sourceFile=None, precision=64, 
+                compressionLevel=6, count=None ):
+	"""
+	Writes scans in indexed mzXML 3.0 format. The scans are written one at a 
+	time as they are produced, so scans can be streamed from one of the 
+	readers, such as iterScans, without holding the whole run in memory. The 
+	byte offset of each scan is recorded as it is written, and the file ends 
+	with the <index>, <indexOffset> and <sha1> elements, so it can be read with 
+	IndexedMzXml. Nested scans are written flat, with the parent scan given by
+	the precursorScanNum attribute of <precursorMz>.
 
-		"""
-	
-		if not os.path.exists( filename ):
-			raise IOError( "The file %s does not exist or is not readable" % filename )
+	:Parameters:
+		filename : str
+			The name of the file to write to.
+		scans : iterable
+			The scans to write.
+		sourceFile : str
+			The name of the file the data came from, for the <parentFile> element.
+		precision : int
+			The precision of the peak data written, 32 or 64. Defaults to 64.
+		compressionLevel : int
+			The zlib compression level to compress the peak data with - 1 for 
+			least compression, 9 for most, or 0 to write it uncompressed. Defaults
+			to 6.
+		count : int
+			The number of scans, for the scanCount attribute. Defaults to 
+			len( scans ), or leaving the attribute out if that is not available.
 
-		if filename.lower( ).endswith( ".csv" ):
-			return self.readCsv( filename )
+	rtype: bool
+	return: True if the write succeeded
+	"""
+	if precision == 32:
+		dataType = 'f'
+	elif precision == 64:
+		dataType = 'd'
+	else:
+		raise ValueError( "precision must be 32 or 64" )
+	if count is None and hasattr( scans, '__len__' ):
+		count = len( scans )
+	out = _TrackingWriter( open( filename, 'wb', 1 << 20 ))
+	try:
+		out.write( '<?xml version="1.0" encoding="ISO-8859-1"?>\n' )
+		out.write( '<mzXML\n' )
+		out.write( ' xmlns="http://sashimi.sourceforge.net/schema_revision/mzXML_3.0"\n' )
+		out.write( ' xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"\n' )
+		out.write( ' xsi:schemaLocation="'
+			'http://sashimi.sourceforge.net/schema_revision/mzXML_3.0 '
+			'http://sashimi.sourceforge.net/schema_revision/mzXML_3.0/mzXML_idx_3.0.xsd">\n' )
+		if count is None:
+			out.write( ' <msRun>\n' )
+		else:
+			out.write( ' <msRun scanCount="%d">\n' % count )
+		if sourceFile is not None:
+			out.write( '  <parentFile fileName="%s" fileType="RAWData"/>\n' % 
+				escape( sourceFile, { '"' : '&quot;' }))
+		out.write( '  <dataProcessing>\n' )
+		out.write( '    <software type="conversion" name="pymzlib" version="%s"/>\n' % 
+			VERSION )
+		out.write( '  </dataProcessing>\n' )
 
-		elif filename.lower( ).endswith( ".mzdata" ) or filename.endswith(  ".mzdata.xml" ):
-			return self.readMzData( filename )
+		offsets = [ ]
+		for scan in scans:
+			offsets.append(( scan[ 'id' ], out.offset + 2 ))
+			out.write( _mzXmlScanElement( scan, dataType, compressionLevel ))
+		out.write( ' </msRun>\n' )
 
-		elif filename.lower( ).endswith( ".mzxml" ):
-			return self.readMzXml( filename )
+		indexOffset = out.offset + 1
+		out.write( ' <index name="scan">\n' )
+		for scanId, offset in offsets:
+			out.write( '  <offset id="%d">%d</offset>\n' % ( scanId, offset ))
+		out.write( ' </index>\n' )
+		out.write( ' <indexOffset>%d</indexOffset>\n' % indexOffset )
+		# the checksum covers the file up to and including the opening tag
+		out.write( ' <sha1>' )
+		out.write( '%s</sha1>\n' % out.hexdigest( ))
+		out.write( '</mzXML>\n' )
+	finally:
+		out.close( )
+	return True
 
-		elif filename.lower( ).endswith( ".mzml" ):
-			return self.readMzMl( filename )
+def _mzXmlScanElement( scan, dataType, compressionLevel ):
+	"""
+	Internal function. Formats a scan as an mzXML <scan> element.
 
-		elif filename.lower( ).endswith( ".json" ):
-			return self.readJson( filename )
+	:Parameters:
+		scan : dict
+			The scan to format.
+		dataType : str
+			The struct format character to write the peak data with, 'f' or 'd'.
+		compressionLevel : int
+			The zlib compression level for the peak data, 0 for none.
 
-		elif filename.lower( ).endswith( ".json.gz" ):
-			return self.readJsonGz( filename )
+	rtype: str
+	return: The <scan> element, indented by 2 spaces.
+	"""
+	mzArray, intensityArray = scan[ 'mzArray' ], scan[ 'intensityArray' ]
+	attributes = [ 
+		'num="%d"' % scan[ 'id' ],
+		'msLevel="%d"' % scan[ 'msLevel' ],
+		'peaksCount="%d"' % len( mzArray )]
+	if scan[ 'polarity' ] is None:
+		pass
+	elif scan[ 'polarity' ] > 0:
+		attributes.append( 'polarity="+"' )
+	else:
+		attributes.append( 'polarity="-"' )
+	if scan[ 'retentionTime' ] is not None:
+		attributes.append( 'retentionTime="PT%sS"' % 
+			_formatFloat( scan[ 'retentionTime' ] * 60 ))
+	if scan[ 'msLevel' ] > 1 and scan.get( 'collisionEnergy' ) is not None:
+		attributes.append( 'collisionEnergy="%s"' % _formatFloat( scan[ 'collisionEnergy' ]))
+	lowMz, highMz = scan[ 'mzRange' ]
+	if lowMz is not None:
+		attributes.append( 'lowMz="%s"' % _formatFloat( lowMz ))
+	if highMz is not None:
+		attributes.append( 'highMz="%s"' % _formatFloat( highMz ))
+	# computed from the peaks, since the recorded values are stale if peaks
+	# have been removed
+	totIonCurrent, basePeakIntensity = _peakTotals( intensityArray )
+	attributes.append( 'basePeakIntensity="%s"' % _formatFloat( basePeakIntensity ))
+	attributes.append( 'totIonCurrent="%s"' % _formatFloat( totIonCurrent ))
 
+	element = [ '  <scan %s>\n' % '\n        '.join( attributes )]
+	if scan[ 'msLevel' ] > 1 and scan.get( 'precursorMz' ) is not None:
+		if scan.get( 'parentScan' ) is not None:
+			element.append( '    <precursorMz precursorScanNum="%d">%s</precursorMz>\n' %
+				( scan[ 'parentScan' ], _formatFloat( scan[ 'precursorMz' ])))
 		else:
-			sys.stderr.write( "Unrecognized file type for %s\n" % filename )
-			return False
-
-	def readCsv( self, filename ):
-		"""
-		Read a file in Agilent csv format. 
-
-		:Parameters:
-			filename : str
-				The name of the file to load.
-
-		"""
-		self.data = { "scans" : [] }
-		try:
-			f = open( filename, 'r' )
-			lines = f.readlines( )
-			f.close( )
-		except IOError:
-			sys.stderr.write( "Error: unable to read file '%s'\n" % filename )
-			return False
-
-		i = 0
-		while( i < len( lines ) and lines[ i ][ :10 ] != "file name," ):
-			i+= 1
-		self.data[ 'sourceFile' ] = lines[ i ].split( ',' )[ 1 ]
-		while ( i < len( lines ) and lines[ i ][ :9 ] != "[spectra]" ):
-			i+=1
-		i+=1
+			element.append( '    <precursorMz>%s</precursorMz>\n' % 
+				_formatFloat( scan[ 'precursorMz' ]))
+	if len( mzArray ):
+		peaks = _encodeArray( _interleave( mzArray, intensityArray ), 
+			compressionLevel, dataType, '>' )
+	else:
+		peaks = ''
+	if compressionLevel:
+		compression = 'compressionType="zlib" compressedLen="%d"' % ( 
+			len( peaks ) // 4 * 3 - peaks[ -2: ].count( '=' ))
+	else:
+		compression = 'compressionType="none"'
+	element.append( '    <peaks precision="%d" byteOrder="network" '
+		'contentType="m/z-int" %s>%s</peaks>\n' % ( 
+		struct.calcsize( dataType ) * 8, compression, peaks ))
+	element.append( '  </scan>\n' )
+	return ''.join( element )
 
-		if ( i > len( lines ) ):
-			sys.stderr.write( "Unable to parse the reference file '%s'\n" % filename ) 
-			return False
-
-		scanId = 0
-		for line in lines[ i: ]:
-			scanId += 1
-			values = line.split( ',' )
-			if values[ 4 ] == '-':
-				polarity = -1
-			else:
-				polarity = 1
-			rt = float( values[ 0 ])
-			count = float( values[ 6 ])
-			intensityValues = [  float( x )  for x in values[ 8:-1:2 ] ]
-			massValues = [ float( y ) for y in values[ 7:-1:2 ] ]
-
-			self.data[ "scans" ].append({ 
-				"retentionTime" : rt,
-				"polarity" : polarity, 
-				"msLevel" : 1,
-				"id" : scanId,
-				"mzRange" : [ min( massValues ), max( massValues ) ],
-				"parentScan" : None,
-				"precursorMz" : None,
-				"collisionEnergy" : None,
-				"mzArray" : massValues,
-				"intensityArray" : intensityValues
-			})
-		return True
+def iterMzData( filename, info=None, workers=None, lazy=False, **criteria ):
+	"""
+	Iterates over the scans in an mzData file one at a time. The peak data is
+	taken directly from the text of each <data> element as it is parsed, and
+	each <spectrum> element is discarded as soon as it has been decoded.
 
-	def readMzData( self, filename ):
-		"""
-		Read a file in mzData format. 
+	:Parameters:
+		filename : str
+			The name of the file to read.
+		info : dict
+			An optional dict which will be filled in with file level metadata, such
+			as 'sourceFile', as it is encountered.
+		workers : int
+			The number of worker processes to decode the peak data with, or a
+			multiprocessing Pool or ThreadPool to use. Defaults to decoding in 
+			this process.
+		lazy : bool
+			If True, the peak data of each scan is only decoded when its 'mzArray'
+			or 'intensityArray' is first accessed, see LazyScan. Defaults to False.
+		criteria : keywords
+			Optional selection criteria, see iterScans. Scans which do not match 
+			are skipped before their peak data is decoded.
 
-		:Parameters:
-			filename : str
-				The name of the file to load.
+	rtype: generator
+	return: A generator yielding one scan dict at a time, in file order.
+	"""
+	if info is None:
+		info = { }
+	return _decodeScans( _selectScans( _iterMzData( filename, info ), **criteria ), 
+		workers, lazy, criteria.get( 'minMz' ), criteria.get( 'maxMz' ))
 
-		"""
-		self.data = { "scans" : [] }
-		dataFile = parse( filename )
-		sourceFileNode = dataFile.getElementsByTagName( 'sourceFile' )[ 0 ].\
-			getElementsByTagName( 'nameOfFile' )[ 0 ]
-		self.data[ 'sourceFile' ] = re.sub( "<.*?>", "", sourceFileNode.toxml( ))
-		scans = dataFile.getElementsByTagName( 'spectrum' )
+def _iterMzData( filename, info ):
+	"""
+	Internal function. Iterates over the scans in an mzData file without 
+	decoding their peak data, see iterMzData.
 
-		for scan in scans:
-			parentScan = None
-			precursorMz = None
-			collisionEnergy = None
-			scanId = int( scan.getAttribute( 'id' ))
-			spectrumInstrument = scan.getElementsByTagName( 'spectrumInstrument' )[ 0 ]
-			msLevel = int( spectrumInstrument.getAttribute( 'msLevel' ))
-			lowMz = float( spectrumInstrument.getAttribute( 'mzRangeStart' ))
-			highMz = float( spectrumInstrument.getAttribute( 'mzRangeStop' ))
-			params = spectrumInstrument.getElementsByTagName( 'cvParam' )
-			for param in params:
-				if param.getAttribute( 'name' ) == 'Polarity':
-					if param.getAttribute( 'value' ) == 'positive':
-						polarity = 1
-					else:
-						polarity = -1
-				if param.getAttribute( 'name' ) == 'TimeInMinutes':
-					rt = float( param.getAttribute( 'value' ))
-
-			
-			massValues = self._unpackMzData( 
-				scan.getElementsByTagName( 'mzArrayBinary' )[ 0 ].getElementsByTagName( 'data' )[ 0 ])
-			intensityValues = self._unpackMzData( 
-				scan.getElementsByTagName( 'intenArrayBinary' )[ 0 ].getElementsByTagName( 'data' )[ 0 ])
-
-			precursors = scan.getElementsByTagName( 'precursor' )
-			for precursor in precursors[ 0:1 ]:
-				parentScan = int( precursor.getAttribute( 'spectrumRef' ))
-				cvParams = precursor.getElementsByTagName( 'cvParam' )
-				for param in cvParams:
-					if param.getAttribute( 'name' ) == 'MassToChargeRatio':
-						precursorMz = float( param.getAttribute( 'value' ))
-#					if param.getAttribute( 'name' ) == 'ChargeState':
-#						chargeState = int( param.getAttribute( 'value' ))
-					if param.getAttribute( 'name' ) == 'CollisionEnergy':
-						collisionEnergy = float( param.getAttribute( 'value' ))
-
-
-
-			self.data[ "scans" ].append({ 
-				"retentionTime" : rt,
-				"polarity" : polarity, 
-				"msLevel" : msLevel, 
-				"id" : scanId,
-				"mzRange" : [ lowMz, highMz ],
-				"parentScan" : parentScan,
-				"precursorMz" : precursorMz,
-				"collisionEnergy" : collisionEnergy,
-				"mzArray" : list( massValues ),
-				"intensityArray" : list( intensityValues )
-			})
+	rtype: generator
+	return: A generator yielding a 2 element tuple ( scan, payload ) for each 
+		scan, see _decodePeaks.
+	"""
+	source = filename
+	if filename.lower( ).endswith( ".gz" ):
+		source = gzip.open( filename, 'rb' )
+	try:
+		# the currently open elements, outermost first
+		elements = [ ]
+		for event, elem in ElementTree.iterparse( source, ( 'start', 'end' )):
+			if event == 'start':
+				elements.append( elem )
+				continue
 
-		return True
+			elements.pop( )
+			if elem.tag == 'spectrum':
+				yield _mzDataScan( elem )
+				elements[ -1 ].remove( elem )
+				elem.clear( )
 
+			elif elem.tag == 'nameOfFile' and not 'sourceFile' in info:
+				info[ 'sourceFile' ] = elem.text or ''
+	finally:
+		if source is not filename:
+			source.close( )
 
-	def _unpackMzData( self, dataNode ):
-		"""
-		Internal function. Unpacks the scan data contained in a <data> node in mzdata 
-		format.
+def _mzDataScan( spectrum ):
+	"""
+	Internal function. Converts an mzData <spectrum> element into a scan dict.
 
-		:Parameters:
-			dataNode : xmlNode
-				The xml node containing the scan data to be unpacked.
+	:Parameters:
+		spectrum : Element
+			The <spectrum> element to convert.
 
-		"""
-		scanSize = int( dataNode.getAttribute( 'length' ))
-		if not scanSize:
-			return []
-		# else
-		if dataNode.getAttribute( 'endian' ) == 'little':
-			byteOrder = '<'
-		else:
-			byteOrder = '>'
-		if dataNode.getAttribute( 'precision' ) == '64':
-			dataType = 'd'
-		else: 
-			dataType = 'f'
+	rtype: tuple
+	return: A 2 element tuple ( scan, payload ) containing a dict of the scan 
+		metadata and the undecoded peak data, see _decodePeaks.
+	"""
+	parentScan = None
+	precursorMz = None
+	collisionEnergy = None
+	polarity = None
+	rt = None
+	scanId = int( spectrum.get( 'id' ))
+	spectrumInstrument = spectrum.find( './/spectrumInstrument' )
+	msLevel = int( spectrumInstrument.get( 'msLevel' ))
+	lowMz = highMz = None
+	if spectrumInstrument.get( 'mzRangeStart' ):
+		lowMz = float( spectrumInstrument.get( 'mzRangeStart' ))
+	if spectrumInstrument.get( 'mzRangeStop' ):
+		highMz = float( spectrumInstrument.get( 'mzRangeStop' ))
+	for param in spectrumInstrument.findall( 'cvParam' ):
+		if param.get( 'name' ) == 'Polarity':
+			if param.get( 'value' ) == 'positive':
+				polarity = 1
+			else:
+				polarity = -1
+		if param.get( 'name' ) == 'TimeInMinutes':
+			rt = float( param.get( 'value' ))
 
-		return struct.unpack( byteOrder + ( dataType * scanSize ), 
-			b64decode( re.sub( "<.*?>", "", dataNode.toxml( ))))
+	payload = ( _mzDataArray( spectrum.find( 'mzArrayBinary/data' )),
+	            _mzDataArray( spectrum.find( 'intenArrayBinary/data' )))
 
-	def readMzXml( self, filename ):
-		"""
-		Read a file in mzXML format.
+	precursor = spectrum.find( './/precursor' )
+	if precursor is not None:
+		if precursor.get( 'spectrumRef' ):
+			parentScan = int( precursor.get( 'spectrumRef' ))
+		for param in precursor.findall( './/cvParam' ):
+			if param.get( 'name' ) == 'MassToChargeRatio':
+				precursorMz = float( param.get( 'value' ))
+#			if param.get( 'name' ) == 'ChargeState':
+#				chargeState = int( param.get( 'value' ))
+			if param.get( 'name' ) == 'CollisionEnergy':
+				collisionEnergy = float( param.get( 'value' ))
 
-		:Parameters:
-			filename : str
-				The name of the file to load.
+	return { 
+		"retentionTime" : rt,
+		"polarity" : polarity, 
+		"msLevel" : msLevel, 
+		"id" : scanId,
+		"mzRange" : [ lowMz, highMz ],
+		"parentScan" : parentScan,
+		"precursorMz" : precursorMz,
+		"collisionEnergy" : collisionEnergy
+	}, payload
 
-		"""
-		self.data = { "scans" : [] }
-		dataFile = parse( filename )
-		self.data[ 'sourceFile' ] = dataFile.getElementsByTagName( 'parentFile' )[ 0 ].\
-			getAttribute( 'fileName' )
-		scans = dataFile.getElementsByTagName( 'scan' )
-		for scan in scans:
-			collisionEnergy = None
-			precursorMz = None
-			msLevel = int( scan.getAttribute( "msLevel" ))
-			scanSize = int( scan.getAttribute( 'peaksCount' ))
-			rt = float( scan.getAttribute( 'retentionTime' )[ 2:-1 ] ) / 60
-			scanId = int( scan.getAttribute( 'num' ))
-			lowMz = float( scan.getAttribute( 'lowMz' ))
-			highMz = float( scan.getAttribute( 'highMz' ))
-			if ( scan.getAttribute( 'polarity' ) == '+' ):
-				polarity = 1
-			else:
-				polarity = -1
-			if msLevel == 1:
-				parentScan = None
-			else:
-				parentScan = int( scan.parentNode.getAttribute( 'num' ))
-				if ( scan.getAttribute( 'collisionEnergy' )):
-					collisionEnergy = float( scan.getAttribute( 'collisionEnergy' ))
-				precursorTags = scan.getElementsByTagName( 'precursorMz' )
-				if ( len( precursorTags )):
-					precursorMz = float( re.sub( r"<.*?>", "", precursorTags[ 0 ].toxml( )).strip( ))
-			
-
-			peaks = scan.firstChild
-			while not ( peaks.nodeType == peaks.ELEMENT_NODE and peaks.tagName == 'peaks' ):
-				peaks = peaks.nextSibling
-
-			if peaks.getAttribute( 'precision' ) == '64':
-				type = 'd'
-			else: 
-				type='f'
-			byteOrder = '>'
-
-			# get all of the text (non-tag) content of peaks
-			packedData = re.sub( r"<.*?>", "", peaks.toxml( )).strip( )
-			if not scanSize:
-				massValues = []
-				intensityValues = []
-			else:
-				if ( peaks.getAttribute( 'compressionType' ) == 'zlib' ):
-					data = struct.unpack( byteOrder + ( type * scanSize * 2 ), zlib.decompress( b64decode( packedData )))
-				else:
-					data = struct.unpack( byteOrder + ( type * scanSize * 2 ), b64decode( packedData ))
-				massValues = data[ 0::2 ]
-				intensityValues = data[ 1::2 ] 
-
-			self.data[ "scans" ].append({ 
-				"retentionTime" : rt,
-				"polarity" : polarity, 
-				"msLevel" : msLevel, 
-				"id" : scanId,
-				"mzRange" : [ lowMz, highMz ],
-				"parentScan" : parentScan,
-				"precursorMz" : precursorMz,
-				"collisionEnergy" : collisionEnergy,
-				"mzArray" : list( massValues ),
-				"intensityArray" : list( intensityValues )
-			})
-		return True
+def _mzDataArray( data ):
+	"""
+	Internal function. Describes the scan data contained in a <data> element in
+	mzData format so it can be decoded by _decodeArray.
 
+	:Parameters:
+		data : Element
+			The <data> element containing the scan data.
 
-	def readMzMl( self, filename ):
-		raise NotImplementedError( 
-			"Reading from this file type has not yet been implemented." )
-		
+	rtype: tuple
+	return: The arguments to _decodeArray for the data.
+	"""
+	scanSize = int( data.get( 'length' ))
+	if not scanSize:
+		return ( None, False, 'd', '<', 0 )
+	# else
+	if data.get( 'endian' ) == 'little':
+		byteOrder = '<'
+	else:
+		byteOrder = '>'
+	if data.get( 'precision' ) == '64':
+		dataType = 'd'
+	else: 
+		dataType = 'f'
 
-	def _getChildNode( self, node, child ):
-		"""
-		Internal function. Finds the child node of the passed in xml node with the 
-		given tag name.
+	return ( data.text, False, dataType, byteOrder, scanSize )
 
-		:Parameters:
-			node : minidom node
-				A minidom node object
-			child : str
-				A string containing the tag name of the child node to return.
+def writeMzData( filename, scans, intensityPrecision=64, count=None, 
+                 compressionLevel=6 ):
+	"""
+	Writes scans in mzData format. The scans are written one at a time as they
+	are produced, so scans can be streamed from one of the readers, such as 
+	iterScans, without holding the whole run in memory. The peak arrays are 
+	encoded directly from their typed values, see _encodeArray.
 
-		rtype: minidom node
-		return: The requested child of the minidom node.
-		"""
-		returnvalue = node.firstChild
-		while returnvalue and not ( 
-			returnvalue.nodeType == returnvalue.ELEMENT_NODE and 
-			returnvalue.tagName == child ):
+	:Parameters:
+		filename : str
+			The name of the file to write to. If it ends with .gz the output is
+			compressed with gzip.
+		scans : iterable
+			The scans to write.
+		intensityPrecision : int
+			The precision of the intensity values written, 32 or 64. The m/z 
+			values are always written with 64 bit precision. Defaults to 64.
+		count : int
+			The number of scans, for the spectrumList count attribute. Defaults to
+			len( scans ). If neither is available the count is filled in once all
+			scans have been written.
+		compressionLevel : int
+			The gzip compression level to use for .gz files - 0 for least 
+			compression, 9 for most. Defaults to 6.
 
-			returnvalue = returnvalue.nextSibling
-		return returnvalue
+	rtype: bool
+	return: True if the write succeeded
+	"""
+	if intensityPrecision == 32:
+		intensityType = 'f'
+	elif intensityPrecision == 64:
+		intensityType = 'd'
+	else:
+		raise ValueError( "intensityPrecision must be 32 or 64" )
+	if count is None and hasattr( scans, '__len__' ):
+		count = len( scans )
 
-	def readJson( self, filename ):
-		"""
-		Reads ms data from a file containing gzipped JSON data. No checks are done, 
-		so make sure the data is of the same format as that produced by this 
-		library, otherwise, unpredictable things may happen. This method may not be
-		supported on versions of python prior to 2.5.
-		:Parameters:
-			filename : string
-				The name of a file containing gzip compressed JSON data
-		"""
-		if not json:
-			raise NotImplementedError( "This method is not supported in your version of Python" )
-		in_ = open( filename, 'r' )
-		self.data = json.load( in_ )
-		in_.close( )
-		return True
-
-	def readJsonGz( self, filename ):
-		"""
-		Reads ms data from a file containing gzipped JSON data. No checks are done, 
-		so make sure the data is of the same format as that produced by this 
-		library, otherwise, unpredictable things may happen. This method may not be
-		supported on versions of python prior to 2.5.
-		:Parameters:
-			filename : string
-				The name of a file containing gzip compressed JSON data
-		"""
-		if not json:
-			raise NotImplementedError( "This method is not supported in your version of Python" )
-		in_ = gzip.open( filename, 'r' )
-		self.data = json.load( in_ )
-		in_.close( )
-		return True
-
-	def write( self, filename ):
-		"""
-		Load a file into this reference. This method will automatically detect the
-		file type based on the file extension.
-
-		:Parameters:
-			filename : str
-				The name of the file to load.
-
-		"""
-	
-		if filename.lower( ).endswith( ".csv" ):
-			return self.writeCsv( filename )
-
-		elif ( filename.lower( ).endswith( ".mzdata" ) or 
-		       filename.lower( ).endswith(  ".mzdata.xml" )):
-			return self.writeMzData( filename )
-
-		elif filename.lower( ).endswith( ".mzxml" ):
-			return self.writeMzXml( filename )
-
-		elif filename.lower( ).endswith( ".mzml" ):
-			return self.writeMzMl( filename )
-
-		elif filename.lower( ).endswith( ".json" ):
-			return self.writeJson( filename )
-
-		elif filename.lower( ).endswith( ".json.gz" ):
-			return self.writeJsonGz( filename )
-
-		else:
-			sys.stderr.write( "Unrecognized file type for %s\n" % filename )
-			return False
-
-	def writeCsv( self, filename ):
-		"""
-		:Parameters:
-			filename : string
-				The name of the file to write to.
-
-		rtype: bool
-		return: True if the write succeeded
-		"""
-		out = open( filename, 'w' )
-		out.write( "[data source]\n" )
-		out.write( "file name,%s\n" % self.data[ 'sourceFile' ] )
-		out.write( "[filters]\n" )
-		out.write( "mass range,%f,%f\n" % ( self.minMz( ), self.maxMz( )))
-		rtList = [ x['retentionTime']  for x in self.data['scans']]
-		out.write( "time range,%f,%f\n" % ( min( rtList ), max( rtList )))
-		out.write( "number of spectra,%d\n" % len( self.data['scans'] ))
-		out.write( "[format]\n" )
-		out.write( "retention time, sample, period, experiment, polarity, scan type, points, x1, y1, x2, y2, ...\n" )
-		out.write( "[spectra]\n" )
-		level2 = False
-		for scan in self.data[ 'scans' ]:
-			if ( scan[ 'msLevel' ] > 1 ):
-				if not level2:
-					print( "Agilent CSV format does not support multimensional data, ignoring scans with level > 1" )
-					level2 = True
-				continue
-
-			if ( scan[ 'polarity' ] > 0 ):
-				polarity = '+'
-			else:
-				polarity = '-'
-			out.write( "%f,%d,%d,%d,%s,%s,%d," % 
-								( scan[ 'retentionTime' ], 1, 1, 1, polarity, "peak", 
-								len( scan[ 'mzArray' ])))
-			for point in zip( scan[ 'mzArray' ], scan[ 'intensityArray' ]):
-				out.write( '%f,%f,' % point )
-			out.write( "\n" )
-		out.close( )
-			
-	def writeMzData( self, filename ):
-		out = open( filename, 'w' );
+	compressed = filename.lower( ).endswith( ".gz" )
+	if compressed:
+		out = gzip.open( filename, 'wb', compressionLevel )
+	else:
+		out = open( filename, 'wb', 1 << 20 )
+	try:
 		out.write( '<?xml version="1.0" encoding="UTF-8"?>\n' )
 		out.write( '<mzData version="1.05" accessionNumber="psi-ms:100" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">\n' )
 		out.write( '  <cvLookup cdLabel="psi" fullName="The PSI Ontology" version="1.00" address="http://psidev.sourceforge.net/ontology" />\n' )
@@ -707,87 +681,4863 @@ class RawData( object ):
 		out.write( '      </processingMethod>\n' )
 		out.write( '    </dataProcessing>\n' )
 		out.write( '  </description>\n' )
-		out.write( '  <spectrumList count="%d">\n' % len( self.data[ 'scans' ]))
-		for scan in self.data[ 'scans' ]:
-			if ( scan[ 'polarity' ] > 0 ):
-				polarity = 'Positive'
-			else:
-				polarity = 'Negative'
-			out.write( '      <spectrum id="%d">\n' % scan[ 'id' ])
-			out.write( '        <spectrumDesc>\n' )
-			out.write( '          <spectrumSettings>\n' )
-			out.write( '            <acqSpecification spectrumType="unknown" methodOfCombination="unknown" count="1">\n' )
-			out.write( '              <acquisition number="%d" />\n' % scan[ 'id' ])
-			out.write( '            </acqSpecification>\n' )
-			out.write( '            <spectrumInstrument msLevel="%d" mzRangeStart="%f" mzRangeStop="%f">\n' % ( scan[ 'msLevel' ], scan[ 'mzRange' ][ 0 ], scan[ 'mzRange' ][ 1 ]))
-			out.write( '              <cvParam cvLabel="psi" accession="PSI:1000036" name="ScanMode" value="Scan" />\n' )
-			out.write( '              <cvParam cvLabel="psi" accession="PSI:1000037" name="Polarity" value="%s" />\n' %  polarity )
-			out.write( '              <cvParam cvLabel="psi" accession="PSI:1000038" name="TimeInMinutes" value="%f" />\n' % scan[ 'retentionTime' ])
-			out.write( '            </spectrumInstrument>\n' )
-			out.write( '          </spectrumSettings>\n' )
-			out.write( '        </spectrumDesc>\n' )
-			out.write( '        <mzArrayBinary>\n' )
-			dataLen = len( scan[ 'mzArray' ])
-			out.write( '          <data precision="64" endian="little" length="%d">%s</data>\n' % ( dataLen, b64encode( struct.pack( '<' + ( 'd' * dataLen ), *scan[ 'mzArray' ]))))
-			out.write( '        </mzArrayBinary>\n' )
-			out.write( '        <intenArrayBinary>\n' )
-			out.write( '          <data precision="64" endian="little" length="%d">%s</data>\n' % ( dataLen, b64encode( struct.pack( '<' + ( 'd' * dataLen ), *scan[ 'intensityArray' ]))))
-			out.write( '        </intenArrayBinary>\n' )
-			out.write( '      </spectrum>\n' )
+		if count is not None:
+			out.write( '  <spectrumList count="%d">\n' % count )
+			_writeMzDataSpectra( out, scans, intensityType )
+
+		elif compressed:
+			# the count has to be known before the spectra are compressed, so 
+			# write them to a temporary file first
+			spectra = tempfile.TemporaryFile( )
+			try:
+				count = _writeMzDataSpectra( spectra, scans, intensityType )
+				out.write( '  <spectrumList count="%d">\n' % count )
+				spectra.seek( 0 )
+				shutil.copyfileobj( spectra, out, 1 << 20 )
+			finally:
+				spectra.close( )
+
+		else:
+			# leave room for the count and fill it in afterwards
+			placeholder = '  <spectrumList count="0"%s' % ( ' ' * 20 )
+			countOffset = out.tell( )
+			out.write( placeholder + '>\n' )
+			count = _writeMzDataSpectra( out, scans, intensityType )
+			endOffset = out.tell( )
+			out.seek( countOffset )
+			out.write(( '  <spectrumList count="%d"' % count ).ljust( 
+				len( placeholder )))
+			out.seek( endOffset )
+
 		out.write( '  </spectrumList>\n' )
 		out.write( '</mzData>\n' )
+	finally:
+		out.close( )
+	return True
 
-	def writeMzXML( self, filename ):
-		raise NotImplementedError( 
-			"Writing to this file type has not yet been implemented." )
+def _writeMzDataSpectra( out, scans, intensityType ):
+	"""
+	Internal function. Writes the <spectrum> elements of an mzData file, one
+	write per scan.
 
-	def writeMzML( self, filename ):
-		raise NotImplementedError( 
-			"Writing to this file type has not yet been implemented." )
+	:Parameters:
+		out : file
+			The file object to write to.
+		scans : iterable
+			The scans to write.
+		intensityType : str
+			The struct format character to write the intensities with, 'f' or 'd'.
 
-	def writeJson( self, filename, indent=None ):
+	rtype: int
+	return: The number of scans written.
+	"""
+	count = 0
+	for scan in scans:
+		out.write( _mzDataSpectrumElement( scan, intensityType ))
+		count += 1
+	return count
+
+def _mzDataSpectrumElement( scan, intensityType ):
+	"""
+	Internal function. Formats a scan as an mzData <spectrum> element. Values
+	which are None are left out.
+
+	:Parameters:
+		scan : dict
+			The scan to format.
+		intensityType : str
+			The struct format character to write the intensities with, 'f' or 'd'.
+
+	rtype: str
+	return: The <spectrum> element, indented by 6 spaces.
+	"""
+	param = '              <cvParam cvLabel="psi" accession="%s" name="%s" value="%s" />\n'
+	mzRange = ''
+	lowMz, highMz = scan[ 'mzRange' ]
+	if lowMz is not None and highMz is not None:
+		mzRange = ' mzRangeStart="%f" mzRangeStop="%f"' % ( lowMz, highMz )
+	element = [ 
+		'      <spectrum id="%d">\n' % scan[ 'id' ],
+		'        <spectrumDesc>\n',
+		'          <spectrumSettings>\n',
+		'            <acqSpecification spectrumType="unknown" '
+			'methodOfCombination="unknown" count="1">\n',
+		'              <acquisition number="%d" />\n' % scan[ 'id' ],
+		'            </acqSpecification>\n',
+		'            <spectrumInstrument msLevel="%d"%s>\n' % ( scan[ 'msLevel' ], 
+			mzRange ),
+		param % ( 'PSI:1000036', 'ScanMode', 'Scan' )]
+	if scan[ 'polarity' ] is None:
+		pass
+	elif scan[ 'polarity' ] > 0:
+		element.append( param % ( 'PSI:1000037', 'Polarity', 'positive' ))
+	elif scan[ 'polarity' ] < 0:
+		element.append( param % ( 'PSI:1000037', 'Polarity', 'negative' ))
+	if scan[ 'retentionTime' ] is not None:
+		element.append( param % ( 'PSI:1000038', 'TimeInMinutes', 
+			_formatFloat( scan[ 'retentionTime' ])))
+	element.append( '            </spectrumInstrument>\n' )
+	element.append( '          </spectrumSettings>\n' )
+
+	if scan[ 'msLevel' ] > 1 and scan.get( 'precursorMz' ) is not None:
+		param = '                <cvParam cvLabel="psi" accession="%s" name="%s" value="%s" />\n'
+		element.append( '          <precursorList count="1">\n' )
+		if scan.get( 'parentScan' ) is not None:
+			element.append( '            <precursor msLevel="%d" spectrumRef="%d">\n' % 
+				( scan[ 'msLevel' ] - 1, scan[ 'parentScan' ]))
+		else:
+			element.append( '            <precursor msLevel="%d">\n' % 
+				( scan[ 'msLevel' ] - 1 ))
+		element.append( '              <ionSelection>\n' )
+		element.append( param % ( 'PSI:1000040', 'MassToChargeRatio', 
+			_formatFloat( scan[ 'precursorMz' ])))
+		element.append( '              </ionSelection>\n' )
+		element.append( '              <activation>\n' )
+		if scan.get( 'collisionEnergy' ) is not None:
+			element.append( param % ( 'PSI:1000045', 'CollisionEnergy', 
+				_formatFloat( scan[ 'collisionEnergy' ])))
+		element.append( '              </activation>\n' )
+		element.append( '            </precursor>\n' )
+		element.append( '          </precursorList>\n' )
+
+	if intensityType == 'f':
+		intensityPrecision = 32
+	else:
+		intensityPrecision = 64
+	dataLen = len( scan[ 'mzArray' ])
+	element.extend([
+		'        </spectrumDesc>\n',
+		'        <mzArrayBinary>\n',
+		'          <data precision="64" endian="little" length="%d">%s</data>\n' % 
+			( dataLen, _encodeArray( scan[ 'mzArray' ], 0, 'd', '<' )),
+		'        </mzArrayBinary>\n',
+		'        <intenArrayBinary>\n',
+		'          <data precision="%d" endian="little" length="%d">%s</data>\n' % 
+			( intensityPrecision, dataLen, _encodeArray( scan[ 'intensityArray' ], 0, 
+			intensityType, '<' )),
+		'        </intenArrayBinary>\n',
+		'      </spectrum>\n' ])
+	return ''.join( element )
+
+def _peakTotals( intensityArray ):
+	"""
+	Internal function. Calculates the total ion current and base peak intensity
+	of a scan from its peak data.
+
+	:Parameters:
+		intensityArray : list
+			The intensity values of the scan, a list or numpy array.
+
+	rtype: tuple
+	return: A 2 element tuple ( totIonCurrent, basePeakIntensity ), both 0 for
+		a scan without peaks.
+	"""
+	if not len( intensityArray ):
+		return 0.0, 0.0
+	if numpy and isinstance( intensityArray, numpy.ndarray ):
+		return float( intensityArray.sum( )), float( intensityArray.max( ))
+	return float( sum( intensityArray )), float( max( intensityArray ))
+
+def _encodeArray( values, compressionLevel, dataType, byteOrder ):
+	"""
+	Internal function. Encodes an array of values as base64 encoded binary 
+	data, the reverse of _decodeArray. The values are packed in a single 
+	operation, directly from a numpy array or through an array.array.
+
+	:Parameters:
+		values : list
+			The values to encode, a list or numpy array.
+		compressionLevel : int
+			The zlib compression level to compress the data with, or 0 (or False)
+			to leave it uncompressed.
+		dataType : str
+			The struct format character of the values, 'f' or 'd'.
+		byteOrder : str
+			The struct byte order character of the values, '<' or '>'.
+
+	rtype: str
+	return: The encoded data.
+	"""
+	if numpy and isinstance( values, numpy.ndarray ):
+		packedData = values.astype( numpy.dtype( byteOrder + dataType ), 
+			copy=False ).tobytes( )
+	else:
+		packed = array.array( dataType, values )
+		if ( byteOrder == '<' ) != ( sys.byteorder == 'little' ):
+			packed.byteswap( )
+		if hasattr( packed, 'tobytes' ):
+			packedData = packed.tobytes( )
+		else:
+			packedData = packed.tostring( )
+	if compressionLevel:
+		packedData = zlib.compress( packedData, compressionLevel )
+	return b64encode( packedData )
+
+def _interleave( mzArray, intensityArray ):
+	"""
+	Internal function. Interleaves the m/z and intensity values of a scan into 
+	a single array of pairs.
+
+	:Parameters:
+		mzArray : list
+			The m/z values, a list or numpy array.
+		intensityArray : list
+			The intensity values.
+
+	rtype: list
+	return: The interleaved values, as a numpy array if mzArray is one.
+	"""
+	if numpy and isinstance( mzArray, numpy.ndarray ):
+		return numpy.column_stack(( mzArray, intensityArray )).ravel( )
+	values = [ None ] * ( 2 * len( mzArray ))
+	values[ 0::2 ] = mzArray
+	values[ 1::2 ] = intensityArray
+	return values
+
+def _formatFloat( value ):
+	"""
+	Internal function. Formats a number for an xml attribute with the shortest
+	representation that reads back as the same value.
+
+	:Parameters:
+		value : float
+			The value to format.
+
+	rtype: str
+	return: The formatted value.
+	"""
+	return repr( float( value ))
+
+class _TrackingWriter( object ):
+	"""
+	Internal class. Wraps a file opened for writing, keeping count of the bytes 
+	written and a running SHA-1 digest of them, for the indexes and checksums 
+	of the indexed xml formats.
+	"""
+
+	def __init__( self, out, checksum=True ):
 		"""
-		Dumps the data to a JSON array.
 		:Parameters:
-			maData : dict
-				A dictionary object containing scan data, normally returned from
-			filename : string
-				The name of the file to write to.
-			indent : int
-				Level to indent for pretty-printing, or None for no pretty-print.
-				Defaults to None
+			out : file
+				The file to write to.
+			checksum : bool
+				Whether to keep the SHA-1 digest. Defaults to True.
 		"""
-		if not json:
-			raise NotImplementedError( "This method is not supported in your version of Python" )
-		if( indent ):
-			sep = (', ',': ')
-		else:
-			sep = (',',':')
-		out = open( filename, 'w' )
-		json.dump( self.data, out, indent=indent, separators=sep )
-		out.close( )
+		self.out = out
+		self.offset = 0
+		self.sha1 = checksum and sha1( ) or None
 
-	def writeJsonGz( self, filename, indent=None, compressionLevel=6 ):
+	def write( self, data ):
+		self.out.write( data )
+		self.offset += len( data )
+		if self.sha1:
+			self.sha1.update( data )
+
+	def hexdigest( self ):
 		"""
-		Dumps the data to a JSON array, compressed with zlib.
-		:Parameters:
-			maData : dict
-				A dictionary object containing scan data, normally returned from
-			filename : string
-				The name of the file to write to.
-			indent : int
-				Level to indent for pretty-printing, or None for no pretty-print.
-				Defaults to None
-			compressionLevel : int
-				Compression level to use - 0 for least compression, 9 for most.
-				Defaults to 6.
+		rtype: str
+		return: The SHA-1 digest of everything written so far.
 		"""
-		if( indent ):
-			sep = (', ',': ')
+		return self.sha1.hexdigest( )
+
+	def close( self ):
+		self.out.close( )
+
+def writeMzMl( filename, scans, sourceFile=None, intensityPrecision=64, 
+               compressionLevel=6, count=None ):
+	"""
+	Writes scans in indexedmzML 1.1 format. The scans are written one at a time
+	as they are produced, so scans can be streamed from one of the readers, 
+	such as iterScans, without holding the whole run in memory. The byte offset
+	of each spectrum and a SHA-1 digest of the output are kept as it is written,
+	and the file ends with the <indexList>, <indexListOffset> and 
+	<fileChecksum> elements, so it can be read with IndexedMzMl.
+
+	The spectrumList count has to be written before the spectra. If it is not
+	given and scans has no length, the spectra are written to a temporary file
+	first and copied into place, so pass count when streaming a large run.
+
+	:Parameters:
+		filename : str
+			The name of the file to write to.
+		scans : iterable
+			The scans to write.
+		sourceFile : str
+			The name of the file the data came from, for the <sourceFileList>.
+		intensityPrecision : int
+			The precision of the intensity values written, 32 or 64. The m/z 
+			values are always written with 64 bit precision. Defaults to 64.
+		compressionLevel : int
+			The zlib compression level to compress the binary data arrays with - 1
+			for least compression, 9 for most, or 0 to write them uncompressed. 
+			Defaults to 6.
+		count : int
+			The number of scans. Defaults to len( scans ).
+
+	rtype: bool
+	return: True if the write succeeded
+	"""
+	if intensityPrecision == 32:
+		intensityType = 'f'
+	elif intensityPrecision == 64:
+		intensityType = 'd'
+	else:
+		raise ValueError( "intensityPrecision must be 32 or 64" )
+	if count is None and hasattr( scans, '__len__' ):
+		count = len( scans )
+
+	out = _TrackingWriter( open( filename, 'wb', 1 << 20 ))
+	try:
+		out.write( '<?xml version="1.0" encoding="utf-8"?>\n' )
+		out.write( '<indexedmzML xmlns="http://psi.hupo.org/ms/mzml" '
+			'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+			'xsi:schemaLocation="http://psi.hupo.org/ms/mzml '
+			'http://psidev.info/files/ms/mzML/xsd/mzML1.1.2_idx.xsd">\n' )
+		out.write( '  <mzML xmlns="http://psi.hupo.org/ms/mzml" '
+			'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+			'xsi:schemaLocation="http://psi.hupo.org/ms/mzml '
+			'http://psidev.info/files/ms/mzML/xsd/mzML1.1.0.xsd" version="1.1.0">\n' )
+		out.write( '    <cvList count="2">\n' )
+		out.write( '      <cv id="MS" '
+			'fullName="Proteomics Standards Initiative Mass Spectrometry Ontology" '
+			'URI="https://raw.githubusercontent.com/HUPO-PSI/psi-ms-CV/master/psi-ms.obo"/>\n' )
+		out.write( '      <cv id="UO" fullName="Unit Ontology" URI="https://raw.githubusercontent'
+			'.com/bio-ontology-research-group/unit-ontology/master/unit.obo"/>\n' )
+		out.write( '    </cvList>\n' )
+		out.write( '    <fileDescription>\n' )
+		out.write( '      <fileContent>\n' )
+		out.write( '        <cvParam cvRef="MS" accession="MS:1000524" '
+			'name="data file content" value=""/>\n' )
+		out.write( '      </fileContent>\n' )
+		if sourceFile is not None:
+			location, name = os.path.split( sourceFile )
+			out.write( '      <sourceFileList count="1">\n' )
+			out.write( '        <sourceFile id="SF1" name="%s" location="%s"/>\n' % (
+				escape( name, { '"' : '&quot;' }), 
+				escape( location, { '"' : '&quot;' })))
+			out.write( '      </sourceFileList>\n' )
+		out.write( '    </fileDescription>\n' )
+		out.write( '    <softwareList count="1">\n' )
+		out.write( '      <software id="pymzlib" version="%s">\n' % VERSION )
+		out.write( '        <cvParam cvRef="MS" accession="MS:1000799" '
+			'name="custom unreleased software tool" value="pymzlib"/>\n' )
+		out.write( '      </software>\n' )
+		out.write( '    </softwareList>\n' )
+		out.write( '    <instrumentConfigurationList count="1">\n' )
+		out.write( '      <instrumentConfiguration id="IC1">\n' )
+		out.write( '        <cvParam cvRef="MS" accession="MS:1000031" '
+			'name="instrument model" value=""/>\n' )
+		out.write( '      </instrumentConfiguration>\n' )
+		out.write( '    </instrumentConfigurationList>\n' )
+		out.write( '    <dataProcessingList count="1">\n' )
+		out.write( '      <dataProcessing id="pymzlib_conversion">\n' )
+		out.write( '        <processingMethod order="0" softwareRef="pymzlib">\n' )
+		out.write( '          <cvParam cvRef="MS" accession="MS:1000544" '
+			'name="Conversion to mzML" value=""/>\n' )
+		out.write( '        </processingMethod>\n' )
+		out.write( '      </dataProcessing>\n' )
+		out.write( '    </dataProcessingList>\n' )
+		out.write( '    <run id="run1" defaultInstrumentConfigurationRef="IC1">\n' )
+
+		if count is not None:
+			out.write( '      <spectrumList count="%d" '
+				'defaultDataProcessingRef="pymzlib_conversion">\n' % count )
+			offsets = _writeMzMlSpectra( out, scans, intensityType, 
+				compressionLevel )
 		else:
-			sep = (',',':')
-		out = gzip.open( filename, 'wb', compressionLevel )
-		out.write( json.dumps( self.data, indent=indent, separators=sep))
+			spill = _TrackingWriter( tempfile.TemporaryFile( ), False )
+			try:
+				offsets = _writeMzMlSpectra( spill, scans, intensityType, 
+					compressionLevel )
+				out.write( '      <spectrumList count="%d" '
+					'defaultDataProcessingRef="pymzlib_conversion">\n' % len( offsets ))
+				start = out.offset
+				spill.out.seek( 0 )
+				while True:
+					chunk = spill.out.read( 1 << 20 )
+					if not chunk:
+						break
+					out.write( chunk )
+				offsets = [( id_, start + offset ) for id_, offset in offsets ]
+			finally:
+				spill.close( )
+
+		out.write( '      </spectrumList>\n' )
+		out.write( '    </run>\n' )
+		out.write( '  </mzML>\n' )
+		indexListOffset = out.offset + 2
+		out.write( '  <indexList count="1">\n' )
+		out.write( '    <index name="spectrum">\n' )
+		for id_, offset in offsets:
+			out.write( '      <offset idRef="%s">%d</offset>\n' % ( id_, offset ))
+		out.write( '    </index>\n' )
+		out.write( '  </indexList>\n' )
+		out.write( '  <indexListOffset>%d</indexListOffset>\n' % indexListOffset )
+		# the checksum covers the file up to and including the opening tag
+		out.write( '  <fileChecksum>' )
+		out.write( '%s</fileChecksum>\n' % out.hexdigest( ))
+		out.write( '</indexedmzML>\n' )
+	finally:
 		out.close( )
+	return True
+
+def _writeMzMlSpectra( out, scans, intensityType, compressionLevel ):
+	"""
+	Internal function. Writes the <spectrum> elements of an mzML file, one 
+	write per scan.
+
+	:Parameters:
+		out : _TrackingWriter
+			The file to write to.
+		scans : iterable
+			The scans to write.
+		intensityType : str
+			The struct format character to write the intensities with, 'f' or 'd'.
+		compressionLevel : int
+			The zlib compression level for the binary data, 0 for none.
+
+	rtype: list
+	return: A 2 element tuple ( id, offset ) for each spectrum written, where 
+		offset is the value of out.offset at the start of the <spectrum> 
+		element.
+	"""
+	offsets = [ ]
+	for index, scan in enumerate( scans ):
+		id_ = 'scan=%d' % scan[ 'id' ]
+		offsets.append(( id_, out.offset + 8 ))
+		out.write( _mzMlSpectrumElement( scan, index, id_, intensityType, 
+			compressionLevel ))
+	return offsets
+
+def _mzMlSpectrumElement( scan, index, id_, intensityType, compressionLevel ):
+	"""
+	Internal function. Formats a scan as an mzML <spectrum> element.
+
+	:Parameters:
+		scan : dict
+			The scan to format.
+		index : int
+			The position of the scan in the file.
+		id_ : str
+			The id of the spectrum.
+		intensityType : str
+			The struct format character to write the intensities with, 'f' or 'd'.
+		compressionLevel : int
+			The zlib compression level for the binary data, 0 for none.
+
+	rtype: str
+	return: The <spectrum> element, indented by 8 spaces.
+	"""
+	mzArray, intensityArray = scan[ 'mzArray' ], scan[ 'intensityArray' ]
+	param = '          <cvParam cvRef="MS" accession="%s" name="%s" value="%s"/>\n'
+	element = [ '        <spectrum index="%d" id="%s" defaultArrayLength="%d">\n' %
+		( index, id_, len( mzArray ))]
+	element.append( param % ( 'MS:1000511', 'ms level', scan[ 'msLevel' ]))
+	if scan[ 'msLevel' ] > 1:
+		element.append( param % ( 'MS:1000580', 'MSn spectrum', '' ))
+	else:
+		element.append( param % ( 'MS:1000579', 'MS1 spectrum', '' ))
+	if scan[ 'polarity' ] is None:
+		pass
+	elif scan[ 'polarity' ] > 0:
+		element.append( param % ( 'MS:1000130', 'positive scan', '' ))
+	elif scan[ 'polarity' ] < 0:
+		element.append( param % ( 'MS:1000129', 'negative scan', '' ))
+	lowMz, highMz = scan[ 'mzRange' ]
+	if lowMz is not None and highMz is not None:
+		element.append( param % ( 'MS:1000528', 'lowest observed m/z', 
+			_formatFloat( lowMz )))
+		element.append( param % ( 'MS:1000527', 'highest observed m/z', 
+			_formatFloat( highMz )))
+	# computed from the peaks, since the recorded values are stale if peaks
+	# have been removed
+	totIonCurrent, basePeakIntensity = _peakTotals( intensityArray )
+	element.append( param % ( 'MS:1000285', 'total ion current', 
+		_formatFloat( totIonCurrent )))
+	element.append( param % ( 'MS:1000505', 'base peak intensity', 
+		_formatFloat( basePeakIntensity )))
+
+	element.append( '          <scanList count="1">\n' )
+	element.append( '            <cvParam cvRef="MS" accession="MS:1000795" '
+		'name="no combination" value=""/>\n' )
+	if scan[ 'retentionTime' ] is None:
+		element.append( '            <scan/>\n' )
+	else:
+		element.append( '            <scan>\n' )
+		element.append( '              <cvParam cvRef="MS" accession="MS:1000016" '
+			'name="scan start time" value="%s" unitCvRef="UO" unitAccession="UO:0000031" '
+			'unitName="minute"/>\n' % _formatFloat( scan[ 'retentionTime' ]))
+		element.append( '            </scan>\n' )
+	element.append( '          </scanList>\n' )
+
+	if scan[ 'msLevel' ] > 1 and scan.get( 'precursorMz' ) is not None:
+		element.append( '          <precursorList count="1">\n' )
+		if scan.get( 'parentScan' ) is not None:
+			element.append( '            <precursor spectrumRef="scan=%d">\n' % 
+				scan[ 'parentScan' ])
+		else:
+			element.append( '            <precursor>\n' )
+		element.append( '              <selectedIonList count="1">\n' )
+		element.append( '                <selectedIon>\n' )
+		element.append( '                  <cvParam cvRef="MS" accession="MS:1000744" '
+			'name="selected ion m/z" value="%s" unitCvRef="MS" unitAccession="MS:1000040" '
+			'unitName="m/z"/>\n' % _formatFloat( scan[ 'precursorMz' ]))
+		element.append( '                </selectedIon>\n' )
+		element.append( '              </selectedIonList>\n' )
+		element.append( '              <activation>\n' )
+		element.append( '                <cvParam cvRef="MS" accession="MS:1000044" '
+			'name="dissociation method" value=""/>\n' )
+		if scan.get( 'collisionEnergy' ) is not None:
+			element.append( '                <cvParam cvRef="MS" accession="MS:1000045" '
+				'name="collision energy" value="%s" unitCvRef="UO" '
+				'unitAccession="UO:0000266" unitName="electronvolt"/>\n' % 
+				_formatFloat( scan[ 'collisionEnergy' ]))
+		element.append( '              </activation>\n' )
+		element.append( '            </precursor>\n' )
+		element.append( '          </precursorList>\n' )
+
+	element.append( '          <binaryDataArrayList count="2">\n' )
+	element.append( _mzMlBinaryArray( mzArray, 'd', compressionLevel, 
+		'<cvParam cvRef="MS" accession="MS:1000514" name="m/z array" value="" '
+		'unitCvRef="MS" unitAccession="MS:1000040" unitName="m/z"/>' ))
+	element.append( _mzMlBinaryArray( intensityArray, intensityType, 
+		compressionLevel, 
+		'<cvParam cvRef="MS" accession="MS:1000515" name="intensity array" value="" '
+		'unitCvRef="MS" unitAccession="MS:1000131" '
+		'unitName="number of detector counts"/>' ))
+	element.append( '          </binaryDataArrayList>\n' )
+	element.append( '        </spectrum>\n' )
+	return ''.join( element )
+
+def _mzMlBinaryArray( values, dataType, compressionLevel, arrayParam ):
+	"""
+	Internal function. Formats an array of values as an mzML <binaryDataArray>
+	element.
+
+	:Parameters:
+		values : list
+			The values to write, a list or numpy array.
+		dataType : str
+			The struct format character to write the values with, 'f' or 'd'.
+		compressionLevel : int
+			The zlib compression level for the data, 0 for none.
+		arrayParam : str
+			The cvParam element describing the kind of array.
+
+	rtype: str
+	return: The <binaryDataArray> element.
+	"""
+	if len( values ):
+		binary = _encodeArray( values, compressionLevel, dataType, '<' )
+	else:
+		binary = ''
+	if dataType == 'f':
+		typeParam = '<cvParam cvRef="MS" accession="MS:1000521" name="32-bit float" value=""/>'
+	else:
+		typeParam = '<cvParam cvRef="MS" accession="MS:1000523" name="64-bit float" value=""/>'
+	if compressionLevel:
+		compressionParam = ( '<cvParam cvRef="MS" accession="MS:1000574" '
+			'name="zlib compression" value=""/>' )
+	else:
+		compressionParam = ( '<cvParam cvRef="MS" accession="MS:1000576" '
+			'name="no compression" value=""/>' )
+	return ( '            <binaryDataArray encodedLength="%d">\n'
+	         '              %s\n'
+	         '              %s\n'
+	         '              %s\n'
+	         '              <binary>%s</binary>\n'
+	         '            </binaryDataArray>\n' % ( len( binary ), typeParam, 
+	         compressionParam, arrayParam, binary ))
+
+def iterMzMl( filename, info=None, workers=None, lazy=False, **criteria ):
+	"""
+	Iterates over the spectra in an mzML file (either plain or indexed) one at a
+	time. Each <spectrum> element is discarded as soon as it has been decoded.
+	Chromatograms are skipped.
+
+	:Parameters:
+		filename : str
+			The name of the file to read.
+		info : dict
+			An optional dict which will be filled in with file level metadata, such
+			as 'sourceFile', as it is encountered.
+		workers : int
+			The number of worker processes to decode the peak data with, or a
+			multiprocessing Pool or ThreadPool to use. Defaults to decoding in 
+			this process.
+		lazy : bool
+			If True, the peak data of each scan is only decoded when its 'mzArray'
+			or 'intensityArray' is first accessed, see LazyScan. Defaults to False.
+		criteria : keywords
+			Optional selection criteria, see iterScans. Scans which do not match 
+			are skipped before their peak data is decoded.
+
+	rtype: generator
+	return: A generator yielding one scan dict at a time, in file order.
+	"""
+	if info is None:
+		info = { }
+	return _decodeScans( _selectScans( _iterMzMl( filename, info ), **criteria ), 
+		workers, lazy, criteria.get( 'minMz' ), criteria.get( 'maxMz' ))
+
+def _iterMzMl( filename, info ):
+	"""
+	Internal function. Iterates over the spectra in an mzML file without 
+	decoding their peak data, see iterMzMl.
+
+	rtype: generator
+	return: A generator yielding a 2 element tuple ( scan, payload ) for each 
+		spectrum, see _decodePeaks.
+	"""
+	paramGroups = { }
+	# the currently open elements, outermost first
+	elements = [ ]
+	for event, elem in ElementTree.iterparse( filename, ( 'start', 'end' )):
+		if event == 'start':
+			elements.append( elem )
+			continue
+
+		elements.pop( )
+		tag = _localName( elem.tag )
+		if tag == 'spectrum':
+			yield _mzMlScan( elem, paramGroups )
+
+		elif tag == 'referenceableParamGroup':
+			paramGroups[ elem.get( 'id' ) ] = _cvParams( elem )
+			continue
+
+		elif tag == 'sourceFile':
+			if not 'sourceFile' in info:
+				info[ 'sourceFile' ] = _mzMlSourceFile( elem )
+			continue
+
+		elif not tag in ( 'chromatogram', 'offset' ):
+			continue
+
+		elements[ -1 ].remove( elem )
+		elem.clear( )
+
+def _mzMlScan( spectrum, paramGroups=None ):
+	"""
+	Internal function. Converts an mzML <spectrum> element into a scan dict.
+
+	:Parameters:
+		spectrum : Element
+			The <spectrum> element to convert.
+		paramGroups : dict
+			The referenceable param groups of the file, as returned by _cvParams
+			and keyed by group id.
+
+	rtype: tuple
+	return: A 2 element tuple ( scan, payload ) containing a dict of the scan 
+		metadata and the undecoded peak data, see _decodePeaks.
+	"""
+	parentScan = None
+	precursorMz = None
+	collisionEnergy = None
+	polarity = None
+	rt = None
+	lowMz = None
+	highMz = None
+	params = _cvParams( spectrum, paramGroups )
+	scanId = _mzMlScanId( spectrum.get( 'id' ), int( spectrum.get( 'index', 0 )))
+	msLevel = int( params.get( 'MS:1000511', ( 1, None ))[ 0 ])
+	if 'MS:1000130' in params:
+		polarity = 1
+	elif 'MS:1000129' in params:
+		polarity = -1
+	if 'MS:1000528' in params and 'MS:1000527' in params:
+		lowMz = float( params[ 'MS:1000528' ][ 0 ])
+		highMz = float( params[ 'MS:1000527' ][ 0 ])
+	totIonCurrent = None
+	basePeakIntensity = None
+	if 'MS:1000285' in params:
+		totIonCurrent = float( params[ 'MS:1000285' ][ 0 ])
+	if 'MS:1000505' in params:
+		basePeakIntensity = float( params[ 'MS:1000505' ][ 0 ])
+
+	scan = _getChildNode( spectrum, 'scanList', 'scan' )
+	if scan is not None:
+		scanParams = _cvParams( scan, paramGroups )
+		if 'MS:1000016' in scanParams:
+			value, unit = scanParams[ 'MS:1000016' ]
+			rt = float( value )
+			if unit == 'UO:0000010': # seconds
+				rt /= 60
+		window = _getChildNode( scan, 'scanWindowList', 'scanWindow' )
+		if lowMz is None and window is not None:
+			windowParams = _cvParams( window, paramGroups )
+			if 'MS:1000501' in windowParams and 'MS:1000500' in windowParams:
+				lowMz = float( windowParams[ 'MS:1000501' ][ 0 ])
+				highMz = float( windowParams[ 'MS:1000500' ][ 0 ])
+
+	precursor = _getChildNode( spectrum, 'precursorList', 'precursor' )
+	if precursor is not None:
+		if precursor.get( 'spectrumRef' ):
+			parentScan = _mzMlScanId( precursor.get( 'spectrumRef' ))
+		ionParams = _cvParams( _getChildNode( precursor, 'selectedIonList', 
+			'selectedIon' ), paramGroups )
+		windowParams = _cvParams( _getChildNode( precursor, 'isolationWindow' ), 
+			paramGroups )
+		if 'MS:1000744' in ionParams:
+			precursorMz = float( ionParams[ 'MS:1000744' ][ 0 ])
+		elif 'MS:1000827' in windowParams:
+			precursorMz = float( windowParams[ 'MS:1000827' ][ 0 ])
+		activationParams = _cvParams( _getChildNode( precursor, 'activation' ), 
+			paramGroups )
+		if 'MS:1000045' in activationParams:
+			collisionEnergy = float( activationParams[ 'MS:1000045' ][ 0 ])
+
+	massValues = ( None, False, 'd', '<', 0 )
+	intensityValues = ( None, False, 'd', '<', 0 )
+	arrays = _getChildNode( spectrum, 'binaryDataArrayList' )
+	if arrays is not None:
+		for array in arrays:
+			arrayParams = _cvParams( array, paramGroups )
+			if 'MS:1000514' in arrayParams:
+				massValues = _mzMlArray( array, arrayParams )
+			elif 'MS:1000515' in arrayParams:
+				intensityValues = _mzMlArray( array, arrayParams )
+
+	return { 
+		"retentionTime" : rt,
+		"polarity" : polarity, 
+		"msLevel" : msLevel, 
+		"id" : scanId,
+		"mzRange" : [ lowMz, highMz ],
+		"parentScan" : parentScan,
+		"precursorMz" : precursorMz,
+		"collisionEnergy" : collisionEnergy,
+		"totIonCurrent" : totIonCurrent,
+		"basePeakIntensity" : basePeakIntensity
+	}, ( massValues, intensityValues )
+
+def _mzMlArray( array, params ):
+	"""
+	Internal function. Describes the values contained in an mzML 
+	<binaryDataArray> element so they can be decoded by _decodeArray.
+
+	:Parameters:
+		array : Element
+			The <binaryDataArray> element containing the data.
+		params : dict
+			The cvParams of the element, as returned by _cvParams.
+
+	rtype: tuple
+	return: The arguments to _decodeArray for the data.
+	"""
+	binary = _getChildNode( array, 'binary' )
+	if binary is None or not binary.text:
+		packedData = None
+	else:
+		packedData = binary.text
+	if not ( 'MS:1000574' in params or 'MS:1000576' in params ):
+		raise NotImplementedError( 
+			"Reading this binary data compression type has not yet been implemented." )
+
+	if 'MS:1000521' in params:
+		dataType = 'f'
+	elif 'MS:1000519' in params:
+		dataType = 'i'
+	elif 'MS:1000522' in params:
+		dataType = 'q'
+	else:
+		dataType = 'd'
+	return ( packedData, 'MS:1000574' in params, dataType, '<' )
+
+def iterCsv( filename, info=None, **criteria ):
+	"""
+	Iterates over the scans in an Agilent csv file, optionally gzip compressed,
+	one at a time. The file is read line by line, and the peak data of each row
+	is parsed in a single call (with numpy if it is installed), so memory use 
+	does not depend on the size of the file.
+
+	:Parameters:
+		filename : str
+			The name of the file to read.
+		info : dict
+			An optional dict which will be filled in with file level metadata, such
+			as 'sourceFile', as it is encountered.
+		criteria : keywords
+			Optional selection criteria, see iterScans. Rows which do not match are
+			skipped before their peak data is parsed.
+
+	rtype: generator
+	return: A generator yielding one scan dict at a time, in file order.
+	"""
+	if info is None:
+		info = { }
+	minMz, maxMz = criteria.get( 'minMz' ), criteria.get( 'maxMz' )
+	for scan, payload in _selectScans( _iterCsv( filename, info ), **criteria ):
+		mzArray, intensityArray, scan[ 'mzRange' ] = _csvPeaks( *payload )
+		if minMz is not None or maxMz is not None:
+			mzArray, intensityArray = _trimPeaks( mzArray, intensityArray, minMz, 
+				maxMz )
+		scan[ 'mzArray' ], scan[ 'intensityArray' ] = mzArray, intensityArray
+		yield scan
+
+def _iterCsv( filename, info ):
+	"""
+	Internal function. Iterates over the rows of an Agilent csv file without 
+	parsing their peak data, see iterCsv.
+
+	rtype: generator
+	return: A generator yielding a 2 element tuple ( scan, payload ) for each 
+		row, where payload holds the arguments to _csvPeaks.
+	"""
+	if filename.lower( ).endswith( ".gz" ):
+		f = gzip.open( filename, 'rb' )
+	else:
+		f = open( filename, 'r', 1 << 20 )
+	try:
+		for line in f:
+			if line.startswith( "file name," ):
+				info[ 'sourceFile' ] = line.rstrip( '\r\n' ).split( ',' )[ 1 ]
+			elif line.startswith( "[spectra]" ):
+				break
+		else:
+			raise ValueError( "No [spectra] section in '%s'" % filename )
+
+		scanId = 0
+		for line in f:
+			values = line.split( ',', 7 )
+			if len( values ) < 8:
+				continue
+			scanId += 1
+			if values[ 4 ] == '-':
+				polarity = -1
+			else:
+				polarity = 1
+			yield ({
+				"retentionTime" : float( values[ 0 ]),
+				"polarity" : polarity,
+				"msLevel" : 1,
+				"id" : scanId,
+				"mzRange" : [ None, None ],
+				"parentScan" : None,
+				"precursorMz" : None,
+				"collisionEnergy" : None
+			}, ( values[ 7 ], int( float( values[ 6 ]))))
+	finally:
+		f.close( )
+
+def _csvPeaks( text, count ):
+	"""
+	Internal function. Parses the peak data of a row of an Agilent csv file.
+
+	:Parameters:
+		text : str
+			The comma separated m/z and intensity pairs of the row.
+		count : int
+			The number of peaks given in the row.
+
+	rtype: tuple
+	return: A 3 element tuple ( mzArray, intensityArray, mzRange ). The arrays
+		are numpy arrays if USE_NUMPY is set, otherwise lists.
+	"""
+	text = text.rstrip( ).rstrip( ',' )
+	if numpy:
+		if text:
+			values = numpy.fromstring( text, float, sep=',' )
+		else:
+			values = numpy.zeros( 0 )
+		if len( values ) != 2 * count:
+			# fromstring stops quietly at anything it can't parse
+			values = numpy.array([ float( x ) for x in text.split( ',' ) if x ])
+		mzArray, intensityArray = values[ 0::2 ], values[ 1::2 ]
+		mzRange = [ None, None ]
+		if len( mzArray ):
+			mzRange = [ float( mzArray.min( )), float( mzArray.max( ))]
+		if USE_NUMPY:
+			return mzArray, intensityArray, mzRange
+		return mzArray.tolist( ), intensityArray.tolist( ), mzRange
+
+	values = [ float( x ) for x in text.split( ',' ) if x ]
+	mzArray, intensityArray = values[ 0::2 ], values[ 1::2 ]
+	if mzArray:
+		return mzArray, intensityArray, [ min( mzArray ), max( mzArray )]
+	return mzArray, intensityArray, [ None, None ]
+
+def _csvRow( scan ):
+	"""
+	Internal function. Formats a scan as a row of an Agilent csv file. The 
+	peaks are formatted with a single string operation.
+
+	:Parameters:
+		scan : dict
+			The scan to format.
+
+	rtype: str
+	return: The row, including the line break.
+	"""
+	if ( scan[ 'polarity' ] > 0 ):
+		polarity = '+'
+	else:
+		polarity = '-'
+	count = len( scan[ 'mzArray' ])
+	values = _interleave( scan[ 'mzArray' ], scan[ 'intensityArray' ])
+	if not isinstance( values, list ):
+		values = values.tolist( )
+	return (( "%f,%d,%d,%d,%s,%s,%d," % ( scan[ 'retentionTime' ], 1, 1, 1, 
+		polarity, "peak", count )) + ( "%f," * ( 2 * count )) % tuple( values ) + 
+		"\n" )
+
+def _selectScans( scans, minTime=None, maxTime=None, level=None, polarity=None,
+                  minMz=None, maxMz=None ):
+	"""
+	Internal function. Skips the scans produced by one of the raw scan iterators
+	which do not match the selection criteria, before their peak data is 
+	decoded. Scans without a retention time do not match a retention time 
+	range. The m/z range is applied when the peak data is decoded, see 
+	_decodeScans.
+
+	:Parameters:
+		scans : iterable
+			An iterable of 2 element tuples ( scan, payload ), see _decodePeaks.
+		minTime : float
+			The minimum retention time of the scans.
+		maxTime : float
+			The maximum retention time of the scans (exclusive).
+		level : int
+			The msLevel of the scans. None or 0 selects all levels.
+		polarity : int
+			The polarity of the scans, 1 for positive or -1 for negative.
+
+	rtype: generator
+	return: A generator yielding the matching ( scan, payload ) tuples.
+	"""
+	for scan, payload in scans:
+		rt = scan[ 'retentionTime' ]
+		if (( minTime is not None and ( rt is None or rt < minTime )) or
+		    ( maxTime is not None and ( rt is None or rt >= maxTime )) or
+		    ( level and scan[ 'msLevel' ] != level ) or
+		    ( polarity is not None and scan[ 'polarity' ] != polarity )):
+			continue
+		yield scan, payload
+
+def _decodeScans( scans, workers=None, lazy=False, minMz=None, maxMz=None ):
+	"""
+	Internal function. Decodes the peak data of the scans produced by one of the
+	raw scan iterators, such as _iterMzXml, optionally using a pool of worker 
+	processes. The scans are yielded in their original order.
+
+	:Parameters:
+		scans : iterable
+			An iterable of 2 element tuples ( scan, payload ), see _decodePeaks.
+		workers : int
+			The number of worker processes to decode the peak data with, or a
+			multiprocessing Pool or ThreadPool to use. Defaults to decoding in 
+			this process.
+		lazy : bool
+			If True, yield a LazyScan for each scan instead of decoding it.
+		minMz : float
+			If given, peaks with a lower m/z are dropped as they are decoded.
+		maxMz : float
+			If given, peaks with this m/z or higher are dropped as they are 
+			decoded.
+
+	rtype: generator
+	return: A generator yielding each scan dict with its 'mzArray' and 
+		'intensityArray' filled in.
+	"""
+	peakRange = None
+	if minMz is not None or maxMz is not None:
+		peakRange = ( minMz, maxMz )
+		scans = _withoutHeaderValues( scans )
+
+	if lazy:
+		for scan, payload in scans:
+			yield LazyScan( scan, payload, peakRange )
+		return
+
+	if not workers:
+		for scan, payload in scans:
+			scan[ 'mzArray' ], scan[ 'intensityArray' ] = _decodePeaks( payload, 
+				peakRange )
+			yield scan
+		return
+
+	if hasattr( workers, 'map_async' ):
+		pool = workers
+	else:
+		import multiprocessing
+		pool = multiprocessing.Pool( workers, _initDecodeWorker, ( USE_NUMPY, ))
+	try:
+		# decode each batch in the pool while the next one is being parsed
+		pending = None
+		batch = [ ]
+		for item in scans:
+			batch.append( item )
+			if len( batch ) < DECODE_BATCH_SIZE:
+				continue
+			result = pool.map_async( _decodePeakArgs, 
+				[( x[ 1 ], peakRange ) for x in batch ], DECODE_CHUNK_SIZE )
+			if pending:
+				for scan in _collectBatch( *pending ):
+					yield scan
+			pending = ( batch, result )
+			batch = [ ]
+		if pending:
+			for scan in _collectBatch( *pending ):
+				yield scan
+		if batch:
+			for scan in _collectBatch( batch, pool.map_async( _decodePeakArgs, 
+				[( x[ 1 ], peakRange ) for x in batch ], DECODE_CHUNK_SIZE )):
+				yield scan
+	finally:
+		if pool is not workers:
+			pool.terminate( )
+			pool.join( )
+
+def _collectBatch( batch, result ):
+	"""
+	Internal function. Waits for a batch of scans to be decoded by a worker pool
+	and stores the peak data in the scans.
+
+	:Parameters:
+		batch : list
+			The ( scan, payload ) tuples which were sent to the pool.
+		result : AsyncResult
+			The result of mapping _decodePeakArgs over the payloads.
+
+	rtype: list
+	return: The decoded scans in order.
+	"""
+	scans = [ ]
+	for ( scan, payload ), peaks in zip( batch, result.get( )):
+		scan[ 'mzArray' ], scan[ 'intensityArray' ] = peaks
+		scans.append( scan )
+	return scans
+
+def _initDecodeWorker( useNumpy ):
+	"""
+	Internal function. Initializes a worker process for decoding peak data.
+
+	:Parameters:
+		useNumpy : bool
+			The value of USE_NUMPY in the parent process.
+	"""
+	global USE_NUMPY
+	USE_NUMPY = useNumpy
+
+def _withoutHeaderValues( scans ):
+	"""
+	Internal function. Clears the values recorded in the headers of the scans 
+	produced by one of the raw scan iterators which describe all of the peaks,
+	for scans whose peaks are to be trimmed.
+
+	:Parameters:
+		scans : iterable
+			An iterable of 2 element tuples ( scan, payload ).
+
+	rtype: generator
+	return: A generator yielding the tuples.
+	"""
+	for scan, payload in scans:
+		for key in _HEADER_PEAK_KEYS:
+			if key in scan:
+				scan[ key ] = None
+		yield scan, payload
+
+def _decodePeaks( payload, peakRange=None ):
+	"""
+	Internal function. Decodes the peak data of a scan.
+
+	:Parameters:
+		payload : tuple
+			The undecoded peak data as produced by the scan conversion functions, 
+			either a 2 element tuple of the arguments to _decodeArray for the m/z
+			and intensity arrays, or a 1 element tuple for a single array of
+			interleaved m/z and intensity pairs.
+		peakRange : tuple
+			An optional ( minMz, maxMz ) tuple. Peaks outside of the range 
+			[ minMz, maxMz ) are dropped. Either limit may be None.
+
+	rtype: tuple
+	return: A 2 element tuple ( mzArray, intensityArray )
+	"""
+	arrays = [ _decodeArray( *array ) for array in payload ]
+	if len( arrays ) == 1:
+		mzArray, intensityArray = arrays[ 0 ][ 0::2 ], arrays[ 0 ][ 1::2 ]
+	else:
+		mzArray, intensityArray = arrays[ 0 ], arrays[ 1 ]
+	if peakRange is None:
+		return mzArray, intensityArray
+	return _trimPeaks( mzArray, intensityArray, *peakRange )
+
+def _trimPeaks( mzArray, intensityArray, minMz=None, maxMz=None ):
+	"""
+	Internal function. Drops the peaks outside of the range [ minMz, maxMz ).
+
+	:Parameters:
+		mzArray : list
+			The m/z values of the peaks, a list or numpy array.
+		intensityArray : list
+			The intensities of the peaks.
+		minMz : float
+			The lower limit of the range, or None.
+		maxMz : float
+			The upper limit of the range (exclusive), or None.
+
+	rtype: tuple
+	return: A 2 element tuple ( mzArray, intensityArray )
+	"""
+	if numpy and isinstance( mzArray, numpy.ndarray ):
+		keep = numpy.ones( len( mzArray ), bool )
+		if minMz is not None:
+			keep &= mzArray >= minMz
+		if maxMz is not None:
+			keep &= mzArray < maxMz
+		return mzArray[ keep ], intensityArray[ keep ]
+	keep = [ i for i, mz in enumerate( mzArray ) if 
+	         ( minMz is None or mz >= minMz ) and ( maxMz is None or mz < maxMz )]
+	return [ mzArray[ i ] for i in keep ], [ intensityArray[ i ] for i in keep ]
+
+def _decodePeakArgs( args ):
+	"""
+	Internal function. Calls _decodePeaks with a tuple of arguments, for use 
+	with Pool.map_async.
+
+	:Parameters:
+		args : tuple
+			The arguments to _decodePeaks.
+
+	rtype: tuple
+	return: A 2 element tuple ( mzArray, intensityArray )
+	"""
+	return _decodePeaks( *args )
+
+def _decodeArray( text, compressed, dataType, byteOrder, count=-1 ):
+	"""
+	Internal function. Decodes an array of base64 encoded binary values.
+
+	:Parameters:
+		text : str
+			The base64 encoded data, or None if there is no data.
+		compressed : bool
+			Whether the data is zlib compressed.
+		dataType : str
+			The struct format character of the values, e.g. 'f' or 'd'.
+		byteOrder : str
+			The struct byte order character of the values, '<' or '>'.
+		count : int
+			The number of values in the data. Defaults to all of them.
+
+	rtype: list
+	return: The decoded values, see _unpackArray.
+	"""
+	if not text:
+		return _unpackArray( b'', dataType, byteOrder, 0 )
+	packedData = b64decode( text.strip( ))
+	if compressed:
+		packedData = zlib.decompress( packedData )
+	return _unpackArray( packedData, dataType, byteOrder, count )
+
+def _unpackArray( packedData, dataType, byteOrder, count=-1 ):
+	"""
+	Internal function. Unpacks an array of binary values. If USE_NUMPY is set
+	and numpy is available the values are returned as a read only numpy array
+	sharing the memory of packedData, otherwise as a list.
+
+	:Parameters:
+		packedData : bytes
+			The binary data to unpack.
+		dataType : str
+			The struct format character of the values, e.g. 'f' or 'd'.
+		byteOrder : str
+			The struct byte order character of the values, '<' or '>'.
+		count : int
+			The number of values to unpack. Defaults to all of packedData.
+
+	rtype: list
+	return: The unpacked values.
+	"""
+	if USE_NUMPY and numpy:
+		return numpy.frombuffer( packedData, numpy.dtype( byteOrder + dataType ), 
+			count )
+	if count < 0:
+		count = len( packedData ) // struct.calcsize( byteOrder + dataType )
+	return list( struct.unpack( byteOrder + ( dataType * count ), packedData ))
+
+def _binaryScanKeys( scan ):
+	"""
+	Internal function. Finds the keys of a scan which the binary format written
+	by RawData.writeBinary does not store in the ScanTable.
+
+	:Parameters:
+		scan : dict
+			The scan.
 
+	rtype: list
+	return: A 2 element list [ extra, missing ] of a dict of the keys which are
+		not in the ScanTable and a list of the ScanTable keys the scan does not
+		have, or None if there are neither.
+	"""
+	# dict.keys, so that a LazyScan is not decoded
+	keys = dict.keys( scan )
+	extra = dict(( key, scan[ key ]) for key in keys 
+	             if key not in _STANDARD_SCAN_KEYS )
+	missing = [ key for key in _STANDARD_SCAN_KEYS 
+	            if key not in keys and key not in LazyScan.peakKeys ]
+	if extra or missing:
+		return [ extra, missing ]
+	return None
+
+def _jsonDefault( obj ):
+	"""
+	Internal function. Converts objects the json module can not serialize, i.e.
+	numpy arrays and numbers, into ones it can.
+
+	:Parameters:
+		obj : object
+			The object to convert.
+
+	rtype: object
+	return: A list or number.
+	"""
+	if hasattr( obj, 'tolist' ):
+		return obj.tolist( )
+	raise TypeError( "%r is not JSON serializable" % obj )
+
+def _massWindows( masses, tolerance, ppm ):
+	"""
+	Internal function. Converts a list of masses and tolerances to m/z windows.
+
+	:Parameters:
+		masses : list
+			The masses. Each may be an m/z value, or an ( mz, tolerance ) tuple to
+			override the tolerance for that mass.
+		tolerance : float
+			The tolerance on either side of each m/z value.
+		ppm : bool
+			Whether the tolerances are in parts per million of the m/z value rather
+			than m/z units.
+
+	rtype: tuple
+	return: A 2 element tuple ( lows, highs ) of lists of the lowest m/z value of
+		each window and the m/z value above its highest m/z value.
+	"""
+	lows = [ ]
+	highs = [ ]
+	for mass in masses:
+		if isinstance( mass, ( tuple, list )):
+			mz, massTolerance = mass
+		else:
+			mz, massTolerance = mass, tolerance
+		if ppm:
+			massTolerance = mz * massTolerance / 1e6
+		lows.append( mz - massTolerance )
+		highs.append( mz + massTolerance )
+	return lows, highs
+
+def _mergeWindows( lows, highs ):
+	"""
+	Internal function. Merges overlapping m/z windows.
+
+	:Parameters:
+		lows : list
+			The lowest m/z value of each window.
+		highs : list
+			The m/z value above the highest m/z value in each window.
+
+	rtype: tuple
+	return: A 2 element tuple ( lows, highs ) of lists of sorted, disjoint 
+		windows covering the same values.
+	"""
+	mergedLows = [ ]
+	mergedHighs = [ ]
+	for low, high in sorted( zip( lows, highs )):
+		if high <= low:
+			continue
+		if mergedHighs and low <= mergedHighs[ -1 ]:
+			mergedHighs[ -1 ] = max( mergedHighs[ -1 ], high )
+		else:
+			mergedLows.append( low )
+			mergedHighs.append( high )
+	return mergedLows, mergedHighs
+
+def _inWindows( mzArray, lows, highs ):
+	"""
+	Internal function. Tests which m/z values are inside of a set of windows.
+
+	:Parameters:
+		mzArray : numpy.ndarray
+			The m/z values to test, in any order.
+		lows : list
+			The lowest m/z value of each window, sorted, see _mergeWindows.
+		highs : list
+			The m/z value above the highest m/z value in each window.
+
+	rtype: numpy.ndarray
+	return: A boolean array, True for each value inside a window.
+	"""
+	if not len( lows ):
+		return numpy.zeros( len( mzArray ), bool )
+	lows = numpy.asarray( lows, numpy.float64 )
+	highs = numpy.asarray( highs, numpy.float64 )
+	windows = numpy.searchsorted( lows, mzArray, 'right' ) - 1
+	return ( windows >= 0 ) & ( mzArray < highs[ numpy.maximum( windows, 0 )])
+
+def _nanToNone( value ):
+	"""
+	Internal function. Converts NaN, used for missing values in a ScanTable, to 
+	None.
+
+	:Parameters:
+		value : float
+			The value to convert.
+
+	rtype: float
+	return: The value, or None if it is NaN.
+	"""
+	if value != value:
+		return None
+	return value
+
+def _mzMlScanId( nativeId, index=None ):
+	"""
+	Internal function. Converts an mzML spectrum id (nativeID) into an integer
+	scan id.
+
+	:Parameters:
+		nativeId : str
+			The id attribute of the spectrum, e.g. "scan=19".
+		index : int
+			The index attribute of the spectrum, used to number spectra whose 
+			nativeID does not contain a scan number.
+
+	rtype: int
+	return: The scan number from the id, or index + 1. None if neither is
+		available.
+	"""
+	match = re.search( r'\bscan=(\d+)', nativeId )
+	if match:
+		return int( match.group( 1 ))
+	if index is not None:
+		return index + 1
+	return None
+
+def _mzMlSourceFile( sourceFile ):
+	"""
+	Internal function. Gets the location of the file described by an mzML
+	<sourceFile> element.
+
+	:Parameters:
+		sourceFile : Element
+			The <sourceFile> element.
+
+	rtype: str
+	return: The location and name of the source file.
+	"""
+	location = sourceFile.get( 'location', '' )
+	if location and not location.endswith( '/' ):
+		location += '/'
+	return location + sourceFile.get( 'name', '' )
+
+def _cvParams( elem, paramGroups=None ):
+	"""
+	Internal function. Collects the cvParams of an mzML element, including those
+	of any referenceable param groups it refers to.
+
+	:Parameters:
+		elem : Element
+			The element to get the cvParams of. May be None.
+		paramGroups : dict
+			The referenceable param groups of the file, keyed by group id.
+
+	rtype: dict
+	return: A dict mapping the accession of each cvParam to a 2 element tuple
+		( value, unitAccession ).
+	"""
+	params = { }
+	if elem is None:
+		return params
+	for child in elem:
+		tag = _localName( child.tag )
+		if tag == 'cvParam':
+			params[ child.get( 'accession' ) ] = ( child.get( 'value' ), 
+				child.get( 'unitAccession' ))
+		elif tag == 'referenceableParamGroupRef' and paramGroups:
+			params.update( paramGroups.get( child.get( 'ref' ), { }))
+	return params
+
+def _getChildNode( node, *path ):
+	"""
+	Internal function. Finds the descendant of the passed in element following
+	the given path of tag names, ignoring namespaces.
+
+	:Parameters:
+		node : Element
+			An ElementTree element, or None
+		path : str
+			The tag names of each successive child to descend into.
+
+	rtype: Element
+	return: The requested descendant, or None if it does not exist.
+	"""
+	for child in path:
+		if node is None:
+			return None
+		for returnvalue in node:
+			if _localName( returnvalue.tag ) == child:
+				node = returnvalue
+				break
+		else:
+			return None
+	return node
+
+def _localName( tag ):
+	"""
+	Internal function. Strips the namespace from an ElementTree tag name.
+
+	:Parameters:
+		tag : str
+			The tag name, possibly in '{namespace}name' form.
+
+	rtype: str
+	return: The tag name without the namespace.
+	"""
+	if tag[ 0 ] == '{':
+		return tag[ tag.index( '}' ) + 1: ]
+	return tag
+
+def _mzXmlScan( scan, peaks, parentScan ):
+	"""
+	Internal function. Converts an mzXML <scan> element into a scan dict.
+
+	:Parameters:
+		scan : Element
+			The <scan> element. Only its attributes and the children preceding
+			<peaks> are used.
+		peaks : Element
+			The <peaks> element belonging to the scan.
+		parentScan : int
+			The num of the scan enclosing this one, or None.
+
+	rtype: tuple
+	return: A 2 element tuple ( scan, payload ) containing a dict of the scan 
+		metadata and the undecoded peak data, see _decodePeaks.
+	"""
+	collisionEnergy = None
+	precursorMz = None
+	msLevel = int( scan.get( "msLevel" ))
+	scanSize = int( scan.get( 'peaksCount' ))
+	rt = None
+	if scan.get( 'retentionTime' ):
+		rt = float( scan.get( 'retentionTime' )[ 2:-1 ] ) / 60
+	scanId = int( scan.get( 'num' ))
+	lowMz = highMz = None
+	if scan.get( 'lowMz' ):
+		lowMz = float( scan.get( 'lowMz' ))
+	if scan.get( 'highMz' ):
+		highMz = float( scan.get( 'highMz' ))
+	totIonCurrent = None
+	basePeakIntensity = None
+	if scan.get( 'totIonCurrent' ):
+		totIonCurrent = float( scan.get( 'totIonCurrent' ))
+	if scan.get( 'basePeakIntensity' ):
+		basePeakIntensity = float( scan.get( 'basePeakIntensity' ))
+	polarity = None
+	if ( scan.get( 'polarity' ) == '+' ):
+		polarity = 1
+	elif ( scan.get( 'polarity' ) == '-' ):
+		polarity = -1
+	if msLevel == 1:
+		parentScan = None
+	else:
+		if ( scan.get( 'collisionEnergy' )):
+			collisionEnergy = float( scan.get( 'collisionEnergy' ))
+		for child in scan:
+			if _localName( child.tag ) == 'precursorMz':
+				precursorMz = float( child.text.strip( ))
+				if parentScan is None and child.get( 'precursorScanNum' ):
+					parentScan = int( child.get( 'precursorScanNum' ))
+				break
+
+	if peaks.get( 'precision' ) == '64':
+		type_ = 'd'
+	else: 
+		type_ = 'f'
+	byteOrder = '>'
+
+	if not scanSize:
+		packedData = None
+	else:
+		packedData = peaks.text
+	# m/z and intensity values are interleaved, so there is a single array
+	payload = (( packedData, peaks.get( 'compressionType' ) == 'zlib', type_, 
+		byteOrder, scanSize * 2 ),)
+
+	return { 
+		"retentionTime" : rt,
+		"polarity" : polarity, 
+		"msLevel" : msLevel, 
+		"id" : scanId,
+		"mzRange" : [ lowMz, highMz ],
+		"parentScan" : parentScan,
+		"precursorMz" : precursorMz,
+		"collisionEnergy" : collisionEnergy,
+		"totIonCurrent" : totIonCurrent,
+		"basePeakIntensity" : basePeakIntensity
+	}, payload
+
+class LazyScan( dict ):
+	"""
+	A scan dict whose peak data is only decoded the first time 'mzArray' or
+	'intensityArray' is accessed. The scan metadata is available immediately, 
+	and until it is decoded the scan only holds a reference to the encoded peak
+	data from the file. Operations which use all of the items of the dict, such
+	as iterating over it or comparing it, decode the peak data first.
+	"""
+	peakKeys = ( 'mzArray', 'intensityArray' )
+
+	def __init__( self, scan, payload, peakRange=None ):
+		"""
+		:Parameters:
+			scan : dict
+				The scan metadata.
+			payload : tuple
+				The encoded peak data, see _decodePeaks.
+			peakRange : tuple
+				An optional ( minMz, maxMz ) tuple of the m/z range of the peaks to 
+				keep, see _decodePeaks.
+		"""
+		dict.__init__( self, scan )
+		self.payload = payload
+		self.peakRange = peakRange
+
+	def decode( self ):
+		"""
+		Decodes the peak data of the scan, if that has not been done already.
+		"""
+		if self.payload is not None:
+			payload = self.payload
+			self.payload = None
+			self[ 'mzArray' ], self[ 'intensityArray' ] = _decodePeaks( payload,
+				self.peakRange )
+
+	def isDecoded( self ):
+		"""
+		Returns whether the peak data of the scan has been decoded.
+
+		rtype: bool
+		return: True if the peak data has been decoded.
+		"""
+		return self.payload is None
+
+	def __missing__( self, key ):
+		if self.payload is not None and key in self.peakKeys:
+			self.decode( )
+			return dict.__getitem__( self, key )
+		raise KeyError( key )
+
+	def __setitem__( self, key, value ):
+		if self.payload is not None and key in self.peakKeys:
+			self.decode( )
+		dict.__setitem__( self, key, value )
+
+	def __contains__( self, key ):
+		return dict.__contains__( self, key ) or ( 
+			self.payload is not None and key in self.peakKeys )
+
+	def get( self, key, default=None ):
+		if key in self:
+			return self[ key ]
+		return default
+
+	def __deepcopy__( self, memo ):
+		# the payload is immutable, so the copy can share it and stay undecoded.
+		return LazyScan( deepcopy( dict( dict.items( self )), memo ), self.payload,
+			self.peakRange )
+
+def _decodeFirst( method ):
+	"""
+	Internal function. Wraps a dict method so that the peak data of a LazyScan is
+	decoded before it is called.
+
+	:Parameters:
+		method : function
+			The dict method to wrap.
+
+	rtype: function
+	return: The wrapped method.
+	"""
+	def wrapper( self, *args ):
+		self.decode( )
+		return method( self, *args )
+	wrapper.__name__ = method.__name__
+	wrapper.__doc__ = method.__doc__
+	return wrapper
+
+for _name in ( '__iter__', '__len__', '__eq__', '__ne__', '__repr__', 'copy', 
+               'keys', 'values', 'items', 'iterkeys', 'itervalues', 'iteritems',
+               'pop', 'popitem', 'setdefault', 'update' ):
+	if hasattr( dict, _name ):
+		setattr( LazyScan, _name, _decodeFirst( getattr( dict, _name )))
+del _name
+
+
+class RawData( object ):
+
+	# the PeakStore holding the peak data of the scans, see pack( ).
+	_peaks = None
+	# the ScanTable of the scan metadata and the scan list it was built from, 
+	# see scanTable( ).
+	_scanTable = None
+	_scanTableScans = None
+	# the ScanIndex of the scans and the scan list it was built from, see 
+	# scanIndex( ).
+	_scanIndex = None
+	_scanIndexScans = None
+	# incremented each time the data is modified through this class, see 
+	# modified( ).
+	version = 0
+	# the number of calls to tic, bpc, sic, minMz and maxMz answered from the
+	# memo of recent results, and the number computed.
+	memoHits = 0
+	memoMisses = 0
+	# the recent results as a list of ( key, result ) in least recently used 
+	# order, and the version and scan list they were computed from.
+	_memo = None
+	_memoVersion = None
+	_memoScans = None
+
+	def __init__( self, _input=None ):
+		if isinstance( _input, RawData ):
+			# copy the passed in object
+			self.data = deepcopy( _input.data )
+
+		elif type( _input ) == str:
+			# read the passed in file name
+			self.read( _input )
+
+		else:
+			self.data = { 'scans' : [] }
+
+	def getScan( self, retentionTime ):
+		"""
+		Gets a scan from the data by retention time.
+		:Parameters:
+			retentionTime : float
+				A float indicating the retention time of the scan to retrieve. The scan
+				closest to that time is returned.
+
+		rtype: dict
+		return: A dict containing the scan points & metadata
+		"""
+		position = self.scanIndex( ).nearest( retentionTime )
+		if position is None:
+			return None
+		return self.data[ 'scans' ][ position ]
+
+	def getScans( self, minTime=0, maxTime=sys.maxint ):
+		"""
+		Gets the scans in a retention time range.
+
+		:Parameters:
+			minTime : float
+				The minimum retention time of the scans to retrieve.
+			maxTime : float
+				The maximum retention time of the scans to retrieve (exclusive).
+
+		rtype: list
+		return: A list of the scans in the range, in order of retention time.
+		"""
+		scans = self.data[ 'scans' ]
+		return [ scans[ i ] for i in self.scanIndex( ).between( minTime, maxTime )]
+
+	def getScanById( self, scanId ):
+		"""
+		Gets a scan from the data by its id.
+
+		:Parameters:
+			scanId : int
+				The id of the scan as found in the 'id' of the scan dicts.
+
+		rtype: dict
+		return: A dict containing the scan points & metadata, or None if there is
+			no scan with that id.
+		"""
+		position = self.scanIndex( ).ids.get( scanId )
+		if position is None:
+			return None
+		return self.data[ 'scans' ][ position ]
+
+	def getChildScans( self, scanId ):
+		"""
+		Gets the scans whose 'parentScan' is the given scan, e.g. the MS/MS scans
+		of a precursor scan.
+
+		:Parameters:
+			scanId : int
+				The id of the parent scan.
+
+		rtype: list
+		return: A list of the child scans, in the order they appear in the data.
+		"""
+		scans = self.data[ 'scans' ]
+		return [ scans[ i ] for i in self.scanIndex( ).children.get( scanId, [ ])]
+
+	def scanIndex( self ):
+		"""
+		Returns a ScanIndex of the scans, used to look up scans by retention time,
+		id or parent. The index is built on first use and kept until data['scans']
+		is replaced or changes length, so onlyScans and removeScans keep it up to
+		date. Call modified( ) after modifying the scans in place to have it 
+		rebuilt.
+
+		rtype: ScanIndex
+		return: The ScanIndex.
+		"""
+		scans = self.data[ 'scans' ]
+		if ( self._scanIndex is None or self._scanIndexScans is not scans or 
+		     len( self._scanIndex ) != len( scans )):
+			self._scanIndex = ScanIndex( scans )
+			self._scanIndexScans = scans
+		return self._scanIndex
+		
+	def __getitem__( self, value ):	
+		"""
+		Returns a list indicating the sic intensity for each scan in order. Only for
+		level 1 scans - other scans are omitted.
+		:Parameters:
+			value : slice
+				The m/z indices to retrieve intensity values between.
+
+		rtype: list
+		return: A list of intensity values.
+		"""
+		returnvalue = []
+		if type( value ) == slice:
+			if ( value.start ):
+				start = value.start 
+			else:
+				start = 0
+			if ( value.stop ):
+				stop = value.stop 
+			else:
+				stop = 1048576
+			return self.sic( start, stop, 1 )
+		else:
+			return self.sic( value - 0.1, value + 0.1, 1 )
+
+	def __iter__( self ):
+		return iter( self.data['scans'] )
+
+	def removeScans( self, minTime=0, maxTime=sys.maxint ):
+		"""
+		Discards all scans in the given time range.
+
+		:Parameters:
+			minTime : float
+				The minimum retention time for the scans to remove
+			maxTime : float
+				The maximum retention time for the scans to remove
+		"""
+		if minTime < maxTime:
+			table = self.scanTable( )
+			if table is not None:
+				self._keepScans( numpy.flatnonzero( 
+					~table.mask( minTime=minTime, maxTime=maxTime )))
+				return
+			self._keepScans([ i for i, scan in enumerate( self.data[ 'scans' ]) if 
+						scan[ 'retentionTime' ] < minTime or 
+						scan[ 'retentionTime' ] >= maxTime ])
+
+	def onlyScans( self, minTime=0, maxTime=sys.maxint ):
+		"""
+		Keeps only the scans specified in the time range, discarding all others.
+
+		:Parameters:
+			minTime : float
+				The minimum retention time for the scans to remove
+			maxTime : float
+				The maximum retention time for the scans to remove
+		"""
+		if minTime < maxTime:
+			table = self.scanTable( )
+			if table is not None:
+				self._keepScans( table.select( minTime=minTime, maxTime=maxTime ))
+				return
+			self._keepScans([ i for i, scan in enumerate( self.data[ 'scans' ]) if 
+					scan[ 'retentionTime' ] >= minTime and
+					scan[ 'retentionTime' ] < maxTime ])
+
+	def view( self, level=None, polarity=None, minTime=None, maxTime=None,
+	          minPrecursorMz=None, maxPrecursorMz=None ):
+		"""
+		Creates a RawDataView of the scans matching all of the given criteria, 
+		without modifying or copying this object. Criteria which are None are not
+		applied.
+
+		:Parameters:
+			level : int
+				The msLevel of the scans.
+			polarity : int
+				The polarity of the scans, 1 for positive or -1 for negative.
+			minTime : float
+				The minimum retention time of the scans.
+			maxTime : float
+				The maximum retention time of the scans (exclusive).
+			minPrecursorMz : float
+				The minimum precursor m/z of the scans.
+			maxPrecursorMz : float
+				The maximum precursor m/z of the scans (exclusive).
+
+		rtype: RawDataView
+		return: The new view.
+		"""
+		return RawDataView( self ).view( level, polarity, minTime, maxTime, 
+		                                 minPrecursorMz, maxPrecursorMz )
+
+	def _applyCriteria( self, minTime=None, maxTime=None, level=None, 
+	                    polarity=None, minMz=None, maxMz=None ):
+		"""
+		Internal function. Discards the scans and peaks not matching a set of 
+		selection criteria, see iterScans.
+		"""
+		if ( minTime is not None or maxTime is not None or level or 
+		     polarity is not None ):
+			self._keepScans( self.selectScans( level=level or None, polarity=polarity,
+			                                   minTime=minTime, maxTime=maxTime ))
+		if minMz is not None or maxMz is not None:
+			if minMz is None:
+				minMz = float( '-inf' )
+			if maxMz is None:
+				maxMz = float( 'inf' )
+			self._filterMz([ minMz ], [ maxMz ], True )
+
+	def _keepScans( self, indices ):
+		"""
+		Internal function. Discards all scans except those at the given positions.
+
+		:Parameters:
+			indices : list
+				The positions of the scans to keep, in ascending order.
+		"""
+		store = self._peakStore( )
+		table = self.scanTable( )
+		scans = self.data[ 'scans' ]
+		self.data[ 'scans' ] = [ scans[ i ] for i in indices ]
+		if store is not None:
+			self._peaks = store.take( indices )
+		if table is not None:
+			self._scanTable = table.take( indices )
+			self._scanTableScans = self.data[ 'scans' ]
+
+	def removeMz( self,  mz, tolerance=0.1 ):
+		"""
+		Discards all data points with the specified m/z +/- the specified tolerance
+
+		:Parameters:
+			mz : float
+				The m/z value of the mass to be removed from all scans.
+			tolerance : float
+				The tolerance to use for determining if the data point should be removed.
+				Defaults to 0.1.
+		"""
+		self._filterMz([ mz - tolerance ], [ mz + tolerance ], False )
+
+	def onlyMz( self, mz, tolerance=0.1 ):
+		"""
+		Keeps only data points with the specified m/z +/- the specified tolerance,
+		discarding all others.
+
+		:Parameters:
+			mz : float
+				The m/z value of the mass to be retained from all scans.
+			tolerance : float
+				The tolerance to use for determining if the data point should be removed.
+				Defaults to 0.1.
+		"""
+		self._filterMz([ mz - tolerance ], [ mz + tolerance ], True )
+
+	def removeMasses( self, masses, tolerance=0.1, ppm=False ):
+		"""
+		Discards all data points within the tolerance of any of a list of masses,
+		in a single pass over the data.
+
+		:Parameters:
+			masses : list
+				The masses to remove. Each may be an m/z value, or an ( mz, 
+				tolerance ) tuple to override the tolerance for that mass.
+			tolerance : float
+				The tolerance on either side of each m/z value. Data points in the 
+				range [ mz - tolerance, mz + tolerance ) are removed. Defaults to 0.1.
+			ppm : bool
+				Whether the tolerances are in parts per million of the m/z value 
+				rather than m/z units. Defaults to False.
+		"""
+		lows, highs = _massWindows( masses, tolerance, ppm )
+		self._filterMz( lows, highs, False )
+
+	def onlyMasses( self, masses, tolerance=0.1, ppm=False ):
+		"""
+		Keeps only the data points within the tolerance of any of a list of masses,
+		discarding all others, in a single pass over the data.
+
+		:Parameters:
+			masses : list
+				The masses to keep. Each may be an m/z value, or an ( mz, tolerance )
+				tuple to override the tolerance for that mass.
+			tolerance : float
+				The tolerance on either side of each m/z value. Data points in the 
+				range [ mz - tolerance, mz + tolerance ) are kept. Defaults to 0.1.
+			ppm : bool
+				Whether the tolerances are in parts per million of the m/z value 
+				rather than m/z units. Defaults to False.
+		"""
+		lows, highs = _massWindows( masses, tolerance, ppm )
+		self._filterMz( lows, highs, True )
+
+	def _filterMz( self, lows, highs, inside ):
+		"""
+		Internal function. Discards data points by m/z value. The windows are
+		merged into sorted, disjoint ranges and each m/z value is located among 
+		them by binary search.
+
+		:Parameters:
+			lows : list
+				The lowest m/z value of each window.
+			highs : list
+				The m/z value above the highest m/z value in each window.
+			inside : bool
+				True to keep the data points inside the windows, False to keep the 
+				data points outside of them.
+		"""
+		lows, highs = _mergeWindows( lows, highs )
+
+		store = self._peakStore( )
+		if store is not None:
+			keep = _inWindows( store.mzArray, lows, highs )
+			if not inside:
+				keep = ~keep
+			self._setPeakStore( store.filterPeaks( keep ))
+			self._dropHeaderValues( )
+			return
+
+		for scan in self.data[ 'scans' ]:
+			mzArray = scan[ 'mzArray' ]
+			intensityArray = scan[ 'intensityArray' ]
+			if numpy:
+				keep = _inWindows( numpy.asarray( mzArray ), lows, highs )
+				if not inside:
+					keep = ~keep
+				if isinstance( mzArray, numpy.ndarray ):
+					scan[ 'mzArray' ] = mzArray[ keep ]
+					scan[ 'intensityArray' ] = numpy.asarray( intensityArray )[ keep ]
+				else:
+					scan[ 'mzArray' ] = numpy.asarray( mzArray )[ keep ].tolist( )
+					scan[ 'intensityArray' ] = numpy.asarray( intensityArray )[ keep ].tolist( )
+				continue
+			newMz = [ ]
+			newIntensity = [ ]
+			for mz, intensity in zip( mzArray, intensityArray ):
+				i = bisect.bisect_right( lows, mz ) - 1
+				if ( i >= 0 and mz < highs[ i ]) == inside:
+					newMz.append( mz )
+					newIntensity.append( intensity )
+			scan[ 'mzArray' ] = newMz
+			scan[ 'intensityArray' ] = newIntensity
+		self._dropHeaderValues( )
+
+	def _dropHeaderValues( self ):
+		"""
+		Internal function. Clears the values recorded in the scan headers which 
+		describe all of the peaks, after peaks have been removed, so they are 
+		computed from the remaining peaks when needed.
+		"""
+		for scan in self.data[ 'scans' ]:
+			for key in _HEADER_PEAK_KEYS:
+				if scan.get( key ) is not None:
+					scan[ key ] = None
+		table = self._scanTable
+		if table is not None:
+			for key in _HEADER_PEAK_KEYS:
+				table.table[ key ] = numpy.nan
+
+	def sic( self, start=0, stop=1048576, level=1 ):
+		"""
+		Returns a list indicating the selected intensity for each scan in order. 
+		:Parameters:
+			start : float
+				The m/z indices to retrieve intensity values higher than or equal to.
+			stop : float
+				The m/z indecies to retrieve intensity values less than.
+			level : int
+				The msLevel of the scans to get intensity values for. A value of 0 
+				uses all scans.
+
+		rtype: list
+		return: A list of intensity values.
+		"""
+		store = self._peakStore( )
+		if store is not None:
+			return store.sums( self._levelIndices( level ), start, stop ).tolist( )
+
+		returnvalue = self._extract([ start ], [ stop ], level )[ 0 ]
+		if numpy:
+			return returnvalue.tolist( )
+		return returnvalue
+
+	def xic( self, targets, tolerance=0.1, ppm=False, level=1 ):
+		"""
+		Returns the extracted ion chromatograms of many masses at once. Each scan 
+		is visited once for all of the masses, and the window of each mass is
+		located by binary search in the 'mzArray' of the scan, which is expected
+		to be sorted.
+
+		:Parameters:
+			targets : list
+				The masses to extract. Each may be an m/z value, or an ( mz, 
+				tolerance ) tuple to override the tolerance for that mass.
+			tolerance : float
+				The tolerance on either side of each m/z value. Intensity values in 
+				the range [ mz - tolerance, mz + tolerance ) are summed. Defaults 
+				to 0.1.
+			ppm : bool
+				Whether the tolerances are in parts per million of the m/z value 
+				rather than m/z units. Defaults to False.
+			level : int
+				The msLevel of the scans to get intensity values for. A value of 0 
+				uses all scans. Defaults to 1.
+
+		rtype: numpy.ndarray
+		return: A 2 dimensional array with a row for each target and a column for
+			each scan, or a list of lists if numpy is not available.
+		"""
+		lows, highs = _massWindows( targets, tolerance, ppm )
+		return self._extract( lows, highs, level )
+
+	def _extract( self, lows, highs, level ):
+		"""
+		Internal function. Sums the intensity values in a set of m/z windows for 
+		each scan, see xic( ).
+
+		:Parameters:
+			lows : list
+				The lowest m/z value of each window.
+			highs : list
+				The m/z value above the highest m/z value in each window.
+			level : int
+				The msLevel of the scans to use. A value of 0 uses all scans.
+
+		rtype: numpy.ndarray
+		return: A 2 dimensional array with a row for each window and a column for
+			each scan, or a list of lists if numpy is not available.
+		"""
+		scans = self.data[ 'scans' ]
+		indices = self._levelIndices( level )
+
+		if not numpy:
+			returnvalue = [[ ] for low in lows ]
+			for i in indices:
+				mzArray = scans[ i ][ 'mzArray' ]
+				intensityArray = scans[ i ][ 'intensityArray' ]
+				if any( a > b for a, b in zip( mzArray, mzArray[ 1: ])):
+					mzArray, intensityArray = zip( *sorted( zip( mzArray, 
+						intensityArray )))
+				for row, low, high in zip( returnvalue, lows, highs ):
+					row.append( sum( intensityArray[ 
+						bisect.bisect_left( mzArray, low ):bisect.bisect_left( mzArray, high )]))
+			return returnvalue
+
+		lows = numpy.asarray( lows, numpy.float64 )
+		highs = numpy.asarray( highs, numpy.float64 )
+		returnvalue = numpy.zeros(( len( lows ), len( indices )), numpy.float64 )
+		# the start and stop of each window, interleaved for reduceat
+		boundaries = numpy.empty( 2 * len( lows ), numpy.intp )
+		for column, i in enumerate( indices ):
+			mzArray = numpy.asarray( scans[ i ][ 'mzArray' ])
+			intensityArray = numpy.asarray( scans[ i ][ 'intensityArray' ], 
+				numpy.float64 )
+			if not len( mzArray ):
+				continue
+			if ( mzArray[ 1: ] < mzArray[ :-1 ]).any( ):
+				order = numpy.argsort( mzArray, kind='mergesort' )
+				mzArray = mzArray[ order ]
+				intensityArray = intensityArray[ order ]
+			boundaries[ 0::2 ] = numpy.searchsorted( mzArray, lows )
+			boundaries[ 1::2 ] = numpy.searchsorted( mzArray, highs )
+			# reduceat sums between successive boundaries, and an index equal to
+			# the array length needs a value to point to.
+			sums = numpy.add.reduceat( numpy.append( intensityArray, 0 ), 
+				boundaries )[ 0::2 ]
+			sums[ boundaries[ 0::2 ] >= boundaries[ 1::2 ]] = 0
+			returnvalue[ :, column ] = sums
+		return returnvalue
+
+	def tic( self, level=1, fromHeaders=False ):
+		"""
+		Returns a list indicating the total intensity for each scan in order. 
+		:Parameters:
+			level : int
+				The msLevel of the scans to get intensity values for. A value of 0 
+				uses all scans.
+			fromHeaders : bool
+				If True, use the total ion current recorded in the scan header 
+				('totIonCurrent') where the file has one, so the peak data of those
+				scans is not used. Lazily read scans are not decoded. The recorded
+				value may be rounded. Defaults to False.
+
+		rtype: list
+		return: A list of intensity values.
+		"""
+		if fromHeaders:
+			return self._headerValues( 'totIonCurrent', level, 
+				lambda scan: sum( scan[ 'intensityArray' ]))
+
+		store = self._peakStore( )
+		if store is not None:
+			return store.sums( self._levelIndices( level )).tolist( )
+
+		scans = self.data[ 'scans' ]
+		return [ sum( scans[ i ][ 'intensityArray' ]) 
+		         for i in self._levelIndices( level )]
+
+	def bpc( self, level=1, fromHeaders=False ):
+		"""
+		Returns a list indicating the base intensity for each scan in order. 
+		:Parameters:
+			level : int
+				The msLevel of the scans to get intensity values for. A value of 0
+				uses all scans
+			fromHeaders : bool
+				If True, use the base peak intensity recorded in the scan header 
+				('basePeakIntensity') where the file has one, so the peak data of 
+				those scans is not used. Lazily read scans are not decoded. Defaults
+				to False.
+
+		rtype: list
+		return: A list of intensity values.
+		"""
+		if fromHeaders:
+			return self._headerValues( 'basePeakIntensity', level, 
+				lambda scan: self.max_( scan[ 'intensityArray' ]))
+
+		store = self._peakStore( )
+		if store is not None:
+			return store.maxima( self._levelIndices( level )).tolist( )
+
+		scans = self.data[ 'scans' ]
+		try: 
+			return [ self.max_( scans[ i ][ 'intensityArray' ]) 
+			         for i in self._levelIndices( level )]
+		except ValueError:
+			return 0;
+
+	def _headerValues( self, key, level, compute ):
+		"""
+		Internal function. Collects a value recorded in the scan headers, 
+		computing it from the peak data for scans which don't have it.
+
+		:Parameters:
+			key : str
+				The scan key of the value, e.g. 'totIonCurrent'
+			level : int
+				The msLevel of the scans to use. A value of 0 uses all scans.
+			compute : function
+				A function computing the value from a scan dict.
+
+		rtype: list
+		return: The value for each scan.
+		"""
+		scans = self.data[ 'scans' ]
+		returnvalue = [ ]
+		for i in self._levelIndices( level ):
+			value = scans[ i ].get( key )
+			if value is None:
+				value = compute( scans[ i ])
+			returnvalue.append( value )
+		return returnvalue
+
+	def _levelIndices( self, level ):
+		"""
+		Internal function. Finds the positions of the scans of a given msLevel,
+		using the ScanTable if numpy is available.
+
+		:Parameters:
+			level : int
+				The msLevel of the scans to find. A value of 0 finds all scans.
+
+		rtype: list
+		return: The positions of the scans in data['scans'].
+		"""
+		table = self.scanTable( )
+		if table is not None:
+			return table.select( level=level or None )
+		return [ i for i, scan in enumerate( self.data[ 'scans' ]) 
+		         if not level or scan[ 'msLevel' ] == level ]
+
+	def scanTable( self, rebuild=False ):
+		"""
+		Returns a ScanTable of the metadata of the scans, which can be used to
+		select scans without looping over them. The table is built on first use and
+		kept until data['scans'] is replaced or changes length, so it must be 
+		rebuilt after modifying the metadata of a scan in place. Requires numpy.
+
+		:Parameters:
+			rebuild : bool
+				Whether to rebuild the table even if the scans appear unchanged.
+
+		rtype: ScanTable
+		return: The ScanTable, or None if numpy is not available.
+		"""
+		if not numpy:
+			return None
+		scans = self.data[ 'scans' ]
+		if ( rebuild or self._scanTable is None or 
+		     self._scanTableScans is not scans or 
+		     len( self._scanTable ) != len( scans )):
+			self._scanTable = ScanTable.fromScans( scans )
+			self._scanTableScans = scans
+		return self._scanTable
+
+	def selectScans( self, level=None, polarity=None, minTime=None, maxTime=None,
+	                 minPrecursorMz=None, maxPrecursorMz=None ):
+		"""
+		Finds the scans matching all of the given criteria. Criteria which are None
+		are not applied.
+
+		:Parameters:
+			level : int
+				The msLevel of the scans.
+			polarity : int
+				The polarity of the scans, 1 for positive or -1 for negative.
+			minTime : float
+				The minimum retention time of the scans.
+			maxTime : float
+				The maximum retention time of the scans (exclusive).
+			minPrecursorMz : float
+				The minimum precursor m/z of the scans.
+			maxPrecursorMz : float
+				The maximum precursor m/z of the scans (exclusive).
+
+		rtype: list
+		return: The positions of the matching scans in data['scans'], as a numpy
+			array if numpy is available.
+		"""
+		table = self.scanTable( )
+		if table is not None:
+			return table.select( level, polarity, minTime, maxTime, minPrecursorMz,
+			                     maxPrecursorMz )
+
+		returnvalue = []
+		for i, scan in enumerate( self.data[ 'scans' ]):
+			rt = scan[ 'retentionTime' ]
+			precursorMz = scan[ 'precursorMz' ]
+			if (( level is None or scan[ 'msLevel' ] == level ) and
+			    ( polarity is None or scan[ 'polarity' ] == polarity ) and
+			    ( minTime is None or ( rt is not None and rt >= minTime )) and
+			    ( maxTime is None or ( rt is not None and rt < maxTime )) and
+			    ( minPrecursorMz is None or 
+			      ( precursorMz is not None and precursorMz >= minPrecursorMz )) and
+			    ( maxPrecursorMz is None or 
+			      ( precursorMz is not None and precursorMz < maxPrecursorMz ))):
+				returnvalue.append( i )
+		return returnvalue
+
+	def pack( self ):
+		"""
+		Moves the peak data of all scans into a PeakStore, which holds the m/z and
+		intensity values of every scan in two contiguous arrays. The 'mzArray' and
+		'intensityArray' of each scan become views of the store, and tic, bpc, 
+		sic, removeMz and onlyMz work directly on the contiguous arrays. Assigning
+		new peak arrays to a scan, or adding or removing scans other than through
+		the methods of this class, stops the store being used. Requires numpy.
+
+		rtype: PeakStore
+		return: The new PeakStore.
+		"""
+		# materialize the scans of objects which read them on demand
+		self.data[ 'scans' ] = list( self.data[ 'scans' ])
+		store = PeakStore.fromScans( self.data[ 'scans' ])
+		self._setPeakStore( store )
+		return store
+
+	def buildMzIndex( self ):
+		"""
+		Creates an MzIndex of all of the peaks in the data, for extracting ion
+		chromatograms without visiting every scan. The index is a snapshot and is
+		not updated when the data is modified. Requires numpy.
+
+		rtype: MzIndex
+		return: The new MzIndex.
+		"""
+		return MzIndex.fromRawData( self )
+
+	def buildTileIndex( self, rtTiles=100, mzTiles=100, level=1 ):
+		"""
+		Creates a TileIndex of the peaks in the data, for region queries and 
+		heatmaps over retention time and m/z. The index is a snapshot and is not 
+		updated when the data is modified. Requires numpy.
+
+		:Parameters:
+			rtTiles : int
+				The number of tiles to divide the retention time range into. 
+				Defaults to 100.
+			mzTiles : int
+				The number of tiles to divide the m/z range into. Defaults to 100.
+			level : int
+				The msLevel of the scans to index. A value of 0 indexes all scans.
+				Defaults to 1.
+
+		rtype: TileIndex
+		return: The new TileIndex.
+		"""
+		return TileIndex.fromRawData( self, rtTiles, mzTiles, level )
+
+	def modified( self ):
+		"""
+		Marks the data as modified, so that remembered results of tic, bpc, sic,
+		minMz and maxMz and the scan indexes are not reused. The methods of this 
+		class which modify the data call this automatically; call it after 
+		modifying scans directly.
+		"""
+		self.version += 1
+		self._scanTable = None
+		self._scanIndex = None
+
+	def clearMemo( self ):
+		"""
+		Forgets the remembered results of tic, bpc, sic, minMz and maxMz and
+		resets memoHits and memoMisses.
+		"""
+		self._memo = None
+		self.memoHits = 0
+		self.memoMisses = 0
+
+	def isPacked( self ):
+		"""
+		Returns whether the peak data is held in a PeakStore, see pack( ).
+
+		rtype: bool
+		return: True if the peak data is held in a PeakStore.
+		"""
+		return self._peakStore( ) is not None
+
+	def _peakStore( self ):
+		"""
+		Internal function. Returns the PeakStore holding the peak data, after 
+		checking that the scans still use it.
+
+		rtype: PeakStore
+		return: The PeakStore, or None if the data is not packed.
+		"""
+		store = self._peaks
+		if store is None:
+			return None
+		scans = self.data[ 'scans' ]
+		if len( scans ) != len( store ):
+			self._peaks = None
+			return None
+		for scan, ( mzArray, intensityArray ) in zip( scans, store.views ):
+			if ( dict.get( scan, 'mzArray' ) is not mzArray or 
+			     dict.get( scan, 'intensityArray' ) is not intensityArray ):
+				self._peaks = None
+				return None
+		return store
+
+	def _setPeakStore( self, store ):
+		"""
+		Internal function. Makes the scans use the given PeakStore for their peak
+		data.
+
+		:Parameters:
+			store : PeakStore
+				A PeakStore with an entry for each scan.
+		"""
+		for scan, ( mzArray, intensityArray ) in zip( self.data[ 'scans' ], store.views ):
+			scan[ 'mzArray' ] = mzArray
+			scan[ 'intensityArray' ] = intensityArray
+		self._peaks = store
+
+	def minMz( self ):
+		"""
+		Returns the minimum mz value in the data.
+
+		rtype: float
+		return: A float containing the min mz in the data.
+		"""
+		return min([ x[ 'mzRange' ][ 0 ] for x in self.data[ 'scans' ]
+		             if x[ 'mzRange' ][ 0 ] is not None ])
+
+	def maxMz( self ):
+		"""
+		Returns the maximum mz value in the data.
+
+		rtype: float
+		return: A float containing the max mz in the data.
+		"""
+		return ( max([ x[ 'mzRange' ][ 1 ] for x in self.data[ 'scans' ]
+		               if x[ 'mzRange' ][ 1 ] is not None ]))
+
+
+	def max_( self, sequence ):
+		if len( sequence ):
+			return max( sequence )
+		else:
+			return 0;
+
+
+	def read( self, filename, workers=None, lazy=False, cache=None, **criteria ):
+		"""
+		Load a file into this reference. This method will automatically detect the
+		file type based on the file extension. If caching is enabled and the file
+		has been read before, a binary snapshot of the parsed data is loaded 
+		instead, see DataCache.
+
+		:Parameters:
+			filename : str
+				The name of the file to load.
+			workers : int
+				The number of worker processes to decode the peak data with, or a
+				multiprocessing Pool or ThreadPool to use. Only used for the xml
+				formats. Defaults to decoding in this process.
+			lazy : bool
+				If True, the peak data of each scan is only decoded when its 
+				'mzArray' or 'intensityArray' is first accessed, see LazyScan. Only
+				used for the xml formats. Defaults to False.
+			cache : DataCache
+				The cache of parsed data to use. Defaults to a DataCache in CACHE_DIR
+				if it is set, otherwise no cache is used. The whole file is parsed and
+				added to the cache when it is missing, and the selection criteria
+				are applied afterwards.
+			criteria : keywords
+				Optional selection criteria, see iterScans. Without a cache, for the
+				xml and csv formats, scans which do not match are skipped before 
+				their peak data is decoded; otherwise they are applied after the file
+				has been read.
+
+		"""
+	
+		if not os.path.exists( filename ):
+			raise IOError( "The file %s does not exist or is not readable" % filename )
+
+		if cache is None and CACHE_DIR and numpy:
+			cache = DataCache( CACHE_DIR, CACHE_SIZE )
+		if cache is not None and not filename.lower( ).endswith( ".mzbin" ):
+			if cache.load( self, filename ):
+				self._applyCriteria( **criteria )
+				return True
+			returnvalue = self._read( filename, workers, lazy )
+			if returnvalue:
+				cache.store( self, filename )
+				self._applyCriteria( **criteria )
+			return returnvalue
+
+		return self._read( filename, workers, lazy, **criteria )
+
+	def _read( self, filename, workers=None, lazy=False, **criteria ):
+		"""
+		Internal function. Loads a file by its file extension, see read( ).
+		"""
+		if ( filename.lower( ).endswith( ".csv" ) or 
+		     filename.lower( ).endswith( ".csv.gz" )):
+			return self.readCsv( filename, **criteria )
+
+		elif ( filename.lower( ).endswith( ".mzdata" ) or 
+		       filename.lower( ).endswith( ".mzdata.xml" ) or
+		       filename.lower( ).endswith( ".mzdata.gz" ) or 
+		       filename.lower( ).endswith( ".mzdata.xml.gz" )):
+			return self.readMzData( filename, workers, lazy, **criteria )
+
+		elif filename.lower( ).endswith( ".mzxml" ):
+			return self.readMzXml( filename, workers, lazy, **criteria )
+
+		elif filename.lower( ).endswith( ".mzml" ):
+			return self.readMzMl( filename, workers, lazy, **criteria )
+
+		elif filename.lower( ).endswith( ".json" ):
+			return self.readJson( filename, **criteria )
+
+		elif filename.lower( ).endswith( ".json.gz" ):
+			return self.readJsonGz( filename, **criteria )
+
+		elif filename.lower( ).endswith( ".mzbin" ):
+			return self.readBinary( filename, **criteria )
+
+		else:
+			sys.stderr.write( "Unrecognized file type for %s\n" % filename )
+			return False
+
+	def readCsv( self, filename, **criteria ):
+		"""
+		Read a file in Agilent csv format. The file is read line by line, see 
+		iterCsv.
+
+		:Parameters:
+			filename : str
+				The name of the file to load.
+			criteria : keywords
+				Optional selection criteria, see iterScans. Rows which do not match
+				are skipped before their peak data is parsed.
+
+		rtype: bool
+		return: True if the file was read.
+		"""
+		self.data = { "scans" : [] }
+		info = { }
+		try:
+			for scan in iterCsv( filename, info, **criteria ):
+				self.data[ "scans" ].append( scan )
+		except IOError:
+			sys.stderr.write( "Error: unable to read file '%s'\n" % filename )
+			return False
+		except ValueError:
+			sys.stderr.write( "Unable to parse the reference file '%s'\n" % filename ) 
+			return False
+		self.data[ 'sourceFile' ] = info.get( 'sourceFile' )
+		return True
+
+	def readMzData( self, filename, workers=None, lazy=False, **criteria ):
+		"""
+		Read a file in mzData format. The file is parsed incrementally, see
+		iterMzData.
+
+		:Parameters:
+			filename : str
+				The name of the file to load.
+			workers : int
+				The number of worker processes to decode the peak data with, or a
+				multiprocessing Pool or ThreadPool to use. Defaults to decoding in
+				this process.
+			lazy : bool
+				If True, the peak data of each scan is only decoded when its 'mzArray'
+				or 'intensityArray' is first accessed, see LazyScan. Defaults to False.
+			criteria : keywords
+				Optional selection criteria, see iterScans. Scans which do not match
+				are skipped before their peak data is decoded.
+
+		"""
+		self.data = { "scans" : [] }
+		info = { }
+		for scan in iterMzData( filename, info, workers, lazy, **criteria ):
+			self.data[ "scans" ].append( scan )
+		self.data[ 'sourceFile' ] = info.get( 'sourceFile' )
+		return True
+
+	def readMzXml( self, filename, workers=None, lazy=False, **criteria ):
+		"""
+		Read a file in mzXML format. The file is parsed incrementally, see
+		iterMzXml.
+
+		:Parameters:
+			filename : str
+				The name of the file to load.
+			workers : int
+				The number of worker processes to decode the peak data with, or a
+				multiprocessing Pool or ThreadPool to use. Defaults to decoding in
+				this process.
+			lazy : bool
+				If True, the peak data of each scan is only decoded when its 'mzArray'
+				or 'intensityArray' is first accessed, see LazyScan. Defaults to False.
+			criteria : keywords
+				Optional selection criteria, see iterScans. Scans which do not match
+				are skipped before their peak data is decoded.
+
+		"""
+		self.data = { "scans" : [] }
+		info = { }
+		for scan in iterMzXml( filename, info, workers, lazy, **criteria ):
+			self.data[ "scans" ].append( scan )
+		self.data[ 'sourceFile' ] = info.get( 'sourceFile' )
+		return True
+
+
+	def readMzMl( self, filename, workers=None, lazy=False, **criteria ):
+		"""
+		Read a file in mzML format. The file is parsed incrementally, see
+		iterMzMl. For random access to the spectra of an indexed mzML file use
+		IndexedMzMl instead.
+
+		:Parameters:
+			filename : str
+				The name of the file to load.
+			workers : int
+				The number of worker processes to decode the peak data with, or a
+				multiprocessing Pool or ThreadPool to use. Defaults to decoding in
+				this process.
+			lazy : bool
+				If True, the peak data of each scan is only decoded when its 'mzArray'
+				or 'intensityArray' is first accessed, see LazyScan. Defaults to False.
+			criteria : keywords
+				Optional selection criteria, see iterScans. Scans which do not match
+				are skipped before their peak data is decoded.
+
+		"""
+		self.data = { "scans" : [] }
+		info = { }
+		for scan in iterMzMl( filename, info, workers, lazy, **criteria ):
+			self.data[ "scans" ].append( scan )
+		self.data[ 'sourceFile' ] = info.get( 'sourceFile' )
+		return True
+
+
+	def readJson( self, filename, **criteria ):
+		"""
+		Reads ms data from a file containing gzipped JSON data. No checks are done, 
+		so make sure the data is of the same format as that produced by this 
+		library, otherwise, unpredictable things may happen. This method may not be
+		supported on versions of python prior to 2.5.
+		:Parameters:
+			filename : string
+				The name of a file containing gzip compressed JSON data
+			criteria : keywords
+				Optional selection criteria, see iterScans. They are applied after 
+				the file has been read.
+		"""
+		if not json:
+			raise NotImplementedError( "This method is not supported in your version of Python" )
+		in_ = open( filename, 'r' )
+		self.data = json.load( in_ )
+		in_.close( )
+		self._applyCriteria( **criteria )
+		return True
+
+	def readJsonGz( self, filename, **criteria ):
+		"""
+		Reads ms data from a file containing gzipped JSON data. No checks are done, 
+		so make sure the data is of the same format as that produced by this 
+		library, otherwise, unpredictable things may happen. This method may not be
+		supported on versions of python prior to 2.5.
+		:Parameters:
+			filename : string
+				The name of a file containing gzip compressed JSON data
+			criteria : keywords
+				Optional selection criteria, see iterScans. They are applied after 
+				the file has been read.
+		"""
+		if not json:
+			raise NotImplementedError( "This method is not supported in your version of Python" )
+		in_ = gzip.open( filename, 'r' )
+		self.data = json.load( in_ )
+		in_.close( )
+		self._applyCriteria( **criteria )
+		return True
+
+	def readBinary( self, filename, **criteria ):
+		"""
+		Reads ms data from a file written by writeBinary. The file is memory mapped
+		rather than read, so the peak data of a scan is only loaded from disk when
+		it is used. The peak arrays are copy on write views of the file, and the
+		data is packed into a PeakStore, see pack( ). Requires numpy.
+
+		:Parameters:
+			filename : string
+				The name of the file to read.
+			criteria : keywords
+				Optional selection criteria, see iterScans. They are applied after 
+				the file has been read.
+
+		rtype: bool
+		return: True if the read was successful.
+		"""
+		if not numpy:
+			raise NotImplementedError( "This method requires numpy" )
+		in_ = open( filename, 'rb' )
+		header = in_.read( _BINARY_HEADER.size )
+		in_.close( )
+		if ( len( header ) < _BINARY_HEADER.size or 
+		     header[ :len( _BINARY_MAGIC ) ] != _BINARY_MAGIC ):
+			raise IOError( "%s is not a binary ms data file" % filename )
+		( magic, version, reserved, scanCount, peakCount, tableOffset, 
+		  startsOffset, stopsOffset, mzOffset, intensityOffset, infoOffset,
+		  infoLength ) = _BINARY_HEADER.unpack( header )
+		if version > _BINARY_VERSION:
+			raise IOError( "%s was written by a newer version of this library" % 
+				filename )
+
+		mapped = numpy.memmap( filename, numpy.uint8, 'c' )
+		def view( offset, dtype, count ):
+			dtype = numpy.dtype( dtype )
+			return mapped[ offset:offset + dtype.itemsize * count ].view( dtype )
+
+		info = json.loads( mapped[ infoOffset:infoOffset + infoLength ].tostring( 
+			).decode( 'utf-8' ))
+		table = view( tableOffset, ScanTable.binaryDtype( version ), scanCount )
+		if version < _BINARY_VERSION:
+			# older tables lack some fields, which are filled in as missing
+			full = numpy.empty( scanCount, ScanTable.dtype )
+			full[ 'totIonCurrent' ] = full[ 'basePeakIntensity' ] = numpy.nan
+			for name in table.dtype.names:
+				full[ name ] = table[ name ]
+			table = full
+		table = ScanTable( table )
+		store = PeakStore( view( mzOffset, '<f8', peakCount ), 
+		                   view( intensityOffset, '<f8', peakCount ),
+		                   view( startsOffset, '<i8', scanCount ),
+		                   view( stopsOffset, '<i8', scanCount ))
+
+		scanKeys = info.pop( _BINARY_SCAN_KEYS, None )
+		self.data = info
+		self.data[ 'scans' ] = table.scans( )
+		if scanKeys:
+			for scan, keys in zip( self.data[ 'scans' ], scanKeys ):
+				if keys:
+					extra, missing = keys
+					scan.update( extra )
+					for key in missing:
+						del scan[ key ]
+		self._setPeakStore( store )
+		self._scanTable = table
+		self._scanTableScans = self.data[ 'scans' ]
+		self._applyCriteria( **criteria )
+		return True
+
+	def write( self, filename ):
+		"""
+		Load a file into this reference. This method will automatically detect the
+		file type based on the file extension.
+
+		:Parameters:
+			filename : str
+				The name of the file to load.
+
+		"""
+	
+		if filename.lower( ).endswith( ".csv" ):
+			return self.writeCsv( filename )
+
+		elif filename.lower( ).endswith( ".csv.gz" ):
+			return self.writeCsvGz( filename )
+
+		elif ( filename.lower( ).endswith( ".mzdata" ) or 
+		       filename.lower( ).endswith( ".mzdata.xml" ) or
+		       filename.lower( ).endswith( ".mzdata.gz" ) or 
+		       filename.lower( ).endswith( ".mzdata.xml.gz" )):
+			return self.writeMzData( filename )
+
+		elif filename.lower( ).endswith( ".mzxml" ):
+			return self.writeMzXml( filename )
+
+		elif filename.lower( ).endswith( ".mzml" ):
+			return self.writeMzMl( filename )
+
+		elif filename.lower( ).endswith( ".json" ):
+			return self.writeJson( filename )
+
+		elif filename.lower( ).endswith( ".json.gz" ):
+			return self.writeJsonGz( filename )
+
+		elif filename.lower( ).endswith( ".mzbin" ):
+			return self.writeBinary( filename )
+
+		else:
+			sys.stderr.write( "Unrecognized file type for %s\n" % filename )
+			return False
+
+	def writeCsv( self, filename ):
+		"""
+		Writes the data in Agilent csv format. Scans with an msLevel above 1 are 
+		left out, as the format does not support them.
+
+		:Parameters:
+			filename : string
+				The name of the file to write to.
+
+		rtype: bool
+		return: True if the write succeeded
+		"""
+		out = open( filename, 'w', 1 << 20 )
+		try:
+			self._writeCsv( out )
+		finally:
+			out.close( )
+		return True
+
+	def writeCsvGz( self, filename, compressionLevel=6 ):
+		"""
+		Writes the data in Agilent csv format, compressed with gzip as it is 
+		written, see writeCsv.
+
+		:Parameters:
+			filename : string
+				The name of the file to write to.
+			compressionLevel : int
+				Compression level to use - 0 for least compression, 9 for most.
+				Defaults to 6.
+
+		rtype: bool
+		return: True if the write succeeded
+		"""
+		out = gzip.open( filename, 'wb', compressionLevel )
+		try:
+			self._writeCsv( out )
+		finally:
+			out.close( )
+		return True
+
+	def _writeCsv( self, out ):
+		"""
+		Internal function. Writes the data in Agilent csv format to an open file,
+		one write per scan.
+
+		:Parameters:
+			out : file
+				The file object to write to.
+		"""
+		# collect the header values in a single pass over the scan metadata
+		scans = [ ]
+		minRt = minMz = float( 'inf' )
+		maxRt = maxMz = float( '-inf' )
+		for scan in self.data[ 'scans' ]:
+			if scan[ 'msLevel' ] > 1:
+				continue
+			scans.append( scan )
+			rt = scan[ 'retentionTime' ]
+			lowMz, highMz = scan[ 'mzRange' ]
+			minRt, maxRt = min( minRt, rt ), max( maxRt, rt )
+			if lowMz is not None:
+				minMz = min( minMz, lowMz )
+			if highMz is not None:
+				maxMz = max( maxMz, highMz )
+		if len( scans ) < len( self.data[ 'scans' ]):
+			print( "Agilent CSV format does not support multimensional data, ignoring scans with level > 1" )
+		if not scans:
+			minRt = maxRt = 0
+		if minMz > maxMz:
+			minMz = maxMz = 0
+
+		out.write( "[data source]\n" )
+		out.write( "file name,%s\n" % self.data[ 'sourceFile' ] )
+		out.write( "[filters]\n" )
+		out.write( "mass range,%f,%f\n" % ( minMz, maxMz ))
+		out.write( "time range,%f,%f\n" % ( minRt, maxRt ))
+		out.write( "number of spectra,%d\n" % len( scans ))
+		out.write( "[format]\n" )
+		out.write( "retention time, sample, period, experiment, polarity, scan type, points, x1, y1, x2, y2, ...\n" )
+		out.write( "[spectra]\n" )
+		for scan in scans:
+			out.write( _csvRow( scan ))
+
+	def writeMzData( self, filename, intensityPrecision=64 ):
+		"""
+		Writes the data in mzData format, see writeMzData. If the file name ends 
+		with .gz the output is compressed with gzip.
+
+		:Parameters:
+			filename : str
+				The name of the file to write to.
+			intensityPrecision : int
+				The precision of the intensity values written, 32 or 64. Defaults 
+				to 64.
+
+		rtype: bool
+		return: True if the write succeeded
+		"""
+		return writeMzData( filename, self.data[ 'scans' ], intensityPrecision )
+
+	def writeMzXml( self, filename, precision=64, compressionLevel=6 ):
+		"""
+		Writes the data in indexed mzXML format, see writeMzXml.
+
+		:Parameters:
+			filename : str
+				The name of the file to write to.
+			precision : int
+				The precision of the peak data written, 32 or 64. Defaults to 64.
+			compressionLevel : int
+				The zlib compression level to compress the peak data with - 1 for 
+				least compression, 9 for most, or 0 to write it uncompressed. 
+				Defaults to 6.
+
+		rtype: bool
+		return: True if the write succeeded
+		"""
+		return writeMzXml( filename, self.data[ 'scans' ], 
+			self.data.get( 'sourceFile' ), precision, compressionLevel )
+
+	writeMzXML = writeMzXml
+
+	def writeMzMl( self, filename, intensityPrecision=64, compressionLevel=6 ):
+		"""
+		Writes the data in indexedmzML format, see writeMzMl.
+
+		:Parameters:
+			filename : str
+				The name of the file to write to.
+			intensityPrecision : int
+				The precision of the intensity values written, 32 or 64. Defaults 
+				to 64.
+			compressionLevel : int
+				The zlib compression level to compress the binary data arrays with - 
+				1 for least compression, 9 for most, or 0 to write them 
+				uncompressed. Defaults to 6.
+
+		rtype: bool
+		return: True if the write succeeded
+		"""
+		return writeMzMl( filename, self.data[ 'scans' ], 
+			self.data.get( 'sourceFile' ), intensityPrecision, compressionLevel )
+
+	writeMzML = writeMzMl
+
+	def writeJson( self, filename, indent=None ):
+		"""
+		Dumps the data to a JSON array.
+		:Parameters:
+			maData : dict
+				A dictionary object containing scan data, normally returned from
+			filename : string
+				The name of the file to write to.
+			indent : int
+				Level to indent for pretty-printing, or None for no pretty-print.
+				Defaults to None
+		"""
+		if not json:
+			raise NotImplementedError( "This method is not supported in your version of Python" )
+		if( indent ):
+			sep = (', ',': ')
+		else:
+			sep = (',',':')
+		out = open( filename, 'w' )
+		json.dump( self.data, out, indent=indent, separators=sep, 
+			default=_jsonDefault )
+		out.close( )
+
+	def writeJsonGz( self, filename, indent=None, compressionLevel=6 ):
+		"""
+		Dumps the data to a JSON array, compressed with zlib.
+		:Parameters:
+			maData : dict
+				A dictionary object containing scan data, normally returned from
+			filename : string
+				The name of the file to write to.
+			indent : int
+				Level to indent for pretty-printing, or None for no pretty-print.
+				Defaults to None
+			compressionLevel : int
+				Compression level to use - 0 for least compression, 9 for most.
+				Defaults to 6.
+		"""
+		if( indent ):
+			sep = (', ',': ')
+		else:
+			sep = (',',':')
+		out = gzip.open( filename, 'wb', compressionLevel )
+		out.write( json.dumps( self.data, indent=indent, separators=sep, 
+			default=_jsonDefault ))
+		out.close( )
+
+	def writeBinary( self, filename ):
+		"""
+		Writes the data to a binary file which can be memory mapped by readBinary.
+		The file holds the scan metadata as a ScanTable and the peak data of all 
+		scans as contiguous arrays, see PeakStore. Any other scan keys are stored
+		with the file metadata, and must have values which can be written as JSON.
+		Requires numpy.
+
+		:Parameters:
+			filename : string
+				The name of the file to write to.
+
+		rtype: bool
+		return: True if the write was successful.
+		"""
+		if not numpy:
+			raise NotImplementedError( "This method requires numpy" )
+		store = self._peakStore( )
+		if store is None:
+			store = PeakStore.fromScans( self.data[ 'scans' ])
+		elif ( store.stops - store.starts ).sum( ) != len( store.mzArray ):
+			store = store.compact( )
+		table = self.scanTable( ).table.astype( ScanTable.binaryDtype( ))
+		info = dict(( key, value ) for key, value in self.data.items( ) 
+		            if key != 'scans' )
+		scanKeys = [ _binaryScanKeys( scan ) for scan in self.data[ 'scans' ]]
+		if any( scanKeys ):
+			info[ _BINARY_SCAN_KEYS ] = scanKeys
+		info = json.dumps( info, default=_jsonDefault ).encode( 'utf-8' )
+
+		sections = [ table.tobytes( ),
+		             store.starts.astype( '<i8' ).tobytes( ),
+		             store.stops.astype( '<i8' ).tobytes( ),
+		             store.mzArray.astype( '<f8' ).tobytes( ),
+		             store.intensityArray.astype( '<f8' ).tobytes( ),
+		             info ]
+		# lay the sections out after the header, aligned to 8 bytes.
+		offsets = []
+		offset = _BINARY_HEADER.size
+		for section in sections:
+			offset += -offset % 8
+			offsets.append( offset )
+			offset += len( section )
+
+		out = open( filename, 'wb' )
+		out.write( _BINARY_HEADER.pack( _BINARY_MAGIC, _BINARY_VERSION, 0, 
+			len( table ), len( store.mzArray ), *( offsets + [ len( info )])))
+		position = _BINARY_HEADER.size
+		for offset, section in zip( offsets, sections ):
+			out.write( b'\x00' * ( offset - position ))
+			out.write( section )
+			position = offset + len( section )
+		out.close( )
+		return True
+
+def _memoized( method ):
+	"""
+	Internal function. Wraps a RawData method so that its recent results are 
+	remembered, keyed by the method and its arguments. The remembered results 
+	are discarded when the version of the object changes or data['scans'] is
+	replaced. Copies of list and array results are returned so the remembered
+	results can't be modified.
+
+	:Parameters:
+		method : function
+			The method to wrap.
+
+	rtype: function
+	return: The wrapped method.
+	"""
+	name = method.__name__
+	def wrapper( self, *args, **kwargs ):
+		if not MEMO_SIZE:
+			return method( self, *args, **kwargs )
+		scans = self.data[ 'scans' ]
+		if ( self._memo is None or self._memoVersion != self.version or 
+		     self._memoScans is not scans ):
+			self._memo = [ ]
+			self._memoVersion = self.version
+			self._memoScans = scans
+		key = ( name, args, sorted( kwargs.items( )))
+		for i, ( entryKey, result ) in enumerate( self._memo ):
+			if entryKey == key:
+				self.memoHits += 1
+				# move the entry to the most recently used end
+				self._memo.append( self._memo.pop( i ))
+				break
+		else:
+			self.memoMisses += 1
+			result = method( self, *args, **kwargs )
+			self._memo.append(( key, result ))
+			del self._memo[ :-MEMO_SIZE ]
+		if isinstance( result, list ):
+			return list( result )
+		if numpy and isinstance( result, numpy.ndarray ):
+			return result.copy( )
+		return result
+	wrapper.__name__ = name
+	wrapper.__doc__ = method.__doc__
+	return wrapper
+
+def _modifies( method ):
+	"""
+	Internal function. Wraps a RawData method so that the version of the object
+	is incremented after it is called. The scan indexes are not discarded, as 
+	the methods replace data['scans'] rather than modifying it.
+
+	:Parameters:
+		method : function
+			The method to wrap.
+
+	rtype: function
+	return: The wrapped method.
+	"""
+	def wrapper( self, *args, **kwargs ):
+		try:
+			return method( self, *args, **kwargs )
+		finally:
+			self.version += 1
+	wrapper.__name__ = method.__name__
+	wrapper.__doc__ = method.__doc__
+	return wrapper
+
+for _name in ( 'tic', 'bpc', 'sic', 'minMz', 'maxMz' ):
+	setattr( RawData, _name, _memoized( RawData.__dict__[ _name ]))
+for _name in ( 'removeScans', 'onlyScans', 'removeMz', 'onlyMz', 
+               'removeMasses', 'onlyMasses', 'readCsv', 
+               'readMzData', 'readMzXml', 'readMzMl', 'readJson', 'readJsonGz', 
+               'readBinary' ):
+	setattr( RawData, _name, _modifies( RawData.__dict__[ _name ]))
+del _name
+
+
+class RawDataView( object ):
+	"""
+	A filtered, read only view of a RawData object. A view holds a list of scan 
+	criteria and m/z filters rather than any data, so any number of views can
+	share one RawData object. Each query selects the matching scans of the 
+	RawData object and applies the m/z filters to a temporary copy of their 
+	peak data, which is discarded afterwards. Views reflect later changes to the
+	RawData object. Use materialize( ) to get an independent RawData object.
+
+	Views support iteration, tic, bpc, sic, xic, minMz, maxMz, getScan, 
+	getScans, getScanById, getChildScans, selectScans, buildMzIndex, 
+	buildTileIndex, slicing by m/z and the write methods of RawData.
+	"""
+
+	def __init__( self, source, scanCriteria=( ), mzFilters=( )):
+		"""
+		:Parameters:
+			source : RawData
+				The data to view.
+			scanCriteria : tuple
+				A tuple of dicts of criteria for RawData.selectScans. Scans must match
+				all of them.
+			mzFilters : tuple
+				A tuple of ( lows, highs, inside ) m/z filters, see 
+				RawData._filterMz, applied in order.
+		"""
+		if isinstance( source, RawDataView ):
+			scanCriteria = source.scanCriteria + tuple( scanCriteria )
+			mzFilters = source.mzFilters + tuple( mzFilters )
+			source = source.source
+		self.source = source
+		self.scanCriteria = tuple( scanCriteria )
+		self.mzFilters = tuple( mzFilters )
+		# the result of positions( ), and the version and scan list of the source
+		# it was computed from
+		self._positions = None
+		self._positionsKey = None
+		self._positionsScans = None
+
+	def view( self, level=None, polarity=None, minTime=None, maxTime=None,
+	          minPrecursorMz=None, maxPrecursorMz=None ):
+		"""
+		Creates a view of the scans in this view matching all of the given 
+		criteria, see RawData.view.
+
+		rtype: RawDataView
+		return: The new view.
+		"""
+		criteria = dict(( key, value ) for key, value in ( 
+			( 'level', level ), ( 'polarity', polarity ), ( 'minTime', minTime ),
+			( 'maxTime', maxTime ), ( 'minPrecursorMz', minPrecursorMz ),
+			( 'maxPrecursorMz', maxPrecursorMz )) if value is not None )
+		if not criteria:
+			return RawDataView( self )
+		return RawDataView( self, scanCriteria=( criteria, ))
+
+	def withMasses( self, masses, tolerance=0.1, ppm=False ):
+		"""
+		Creates a view containing only the data points of this view within the
+		tolerance of any of a list of masses, see RawData.onlyMasses.
+
+		rtype: RawDataView
+		return: The new view.
+		"""
+		lows, highs = _massWindows( masses, tolerance, ppm )
+		return RawDataView( self, mzFilters=(( lows, highs, True ), ))
+
+	def withoutMasses( self, masses, tolerance=0.1, ppm=False ):
+		"""
+		Creates a view without the data points of this view within the tolerance
+		of any of a list of masses, see RawData.removeMasses.
+
+		rtype: RawDataView
+		return: The new view.
+		"""
+		lows, highs = _massWindows( masses, tolerance, ppm )
+		return RawDataView( self, mzFilters=(( lows, highs, False ), ))
+
+	def positions( self ):
+		"""
+		Finds the scans of the underlying RawData object which are in this view.
+		The result is kept until the RawData object is modified.
+
+		rtype: list
+		return: The positions of the scans in the data['scans'] of the RawData
+			object, as a numpy array if numpy is available.
+		"""
+		scans = self.source.data[ 'scans' ]
+		key = ( self.source.version, len( scans ))
+		if ( self._positions is None or self._positionsKey != key or 
+		     self._positionsScans is not scans ):
+			positions = None
+			for criteria in self.scanCriteria:
+				selected = self.source.selectScans( **criteria )
+				if positions is None:
+					positions = selected
+				elif numpy:
+					positions = numpy.intersect1d( positions, selected )
+				else:
+					selected = set( selected )
+					positions = [ i for i in positions if i in selected ]
+			if positions is None:
+				positions = range( len( scans ))
+				if numpy:
+					positions = numpy.arange( len( scans ))
+			self._positions = positions
+			self._positionsKey = key
+			self._positionsScans = scans
+		return self._positions
+
+	def __len__( self ):
+		return len( self.positions( ))
+
+	def __iter__( self ):
+		scans = self.source.data[ 'scans' ]
+		for i in self.positions( ):
+			scan = scans[ i ]
+			if self.mzFilters:
+				transient = RawData( )
+				transient.data = { 'scans' : [ scan.copy( )]}
+				for lows, highs, inside in self.mzFilters:
+					transient._filterMz( lows, highs, inside )
+				scan = transient.data[ 'scans' ][ 0 ]
+			yield scan
+
+	def materialize( self ):
+		"""
+		Creates an independent RawData object containing a copy of the data in 
+		this view.
+
+		rtype: RawData
+		return: The new RawData object.
+		"""
+		return RawData( self._transient( ))
+
+	def _transient( self ):
+		"""
+		Internal function. Creates a temporary RawData object containing the data
+		in this view. The scans of the underlying RawData object are shared if 
+		there are no m/z filters, and the m/z filters are applied to shallow 
+		copies of the scans otherwise.
+
+		rtype: RawData
+		return: The temporary RawData object.
+		"""
+		source = self.source
+		positions = self.positions( )
+		scans = source.data[ 'scans' ]
+		if self.mzFilters:
+			selected = [ scans[ i ].copy( ) for i in positions ]
+		else:
+			selected = [ scans[ i ] for i in positions ]
+
+		transient = RawData( )
+		transient.data = dict(( key, value ) for key, value in source.data.items( )
+		                      if key != 'scans' )
+		transient.data[ 'scans' ] = selected
+		store = source._peakStore( )
+		if store is not None:
+			transient._peaks = store.take( positions )
+		table = source.scanTable( )
+		if table is not None:
+			transient._scanTable = table.take( positions )
+			transient._scanTableScans = selected
+		for lows, highs, inside in self.mzFilters:
+			transient._filterMz( lows, highs, inside )
+		return transient
+
+def _onTransient( method ):
+	"""
+	Internal function. Wraps a RawData method so that it can be called on a 
+	RawDataView, by calling it on a temporary RawData object containing the data
+	in the view.
+
+	:Parameters:
+		method : function
+			The RawData method to wrap.
+
+	rtype: function
+	return: The wrapped method.
+	"""
+	def wrapper( self, *args, **kwargs ):
+		return method( self._transient( ), *args, **kwargs )
+	wrapper.__name__ = method.__name__
+	wrapper.__doc__ = method.__doc__
+	return wrapper
+
+for _name in ( 'tic', 'bpc', 'sic', 'xic', 'minMz', 'maxMz', 'getScan', 
+               'getScans', 'getScanById', 'getChildScans', 'selectScans', 
+               'buildMzIndex', 'buildTileIndex', '__getitem__', 'write', 
+               'writeCsv', 'writeCsvGz', 'writeMzData', 'writeMzXml', 
+               'writeMzMl', 'writeJson', 'writeJsonGz', 'writeBinary' ):
+	setattr( RawDataView, _name, _onTransient( RawData.__dict__[ _name ]))
+del _name
+
+
+class MzIndex( object ):
+	"""
+	A run wide index of peaks sorted by m/z. Each peak carries the position of
+	its scan and its intensity, so the peaks in an m/z window are found by 
+	binary search in O( log N + hits ), however many scans the run has. The 
+	retention time and msLevel of each scan are kept to select scans and build
+	chromatograms. The index can be written to a file and memory mapped back 
+	with MzIndex.read. Requires numpy.
+	"""
+
+	def __init__( self, mzArray, intensityArray, scanPositions, retentionTimes,
+	              msLevels ):
+		"""
+		:Parameters:
+			mzArray : numpy.ndarray
+				The m/z value of each peak, in ascending order.
+			intensityArray : numpy.ndarray
+				The intensity value of each peak.
+			scanPositions : numpy.ndarray
+				The position in the scan list of the scan of each peak.
+			retentionTimes : numpy.ndarray
+				The retention time of each scan, NaN if it is missing.
+			msLevels : numpy.ndarray
+				The msLevel of each scan.
+		"""
+		if not numpy:
+			raise NotImplementedError( "This class requires numpy" )
+		self.mzArray = mzArray
+		self.intensityArray = intensityArray
+		self.scanPositions = scanPositions
+		self.retentionTimes = retentionTimes
+		self.msLevels = msLevels
+
+	@classmethod
+	def fromRawData( cls, rawData ):
+		"""
+		Creates an MzIndex of all of the peaks in a RawData object.
+
+		:Parameters:
+			rawData : RawData
+				The data to index.
+
+		rtype: MzIndex
+		return: The new MzIndex.
+		"""
+		if not numpy:
+			raise NotImplementedError( "This class requires numpy" )
+		store = rawData._peakStore( )
+		if store is None:
+			store = PeakStore.fromScans( rawData.data[ 'scans' ])
+		else:
+			store = store.compact( )
+		table = rawData.scanTable( )
+		scanPositions = numpy.repeat( 
+			numpy.arange( len( store ), dtype=numpy.int32 ), store.stops - store.starts )
+		order = numpy.argsort( store.mzArray, kind='mergesort' )
+		return cls( store.mzArray[ order ], store.intensityArray[ order ], 
+		            scanPositions[ order ], table[ 'retentionTime' ].astype( numpy.float64 ),
+		            table[ 'msLevel' ].astype( numpy.int32 ))
+
+	@classmethod
+	def read( cls, filename ):
+		"""
+		Memory maps an index written by write( ). Only the parts of the index used
+		by queries are loaded from disk.
+
+		:Parameters:
+			filename : str
+				The name of the file to read.
+
+		rtype: MzIndex
+		return: The MzIndex.
+		"""
+		if not numpy:
+			raise NotImplementedError( "This class requires numpy" )
+		in_ = open( filename, 'rb' )
+		header = in_.read( _MZINDEX_HEADER.size )
+		in_.close( )
+		if ( len( header ) < _MZINDEX_HEADER.size or 
+		     header[ :len( _MZINDEX_MAGIC ) ] != _MZINDEX_MAGIC ):
+			raise IOError( "%s is not an m/z index file" % filename )
+		magic, version, reserved, peakCount, scanCount = _MZINDEX_HEADER.unpack( 
+			header )
+		if version > _MZINDEX_VERSION:
+			raise IOError( "%s was written by a newer version of this library" % 
+				filename )
+
+		mapped = numpy.memmap( filename, numpy.uint8, 'r' )
+		arrays = [ ]
+		offset = _MZINDEX_HEADER.size
+		for dtype, count in cls._layout( peakCount, scanCount ):
+			size = numpy.dtype( dtype ).itemsize * count
+			arrays.append( mapped[ offset:offset + size ].view( dtype ))
+			offset += size
+		mzArray, intensityArray, retentionTimes, scanPositions, msLevels = arrays
+		return cls( mzArray, intensityArray, scanPositions, retentionTimes, 
+		            msLevels )
+
+	def write( self, filename ):
+		"""
+		Writes the index to a file, see read( ).
+
+		:Parameters:
+			filename : str
+				The name of the file to write to.
+		"""
+		out = open( filename, 'wb' )
+		out.write( _MZINDEX_HEADER.pack( _MZINDEX_MAGIC, _MZINDEX_VERSION, 0,
+			len( self.mzArray ), len( self.retentionTimes )))
+		arrays = ( self.mzArray, self.intensityArray, self.retentionTimes, 
+		           self.scanPositions, self.msLevels )
+		for array, ( dtype, count ) in zip( arrays, 
+		    self._layout( len( self.mzArray ), len( self.retentionTimes ))):
+			out.write( numpy.asarray( array ).astype( dtype ).tobytes( ))
+		out.close( )
+
+	@staticmethod
+	def _layout( peakCount, scanCount ):
+		"""
+		Internal function. Returns the type and length of each array in the file
+		format, in the order they are stored. Keeping the 8 byte types first keeps
+		every array aligned.
+
+		rtype: list
+		return: A list of ( dtype, count ) tuples.
+		"""
+		return [( '<f8', peakCount ), ( '<f8', peakCount ), ( '<f8', scanCount ),
+		        ( '<i4', peakCount ), ( '<i4', scanCount )]
+
+	def __len__( self ):
+		return len( self.mzArray )
+
+	def peaks( self, low, high ):
+		"""
+		Finds the peaks in an m/z window.
+
+		:Parameters:
+			low : float
+				The lowest m/z value of the window.
+			high : float
+				The m/z value above the highest m/z value in the window.
+
+		rtype: tuple
+		return: A 3 element tuple ( scanPositions, mzArray, intensityArray ) of 
+			the peaks in the window, in order of m/z.
+		"""
+		start = numpy.searchsorted( self.mzArray, low )
+		stop = numpy.searchsorted( self.mzArray, high )
+		return ( self.scanPositions[ start:stop ], self.mzArray[ start:stop ], 
+		         self.intensityArray[ start:stop ])
+
+	def chromatogram( self, mz, tolerance=0.1, ppm=False, level=1, minTime=None, 
+	                  maxTime=None ):
+		"""
+		Returns the extracted ion chromatogram of a mass.
+
+		:Parameters:
+			mz : float
+				The m/z value to extract.
+			tolerance : float
+				The tolerance on either side of the m/z value. Intensity values in
+				the range [ mz - tolerance, mz + tolerance ) are summed. Defaults to
+				0.1.
+			ppm : bool
+				Whether the tolerance is in parts per million of the m/z value rather
+				than m/z units. Defaults to False.
+			level : int
+				The msLevel of the scans to use. A value of 0 uses all scans. 
+				Defaults to 1.
+			minTime : float
+				The minimum retention time of the scans to use.
+			maxTime : float
+				The maximum retention time of the scans to use (exclusive).
+
+		rtype: tuple
+		return: A 2 element tuple ( retentionTimes, intensities ) of arrays with
+			an entry for each selected scan, in scan order.
+		"""
+		if ppm:
+			tolerance = mz * tolerance / 1e6
+		scanPositions, mzArray, intensityArray = self.peaks( mz - tolerance, 
+		                                                      mz + tolerance )
+		selected = numpy.ones( len( self.retentionTimes ), bool )
+		with numpy.errstate( invalid='ignore' ):
+			if level:
+				selected &= self.msLevels == level
+			if minTime is not None:
+				selected &= self.retentionTimes >= minTime
+			if maxTime is not None:
+				selected &= self.retentionTimes < maxTime
+		intensities = numpy.bincount( scanPositions, weights=intensityArray,
+			minlength=len( self.retentionTimes )).astype( numpy.float64 )
+		return self.retentionTimes[ selected ], intensities[ selected ]
+
+
+class TileIndex( object ):
+	"""
+	A 2 dimensional index of peaks over retention time and m/z. The retention
+	time and m/z ranges of the data are divided into a grid of equal sized 
+	tiles, the peaks are stored grouped by tile, and the maximum intensity, 
+	total intensity and number of peaks of each tile are kept. A rectangle 
+	query only visits the tiles it overlaps, and heatmaps at any zoom level are
+	built from the tile summaries without visiting the peaks. Scans without a 
+	retention time are not indexed. Requires numpy.
+	"""
+
+	def __init__( self, rtEdges, mzEdges, tileStarts, retentionTimes, mzArray, 
+	              intensityArray, scanPositions ):
+		"""
+		:Parameters:
+			rtEdges : numpy.ndarray
+				The retention time boundaries of the tile rows.
+			mzEdges : numpy.ndarray
+				The m/z boundaries of the tile columns.
+			tileStarts : numpy.ndarray
+				The position of the first peak of each tile in the peak arrays, in
+				row major order, followed by the number of peaks.
+			retentionTimes : numpy.ndarray
+				The retention time of each peak.
+			mzArray : numpy.ndarray
+				The m/z value of each peak.
+			intensityArray : numpy.ndarray
+				The intensity value of each peak.
+			scanPositions : numpy.ndarray
+				The position in the scan list of the scan of each peak.
+		"""
+		if not numpy:
+			raise NotImplementedError( "This class requires numpy" )
+		self.rtEdges = rtEdges
+		self.mzEdges = mzEdges
+		self.tileStarts = tileStarts
+		self.retentionTimes = retentionTimes
+		self.mzArray = mzArray
+		self.intensityArray = intensityArray
+		self.scanPositions = scanPositions
+		shape = ( len( rtEdges ) - 1, len( mzEdges ) - 1 )
+		counts = numpy.diff( tileStarts )
+		self.tileCount = counts.reshape( shape )
+		used = counts > 0
+		boundaries = tileStarts[ :-1 ][ used ]
+		self.tileSum = numpy.zeros( len( counts ), numpy.float64 )
+		self.tileMax = numpy.zeros( len( counts ), numpy.float64 )
+		if len( boundaries ):
+			self.tileSum[ used ] = numpy.add.reduceat( intensityArray, boundaries )
+			self.tileMax[ used ] = numpy.maximum.reduceat( intensityArray, boundaries )
+		self.tileSum = self.tileSum.reshape( shape )
+		self.tileMax = self.tileMax.reshape( shape )
+
+	@classmethod
+	def fromRawData( cls, rawData, rtTiles=100, mzTiles=100, level=1 ):
+		"""
+		Creates a TileIndex of the peaks in a RawData object.
+
+		:Parameters:
+			rawData : RawData
+				The data to index.
+			rtTiles : int
+				The number of tiles to divide the retention time range into. 
+				Defaults to 100.
+			mzTiles : int
+				The number of tiles to divide the m/z range into. Defaults to 100.
+			level : int
+				The msLevel of the scans to index. A value of 0 indexes all scans.
+				Defaults to 1.
+
+		rtype: TileIndex
+		return: The new TileIndex.
+		"""
+		if not numpy:
+			raise NotImplementedError( "This class requires numpy" )
+		table = rawData.scanTable( )
+		store = rawData._peakStore( )
+		if store is None:
+			store = PeakStore.fromScans( rawData.data[ 'scans' ])
+		rt = table[ 'retentionTime' ]
+		positions = table.select( level=level or None )
+		positions = positions[ ~numpy.isnan( rt[ positions ])]
+		store = store.take( positions ).compact( )
+		counts = store.stops - store.starts
+		scanPositions = numpy.repeat( positions.astype( numpy.int32 ), counts )
+		retentionTimes = numpy.repeat( rt[ positions ].astype( numpy.float64 ), counts )
+		mzArray = store.mzArray
+		intensityArray = store.intensityArray
+
+		if len( mzArray ):
+			rtEdges = cls._edges( retentionTimes.min( ), retentionTimes.max( ), rtTiles )
+			mzEdges = cls._edges( mzArray.min( ), mzArray.max( ), mzTiles )
+		else:
+			rtEdges = cls._edges( 0, 0, rtTiles )
+			mzEdges = cls._edges( 0, 0, mzTiles )
+		tiles = ( cls._bins( rtEdges, retentionTimes ) * mzTiles + 
+		          cls._bins( mzEdges, mzArray ))
+		order = numpy.lexsort(( mzArray, tiles ))
+		tileStarts = numpy.searchsorted( tiles[ order ], 
+			numpy.arange( rtTiles * mzTiles + 1 ))
+		return cls( rtEdges, mzEdges, tileStarts, retentionTimes[ order ], 
+		            mzArray[ order ], intensityArray[ order ], scanPositions[ order ])
+
+	@staticmethod
+	def _edges( low, high, tiles ):
+		"""
+		Internal function. Divides a range into equal sized tiles.
+
+		rtype: numpy.ndarray
+		return: The tiles + 1 boundaries of the tiles.
+		"""
+		if high <= low:
+			high = low + 1
+		return numpy.linspace( low, high, tiles + 1 )
+
+	@staticmethod
+	def _bins( edges, values ):
+		"""
+		Internal function. Finds the tile containing each value. Values outside of
+		the edges are put in the first or last tile.
+
+		rtype: numpy.ndarray
+		return: The tile number of each value.
+		"""
+		bins = numpy.searchsorted( edges, values, 'right' ) - 1
+		return numpy.clip( bins, 0, len( edges ) - 2 )
+
+	def __len__( self ):
+		return len( self.mzArray )
+
+	def region( self, minTime=None, maxTime=None, minMz=None, maxMz=None ):
+		"""
+		Finds the peaks in a retention time and m/z rectangle. Bounds which are 
+		None are not applied.
+
+		:Parameters:
+			minTime : float
+				The minimum retention time of the peaks.
+			maxTime : float
+				The maximum retention time of the peaks (exclusive).
+			minMz : float
+				The minimum m/z value of the peaks.
+			maxMz : float
+				The maximum m/z value of the peaks (exclusive).
+
+		rtype: tuple
+		return: A 4 element tuple ( scanPositions, retentionTimes, mzArray, 
+			intensityArray ) of arrays of the peaks in the rectangle, grouped by
+			tile.
+		"""
+		rows, columns = self._tileRange( minTime, maxTime, minMz, maxMz )
+		mzTiles = len( self.mzEdges ) - 1
+		# the tiles of a row are stored contiguously, so each row is one slice.
+		slices = [ slice( self.tileStarts[ row * mzTiles + columns.start ], 
+		                  self.tileStarts[ row * mzTiles + columns.stop ])
+		           for row in range( rows.start, rows.stop )]
+		if slices:
+			selected = numpy.concatenate([ numpy.arange( s.start, s.stop ) 
+			                               for s in slices ])
+		else:
+			selected = numpy.empty( 0, numpy.intp )
+		retentionTimes = self.retentionTimes[ selected ]
+		mzArray = self.mzArray[ selected ]
+		keep = numpy.ones( len( selected ), bool )
+		if minTime is not None:
+			keep &= retentionTimes >= minTime
+		if maxTime is not None:
+			keep &= retentionTimes < maxTime
+		if minMz is not None:
+			keep &= mzArray >= minMz
+		if maxMz is not None:
+			keep &= mzArray < maxMz
+		selected = selected[ keep ]
+		return ( self.scanPositions[ selected ], retentionTimes[ keep ], 
+		         mzArray[ keep ], self.intensityArray[ selected ])
+
+	def heatmap( self, minTime=None, maxTime=None, minMz=None, maxMz=None, 
+	             rtFactor=1, mzFactor=1, statistic='max' ):
+		"""
+		Returns a grid of the tile summaries over a retention time and m/z 
+		rectangle, for drawing heatmaps. The grid covers every tile overlapping the
+		rectangle, and can be coarsened by combining blocks of tiles for zoomed 
+		out views.
+
+		:Parameters:
+			minTime : float
+				The minimum retention time of the rectangle.
+			maxTime : float
+				The maximum retention time of the rectangle.
+			minMz : float
+				The minimum m/z value of the rectangle.
+			maxMz : float
+				The maximum m/z value of the rectangle.
+			rtFactor : int
+				The number of tile rows to combine into each row of the grid.
+			mzFactor : int
+				The number of tile columns to combine into each column of the grid.
+			statistic : str
+				'max' for the maximum intensity, 'sum' for the total intensity or
+				'count' for the number of peaks. Defaults to 'max'.
+
+		rtype: tuple
+		return: A 3 element tuple ( rtEdges, mzEdges, grid ) of the boundaries of
+			the rows and columns of the grid and the grid itself.
+		"""
+		if statistic == 'max':
+			values, ufunc = self.tileMax, numpy.maximum
+		elif statistic == 'sum':
+			values, ufunc = self.tileSum, numpy.add
+		elif statistic == 'count':
+			values, ufunc = self.tileCount, numpy.add
+		else:
+			raise ValueError( "Unknown statistic '%s'" % statistic )
+		rows, columns = self._tileRange( minTime, maxTime, minMz, maxMz )
+		grid = values[ rows, columns ]
+		rtEdges = self.rtEdges[ rows.start:rows.stop + 1 ]
+		mzEdges = self.mzEdges[ columns.start:columns.stop + 1 ]
+		if grid.size:
+			grid = ufunc.reduceat( grid, numpy.arange( 0, grid.shape[ 0 ], rtFactor ),
+			                       axis=0 )
+			grid = ufunc.reduceat( grid, numpy.arange( 0, grid.shape[ 1 ], mzFactor ),
+			                       axis=1 )
+		rtEdges = numpy.append( rtEdges[ :-1:rtFactor ], rtEdges[ -1: ])
+		mzEdges = numpy.append( mzEdges[ :-1:mzFactor ], mzEdges[ -1: ])
+		return rtEdges, mzEdges, grid
+
+	def _tileRange( self, minTime, maxTime, minMz, maxMz ):
+		"""
+		Internal function. Finds the tiles overlapping a rectangle.
+
+		rtype: tuple
+		return: A 2 element tuple ( rows, columns ) of slices.
+		"""
+		return ( self._edgeRange( self.rtEdges, minTime, maxTime ),
+		         self._edgeRange( self.mzEdges, minMz, maxMz ))
+
+	@staticmethod
+	def _edgeRange( edges, low, high ):
+		"""
+		Internal function. Finds the tiles overlapping a range along one axis.
+
+		rtype: slice
+		return: The tile numbers.
+		"""
+		tiles = len( edges ) - 1
+		start = 0
+		stop = tiles
+		if low is not None:
+			# values on the top edge are in the last tile, see _bins
+			start = min( max( numpy.searchsorted( edges, low, 'right' ) - 1, 0 ), 
+			             max( tiles - 1, 0 ))
+		if high is not None:
+			stop = min( numpy.searchsorted( edges, high, 'left' ), tiles )
+		return slice( int( start ), int( max( start, stop )))
+
+
+class ScanIndex( object ):
+	"""
+	Lookup tables for a list of scans: the positions of the scans sorted by 
+	retention time, for bisection, a dict of the position of each scan by id, 
+	and a dict of the positions of the child scans of each scan by parent id.
+	Scans without a retention time are left out of the retention time index.
+	"""
+
+	def __init__( self, scans ):
+		"""
+		:Parameters:
+			scans : iterable
+				The scan dicts to index.
+		"""
+		self.ids = { }
+		self.children = { }
+		timed = [ ]
+		count = 0
+		for position, scan in enumerate( scans ):
+			count += 1
+			rt = scan.get( 'retentionTime' )
+			if rt is not None:
+				timed.append(( rt, position ))
+			scanId = scan.get( 'id' )
+			if scanId is not None and scanId not in self.ids:
+				self.ids[ scanId ] = position
+			parentScan = scan.get( 'parentScan' )
+			if parentScan is not None:
+				self.children.setdefault( parentScan, [ ]).append( position )
+		timed.sort( )
+		self.count = count
+		self.times = [ rt for rt, position in timed ]
+		self.positions = [ position for rt, position in timed ]
+
+	def __len__( self ):
+		return self.count
+
+	def nearest( self, retentionTime ):
+		"""
+		Finds the scan closest to a retention time. If two scans are equally 
+		close, the earlier one is returned.
+
+		:Parameters:
+			retentionTime : float
+				The retention time to look for.
+
+		rtype: int
+		return: The position of the scan, or None if no scan has a retention 
+			time.
+		"""
+		times = self.times
+		if not times:
+			return None
+		i = bisect.bisect_left( times, retentionTime )
+		if i == len( times ) or ( i > 0 and 
+		   retentionTime - times[ i - 1 ] <= times[ i ] - retentionTime ):
+			# use the first scan with the lower retention time
+			i = bisect.bisect_left( times, times[ i - 1 ])
+		return self.positions[ i ]
+
+	def between( self, minTime, maxTime ):
+		"""
+		Finds the scans in a retention time range.
+
+		:Parameters:
+			minTime : float
+				The minimum retention time of the scans.
+			maxTime : float
+				The maximum retention time of the scans (exclusive).
+
+		rtype: list
+		return: The positions of the scans, in order of retention time.
+		"""
+		return self.positions[ bisect.bisect_left( self.times, minTime ):
+		                       bisect.bisect_left( self.times, maxTime )]
+
+
+class PeakStore( object ):
+	"""
+	Columnar storage for the peak data of a list of scans. The m/z and intensity
+	values of all of the scans are held in two contiguous numpy arrays, and the
+	peaks of the i'th scan are mzArray[ starts[ i ]:stops[ i ]] and 
+	intensityArray[ starts[ i ]:stops[ i ]]. Scans are laid out in order and do
+	not overlap, but there may be unused values between them after scans have
+	been discarded with take( ). Requires numpy.
+	"""
+
+	def __init__( self, mzArray, intensityArray, starts, stops ):
+		"""
+		:Parameters:
+			mzArray : numpy.ndarray
+				The m/z values of all of the scans.
+			intensityArray : numpy.ndarray
+				The intensity values of all of the scans.
+			starts : sequence
+				The position of the first value of each scan in the arrays.
+			stops : sequence
+				The position after the last value of each scan in the arrays.
+		"""
+		if not numpy:
+			raise NotImplementedError( "This class requires numpy" )
+		self.mzArray = mzArray
+		self.intensityArray = intensityArray
+		self.starts = numpy.asarray( starts, numpy.intp )
+		self.stops = numpy.asarray( stops, numpy.intp )
+		# the per scan views handed out to the scan dicts.
+		self.views = [( mzArray[ start:stop ], intensityArray[ start:stop ]) 
+		               for start, stop in zip( self.starts, self.stops )]
+
+	@classmethod
+	def fromScans( cls, scans ):
+		"""
+		Creates a PeakStore from the 'mzArray' and 'intensityArray' of a sequence
+		of scans. The scans themselves are not modified.
+
+		:Parameters:
+			scans : iterable
+				The scan dicts to copy the peak data of.
+
+		rtype: PeakStore
+		return: A new PeakStore with an entry for each scan.
+		"""
+		if not numpy:
+			raise NotImplementedError( "This class requires numpy" )
+		mzArrays = [ ]
+		intensityArrays = [ ]
+		for scan in scans:
+			mzArrays.append( numpy.asarray( scan[ 'mzArray' ], numpy.float64 ))
+			intensityArrays.append( numpy.asarray( scan[ 'intensityArray' ], 
+				numpy.float64 ))
+		counts = numpy.array([ len( x ) for x in mzArrays ], numpy.intp )
+		stops = numpy.cumsum( counts )
+		if len( mzArrays ):
+			mzArray = numpy.concatenate( mzArrays )
+			intensityArray = numpy.concatenate( intensityArrays )
+		else:
+			mzArray = numpy.empty( 0, numpy.float64 )
+			intensityArray = numpy.empty( 0, numpy.float64 )
+		return cls( mzArray, intensityArray, stops - counts, stops )
+
+	def __len__( self ):
+		return len( self.starts )
+
+	def take( self, indices ):
+		"""
+		Creates a PeakStore containing only some of the scans of this one. The 
+		peak data is shared, not copied.
+
+		:Parameters:
+			indices : sequence
+				The positions of the scans to keep, in ascending order.
+
+		rtype: PeakStore
+		return: A new PeakStore.
+		"""
+		indices = numpy.asarray( indices, numpy.intp )
+		store = PeakStore.__new__( PeakStore )
+		store.mzArray = self.mzArray
+		store.intensityArray = self.intensityArray
+		store.starts = self.starts[ indices ]
+		store.stops = self.stops[ indices ]
+		store.views = [ self.views[ i ] for i in indices ]
+		return store
+
+	def filterPeaks( self, keep ):
+		"""
+		Creates a compact PeakStore containing only some of the peaks of this one.
+
+		:Parameters:
+			keep : numpy.ndarray
+				A boolean array the length of mzArray, True for each value to keep.
+
+		rtype: PeakStore
+		return: A new PeakStore with an entry for each scan in this one.
+		"""
+		keep = keep & self._used( )
+		keptBefore = numpy.concatenate(([ 0 ], numpy.cumsum( keep )))
+		counts = keptBefore[ self.stops ] - keptBefore[ self.starts ]
+		stops = numpy.cumsum( counts )
+		return PeakStore( self.mzArray[ keep ], self.intensityArray[ keep ], 
+			stops - counts, stops )
+
+	def compact( self ):
+		"""
+		Creates a PeakStore containing only the values used by the scans.
+
+		rtype: PeakStore
+		return: A new PeakStore with an entry for each scan in this one.
+		"""
+		return self.filterPeaks( numpy.ones( len( self.mzArray ), bool ))
+
+	def sums( self, indices=None, minMz=None, maxMz=None ):
+		"""
+		Calculates the total intensity of each of the given scans.
+
+		:Parameters:
+			indices : sequence
+				The positions of the scans to use. Defaults to all scans.
+			minMz : float
+				Only use values with an m/z higher than or equal to this.
+			maxMz : float
+				Only use values with an m/z lower than this.
+
+		rtype: numpy.ndarray
+		return: The total intensity of each scan.
+		"""
+		values = self.intensityArray
+		if minMz is not None or maxMz is not None:
+			keep = numpy.ones( len( values ), bool )
+			if minMz is not None:
+				keep &= self.mzArray >= minMz
+			if maxMz is not None:
+				keep &= self.mzArray < maxMz
+			values = numpy.where( keep, values, 0 )
+		return self._reduce( numpy.add, values, indices )
+
+	def maxima( self, indices=None ):
+		"""
+		Finds the highest intensity of each of the given scans.
+
+		:Parameters:
+			indices : sequence
+				The positions of the scans to use. Defaults to all scans.
+
+		rtype: numpy.ndarray
+		return: The highest intensity of each scan, or 0 for empty scans.
+		"""
+		return self._reduce( numpy.maximum, self.intensityArray, indices )
+
+	def _reduce( self, ufunc, values, indices=None ):
+		"""
+		Internal function. Reduces the values of each of the given scans with a
+		numpy ufunc.
+
+		:Parameters:
+			ufunc : numpy.ufunc
+				The ufunc to reduce with, e.g. numpy.add
+			values : numpy.ndarray
+				An array the length of mzArray to reduce.
+			indices : sequence
+				The positions of the scans to use. Defaults to all scans.
+
+		rtype: numpy.ndarray
+		return: The reduced value for each scan, or 0 for empty scans.
+		"""
+		starts = self.starts
+		stops = self.stops
+		if indices is not None:
+			indices = numpy.asarray( indices, numpy.intp )
+			starts = starts[ indices ]
+			stops = stops[ indices ]
+		returnvalue = numpy.zeros( len( starts ), numpy.float64 )
+		used = stops > starts
+		if not used.any( ):
+			return returnvalue
+		# reduceat reduces between successive boundaries, so interleave the start
+		# and stop of each scan and keep every other result.
+		boundaries = numpy.empty( 2 * used.sum( ), numpy.intp )
+		boundaries[ 0::2 ] = starts[ used ]
+		boundaries[ 1::2 ] = stops[ used ]
+		if boundaries[ -1 ] == len( values ):
+			# the last boundary is implicitly the end of the array
+			boundaries = boundaries[ :-1 ]
+		returnvalue[ used ] = ufunc.reduceat( values, boundaries )[ 0::2 ]
+		return returnvalue
+
+	def _used( self ):
+		"""
+		Internal function. Finds the values which belong to a scan.
+
+		rtype: numpy.ndarray
+		return: A boolean array the length of mzArray, True for each value used 
+			by a scan.
+		"""
+		edges = numpy.zeros( len( self.mzArray ) + 1, numpy.intp )
+		numpy.add.at( edges, self.starts, 1 )
+		numpy.add.at( edges, self.stops, -1 )
+		return numpy.cumsum( edges[ :-1 ]) > 0
+
+
+class ScanTable( object ):
+	"""
+	The metadata of a list of scans held in a numpy structured array, one record
+	per scan, so that scans can be selected with vectorized comparisons. The 
+	fields are retentionTime, msLevel, polarity, id, parentScan, precursorMz,
+	collisionEnergy, lowMz, highMz, totIonCurrent and basePeakIntensity. Missing
+	values are stored as NaN for the float fields, and 0 for msLevel and 
+	polarity and -1 for id and parentScan. Requires numpy.
+	"""
+	dtype = [
+		( 'retentionTime', 'f8' ),
+		( 'msLevel', 'i4' ),
+		( 'polarity', 'i1' ),
+		( 'id', 'i8' ),
+		( 'parentScan', 'i8' ),
+		( 'precursorMz', 'f8' ),
+		( 'collisionEnergy', 'f8' ),
+		( 'lowMz', 'f8' ),
+		( 'highMz', 'f8' ),
+		( 'totIonCurrent', 'f8' ),
+		( 'basePeakIntensity', 'f8' )
+	]
+
+	def __init__( self, table ):
+		"""
+		:Parameters:
+			table : numpy.ndarray
+				A structured array with the fields in ScanTable.dtype.
+		"""
+		if not numpy:
+			raise NotImplementedError( "This class requires numpy" )
+		self.table = table
+
+	@classmethod
+	def fromScans( cls, scans ):
+		"""
+		Creates a ScanTable from the metadata of a sequence of scans. The peak data
+		of the scans is not used.
+
+		:Parameters:
+			scans : iterable
+				The scan dicts to read the metadata of.
+
+		rtype: ScanTable
+		return: A new ScanTable with a record for each scan.
+		"""
+		if not numpy:
+			raise NotImplementedError( "This class requires numpy" )
+		nan = float( 'nan' )
+		def value( x, default ):
+			if x is None:
+				return default
+			return x
+		records = []
+		for scan in scans:
+			mzRange = scan.get( 'mzRange' ) or ( None, None )
+			records.append((
+				value( scan.get( 'retentionTime' ), nan ),
+				value( scan.get( 'msLevel' ), 0 ),
+				value( scan.get( 'polarity' ), 0 ),
+				value( scan.get( 'id' ), -1 ),
+				value( scan.get( 'parentScan' ), -1 ),
+				value( scan.get( 'precursorMz' ), nan ),
+				value( scan.get( 'collisionEnergy' ), nan ),
+				value( mzRange[ 0 ], nan ),
+				value( mzRange[ 1 ], nan ),
+				value( scan.get( 'totIonCurrent' ), nan ),
+				value( scan.get( 'basePeakIntensity' ), nan )))
+		return cls( numpy.array( records, cls.dtype ))
+
+	@classmethod
+	def binaryDtype( cls, version=_BINARY_VERSION ):
+		"""
+		Returns the little endian form of the table dtype, used for the binary 
+		format written by RawData.writeBinary.
+
+		:Parameters:
+			version : int
+				The version of the binary format. Version 1 tables have no 
+				totIonCurrent and basePeakIntensity fields.
+
+		rtype: numpy.dtype
+		return: The dtype.
+		"""
+		fields = cls.dtype
+		if version < 2:
+			fields = fields[ :-2 ]
+		return numpy.dtype( fields ).newbyteorder( '<' )
+
+	def __len__( self ):
+		return len( self.table )
+
+	def scans( self ):
+		"""
+		Creates a scan dict without peak data for each record in the table. 
+		Missing values are converted back to None.
+
+		rtype: list
+		return: A list of scan dicts.
+		"""
+		returnvalue = []
+		for ( rt, msLevel, polarity, scanId, parentScan, precursorMz, 
+		      collisionEnergy, lowMz, highMz, totIonCurrent, 
+		      basePeakIntensity ) in self.table.tolist( ):
+			returnvalue.append({
+				"retentionTime" : _nanToNone( rt ),
+				"polarity" : polarity or None, 
+				"msLevel" : msLevel or None, 
+				"id" : scanId if scanId >= 0 else None,
+				"mzRange" : [ _nanToNone( lowMz ), _nanToNone( highMz )],
+				"parentScan" : parentScan if parentScan >= 0 else None,
+				"precursorMz" : _nanToNone( precursorMz ),
+				"collisionEnergy" : _nanToNone( collisionEnergy ),
+				"totIonCurrent" : _nanToNone( totIonCurrent ),
+				"basePeakIntensity" : _nanToNone( basePeakIntensity )
+			})
+		return returnvalue
+
+	def __getitem__( self, field ):
+		"""
+		Returns one column of the table.
+
+		:Parameters:
+			field : str
+				The name of the field, e.g. 'retentionTime'
+
+		rtype: numpy.ndarray
+		return: The values of the field for each scan.
+		"""
+		return self.table[ field ]
+
+	def take( self, indices ):
+		"""
+		Creates a ScanTable containing only some of the records of this one.
+
+		:Parameters:
+			indices : sequence
+				The positions of the records to keep.
+
+		rtype: ScanTable
+		return: A new ScanTable.
+		"""
+		return ScanTable( self.table[ numpy.asarray( indices, numpy.intp )])
+
+	def mask( self, level=None, polarity=None, minTime=None, maxTime=None,
+	          minPrecursorMz=None, maxPrecursorMz=None ):
+		"""
+		Tests each scan against all of the given criteria. Criteria which are None
+		are not applied. Scans with a missing retention time or precursor m/z do
+		not match any criteria on that value.
+
+		:Parameters:
+			level : int
+				The msLevel of the scans.
+			polarity : int
+				The polarity of the scans, 1 for positive or -1 for negative.
+			minTime : float
+				The minimum retention time of the scans.
+			maxTime : float
+				The maximum retention time of the scans (exclusive).
+			minPrecursorMz : float
+				The minimum precursor m/z of the scans.
+			maxPrecursorMz : float
+				The maximum precursor m/z of the scans (exclusive).
+
+		rtype: numpy.ndarray
+		return: A boolean array, True for each matching scan.
+		"""
+		table = self.table
+		returnvalue = numpy.ones( len( table ), bool )
+		# comparisons with missing (NaN) values are False, which is intended
+		with numpy.errstate( invalid='ignore' ):
+			if level is not None:
+				returnvalue &= table[ 'msLevel' ] == level
+			if polarity is not None:
+				returnvalue &= table[ 'polarity' ] == polarity
+			if minTime is not None:
+				returnvalue &= table[ 'retentionTime' ] >= minTime
+			if maxTime is not None:
+				returnvalue &= table[ 'retentionTime' ] < maxTime
+			if minPrecursorMz is not None:
+				returnvalue &= table[ 'precursorMz' ] >= minPrecursorMz
+			if maxPrecursorMz is not None:
+				returnvalue &= table[ 'precursorMz' ] < maxPrecursorMz
+		return returnvalue
+
+	def select( self, level=None, polarity=None, minTime=None, maxTime=None,
+	            minPrecursorMz=None, maxPrecursorMz=None ):
+		"""
+		Finds the scans matching all of the given criteria, see mask( ).
+
+		rtype: numpy.ndarray
+		return: The positions of the matching scans.
+		"""
+		return numpy.flatnonzero( self.mask( level, polarity, minTime, maxTime,
+		                                     minPrecursorMz, maxPrecursorMz ))
+
+
+class DataCache( object ):
+	"""
+	An on disk cache of parsed data. A binary snapshot of the data read from a
+	file is kept in the cache directory, in the format written by 
+	RawData.writeBinary, and is loaded in place of the file while the file keeps
+	the same absolute path, size and modification time and the library, format
+	and reader versions are unchanged. The loaded data has the same form as a 
+	fresh read: the peak arrays of the scans are lists unless USE_NUMPY is set,
+	and are not packed. When the snapshots exceed the maximum size, the least 
+	recently used are removed. Requires numpy.
+	"""
+
+	def __init__( self, directory, maxSize=None ):
+		"""
+		:Parameters:
+			directory : str
+				The directory to keep the snapshots in. It is created if needed.
+			maxSize : int
+				The maximum total size of the snapshots in bytes. Defaults to 
+				CACHE_SIZE.
+		"""
+		if not numpy:
+			raise NotImplementedError( "This class requires numpy" )
+		self.directory = directory
+		if maxSize is None:
+			maxSize = CACHE_SIZE
+		self.maxSize = maxSize
+
+	def path( self, filename ):
+		"""
+		Returns the name of the snapshot file for a data file.
+
+		:Parameters:
+			filename : str
+				The name of the data file.
+
+		rtype: str
+		return: The name of the snapshot file, whether or not it exists.
+		"""
+		filename = os.path.abspath( filename )
+		stat = os.stat( filename )
+		key = sha1( repr(( filename, stat.st_size, stat.st_mtime, VERSION, 
+			_BINARY_VERSION, _READER_VERSION )).encode( 'utf-8' ))
+		return os.path.join( self.directory, key.hexdigest( ) + ".mzbin" )
+
+	def load( self, rawData, filename ):
+		"""
+		Loads the snapshot of a data file, if there is one.
+
+		:Parameters:
+			rawData : RawData
+				The object to load the data into.
+			filename : str
+				The name of the data file.
+
+		rtype: bool
+		return: True if the snapshot was loaded.
+		"""
+		path = self.path( filename )
+		if not os.path.exists( path ):
+			return False
+		try:
+			rawData.readBinary( path )
+			# mark the snapshot as recently used
+			os.utime( path, None )
+		except ( IOError, OSError, ValueError ):
+			return False
+		# give each scan its own peak arrays, as a fresh read does
+		rawData._peaks = None
+		for scan in rawData.data[ 'scans' ]:
+			for key in LazyScan.peakKeys:
+				if USE_NUMPY:
+					scan[ key ].flags.writeable = False
+				else:
+					scan[ key ] = scan[ key ].tolist( )
+		return True
+
+	def store( self, rawData, filename ):
+		"""
+		Saves a snapshot of the data read from a file, then removes the least 
+		recently used snapshots if the cache is too large. Failures are reported
+		on stderr but are otherwise ignored.
+
+		:Parameters:
+			rawData : RawData
+				The data read from the file.
+			filename : str
+				The name of the data file.
+
+		rtype: bool
+		return: True if the snapshot was saved.
+		"""
+		path = self.path( filename )
+		tempPath = "%s.%d.tmp" % ( path, os.getpid( ))
+		try:
+			if not os.path.isdir( self.directory ):
+				os.makedirs( self.directory )
+			rawData.writeBinary( tempPath )
+			os.rename( tempPath, path )
+		except ( IOError, OSError, TypeError, ValueError ):
+			sys.stderr.write( "Unable to cache the data from %s in %s\n" % 
+				( filename, self.directory ))
+			if os.path.exists( tempPath ):
+				os.remove( tempPath )
+			return False
+		self.evict( )
+		return True
+
+	def evict( self, maxSize=None ):
+		"""
+		Removes the least recently used snapshots until the total size of the 
+		snapshots is no more than the maximum size.
+
+		:Parameters:
+			maxSize : int
+				The size to reduce the cache to in bytes. Defaults to maxSize.
+		"""
+		if maxSize is None:
+			maxSize = self.maxSize
+		entries = []
+		for name in os.listdir( self.directory ):
+			if name.endswith( ".mzbin" ):
+				try:
+					stat = os.stat( os.path.join( self.directory, name ))
+				except OSError:
+					continue
+				entries.append(( stat.st_mtime, stat.st_size, name ))
+		entries.sort( )
+		totalSize = sum( entry[ 1 ] for entry in entries )
+		for mtime, size, name in entries:
+			if totalSize <= maxSize:
+				break
+			try:
+				os.remove( os.path.join( self.directory, name ))
+			except OSError:
+				continue
+			totalSize -= size
+
+	def clear( self ):
+		"""
+		Removes all snapshots from the cache.
+		"""
+		self.evict( 0 )
+
+
+class IndexedRawData( RawData ):
+	"""
+	A RawData object backed by an indexed file. Only the index of the file is
+	loaded when the object is created; scans are read from the file and decoded
+	as they are accessed, so any scan can be retrieved from a very large file
+	without parsing the scans preceding it. If the index stored in the file is
+	missing or wrong, it is rebuilt with a single scan over the raw bytes of the
+	file.
+
+	This class only provides the format independent parts. Use one of its 
+	subclasses, e.g. IndexedMzMl.
+	"""
+
+	# a regular expression matching the start tag of an indexed element and 
+	# capturing its id.
+	startTagPattern = None
+	# a regular expression matching the end of the part of an indexed element 
+	# needed to decode it.
+	endPattern = None
+	# the size of the blocks to read the file in.
+	blockSize = 65536
+
+	def __init__( self, filename ):
+		if not os.path.exists( filename ):
+			raise IOError( "The file %s does not exist or is not readable" % filename )
+		self.filename = filename
+		self._file = open( filename, 'rb' )
+		try:
+			self.data = { 'scans' : _IndexedScanList( self ) }
+			self._readHeader( )
+			self.ids = [ ]
+			self.offsets = [ ]
+			self.indexRebuilt = False
+			index = self._readIndex( )
+			if index:
+				self._setIndex( index )
+			if not self._checkIndex( ):
+				self.rebuildIndex( )
+		except:
+			self._file.close( )
+			raise
+
+	def close( self ):
+		"""
+		Closes the underlying file. Scans can't be read from the file afterwards.
+		"""
+		self._file.close( )
+
+	def __enter__( self ):
+		return self
+
+	def __exit__( self, excType, excValue, traceback ):
+		self.close( )
+		return False
+
+	def getScan( self, retentionTime ):
+		"""
+		Gets a scan from the data by retention time. On the first call the 
+		retention time of every scan is read, without decoding the peak data, and
+		kept in sorted order; after that the scan is located by bisection and 
+		only that scan is read from the file. Scans without a retention time are
+		never returned.
+
+		:Parameters:
+			retentionTime : float
+				A float indicating the retention time of the scan to retrieve. The scan
+				closest to that time is returned.
+
+		rtype: dict
+		return: A dict containing the scan points & metadata
+		"""
+		if not isinstance( self.data[ 'scans' ], _IndexedScanList ):
+			# the scans have been replaced, so the index no longer applies
+			return RawData.getScan( self, retentionTime )
+		if self._times is None:
+			self._buildTimeIndex( )
+		if not self._times:
+			return None
+		i = bisect.bisect_left( self._times, retentionTime )
+		if i == len( self._times ) or ( i > 0 and 
+			retentionTime - self._times[ i - 1 ] <= self._times[ i ] - retentionTime ):
+			i -= 1
+		return self._readScan( self._timePositions[ i ])
+
+	def getScanById( self, scanId ):
+		"""
+		Gets a scan from the data by its id.
+
+		:Parameters:
+			scanId : int or str
+				The id of the scan as found in the 'id' of the scan dicts, or the
+				native id used in the file.
+
+		rtype: dict
+		return: A dict containing the scan points & metadata, or None if there is
+			no scan with that id.
+		"""
+		if not isinstance( self.data[ 'scans' ], _IndexedScanList ):
+			# the scans have been replaced, so the index no longer applies
+			return RawData.getScanById( self, scanId )
+		position = self._positions.get( scanId )
+		if position is None:
+			position = self._scanIds.get( scanId )
+		if position is None:
+			return None
+		return self._readScan( position )
+
+	def rebuildIndex( self ):
+		"""
+		Rebuilds the scan index by scanning the file for the start tag of each
+		scan. This is done automatically if the index stored in the file is
+		missing or incorrect.
+		"""
+		index = [ ]
+		leftover = b''
+		blockOffset = 0
+		self._file.seek( 0 )
+		while True:
+			block = self._file.read( self.blockSize )
+			buffer_ = leftover + block
+			bufferOffset = blockOffset - len( leftover )
+			for match in self.startTagPattern.finditer( buffer_ ):
+				offset = bufferOffset + match.start( )
+				if not index or offset > index[ -1 ][ 1 ]:
+					index.append(( unescape( match.group( 1 ).decode( 'utf-8' ), 
+						{ '&quot;' : '"' }), offset ))
+			if not block:
+				break
+			blockOffset += len( block )
+			# keep the end of the buffer in case it contains an incomplete tag
+			leftover = buffer_[ -1024: ]
+		self._setIndex( index )
+		self.indexRebuilt = True
+
+	def _setIndex( self, index ):
+		"""
+		Internal function. Stores the scan index.
+
+		:Parameters:
+			index : list
+				A list of 2 element tuples ( id, offset ) for each scan in file order.
+		"""
+		self.ids = [ x[ 0 ] for x in index ]
+		self.offsets = [ x[ 1 ] for x in index ]
+		self._positions = dict(( id_, i ) for i, id_ in enumerate( self.ids ))
+		self._scanIds = dict(( self._scanId( id_, i ), i ) 
+			for i, id_ in enumerate( self.ids ))
+		self._times = None
+		self._timePositions = None
+
+	def _checkIndex( self ):
+		"""
+		Internal function. Checks that the first and last entries of the index
+		point at the start of the correct element.
+
+		rtype: bool
+		return: True if the index appears to be correct.
+		"""
+		if not self.offsets:
+			return False
+		for i in ( 0, len( self.offsets ) - 1 ):
+			if self._readElement( i ) is None:
+				return False
+		return True
+
+	def _readElement( self, i ):
+		"""
+		Internal function. Reads the text of the i'th indexed element from the
+		file, up to the end of the first match of endPattern.
+
+		:Parameters:
+			i : int
+				The position of the element in the index.
+
+		rtype: bytes
+		return: The text of the element, or None if the index does not point at
+			the start of the element.
+		"""
+		self._file.seek( self.offsets[ i ])
+		text = self._file.read( self.blockSize )
+		match = self.startTagPattern.match( text )
+		if not match or unescape( match.group( 1 ).decode( 'utf-8' ), 
+			{ '&quot;' : '"' }) != self.ids[ i ]:
+			return None
+		end = self.endPattern.search( text )
+		while not end:
+			block = self._file.read( self.blockSize )
+			if not block:
+				return None
+			# allow for a match starting at the end of the previous block
+			searchStart = max( 0, len( text ) - 1024 )
+			text += block
+			end = self.endPattern.search( text, searchStart )
+		return text[ :end.end( )]
+
+	def _readScan( self, i ):
+		"""
+		Internal function. Reads and decodes the i'th scan in the file.
+
+		:Parameters:
+			i : int
+				The position of the scan in the index.
+
+		rtype: dict
+		return: A dict containing the scan points & metadata
+		"""
+		text, i = self._readText( i )
+		return self._parseScan( text, i )
+
+	def _readText( self, i ):
+		"""
+		Internal function. Reads the text of the i'th scan in the file, rebuilding
+		the index if it does not point at the scan.
+
+		:Parameters:
+			i : int
+				The position of the scan in the index.
+
+		rtype: tuple
+		return: A 2 element tuple ( text, i ) of the text of the scan and its
+			position in the index, which changes if the index was rebuilt.
+		"""
+		text = self._readElement( i )
+		if text is None and not self.indexRebuilt:
+			id_ = self.ids[ i ]
+			self.rebuildIndex( )
+			i = self._positions[ id_ ]
+			text = self._readElement( i )
+		if text is None:
+			raise IOError( "Unable to read scan %s from %s" % 
+				( self.ids[ i ], self.filename ))
+		return text, i
+
+	def _buildTimeIndex( self ):
+		"""
+		Internal function. Reads the retention time of every scan in the file and
+		stores them in sorted order with the position of each scan, for getScan.
+		"""
+		times = [ ]
+		for i in range( len( self.offsets )):
+			text, position = self._readText( i )
+			retentionTime = self._parseRetentionTime( text )
+			if retentionTime is not None:
+				times.append(( retentionTime, position ))
+		times.sort( )
+		self._times = [ x[ 0 ] for x in times ]
+		self._timePositions = [ x[ 1 ] for x in times ]
+
+	def _parseRetentionTime( self, text ):
+		"""
+		Internal function. Gets the retention time from the text of a scan. 
+		Subclasses should override this to avoid decoding the peak data.
+
+		:Parameters:
+			text : bytes
+				The text of the scan, see _readElement.
+
+		rtype: float
+		return: The retention time of the scan, or None.
+		"""
+		return self._parseScan( text, None )[ 'retentionTime' ]
+
+	def _iterScans( self ):
+		"""
+		Internal function. Iterates over all of the scans in the file in order. 
+		Subclasses should override this with a streaming reader which only 
+		decodes the peak data of a scan when it is used, see LazyScan.
+		"""
+		for i in range( len( self.offsets )):
+			yield self._readScan( i )
+
+	def _readHeader( self ):
+		"""
+		Internal function. Reads any file level metadata needed to decode the 
+		scans. Subclasses may override this.
+		"""
+		pass
+
+	def _readIndex( self ):
+		"""
+		Internal function. Reads the index stored in the file. Subclasses must
+		override this.
+
+		rtype: list
+		return: A list of 2 element tuples ( id, offset ) for each scan in file 
+			order, or None if the file has no index.
+		"""
+		raise NotImplementedError( "_readIndex must be implemented by a subclass" )
+
+	def _scanId( self, id_, i ):
+		"""
+		Internal function. Converts the id of the i'th element in the index into
+		the 'id' of the corresponding scan dict. Subclasses must override this.
+		"""
+		raise NotImplementedError( "_scanId must be implemented by a subclass" )
+
+	def _parseScan( self, text, i ):
+		"""
+		Internal function. Decodes the text read from the file for the i'th scan.
+		Subclasses must override this.
+		"""
+		raise NotImplementedError( "_parseScan must be implemented by a subclass" )
+
+	def _readTrailer( self, pattern ):
+		"""
+		Internal function. Finds the offset of the index from the end of the file.
+
+		:Parameters:
+			pattern : bytes
+				A regular expression capturing the offset of the index.
+
+		rtype: int
+		return: The offset of the index, or None if it was not found.
+		"""
+		self._file.seek( 0, 2 )
+		self._file.seek( max( 0, self._file.tell( ) - 4096 ))
+		match = re.search( pattern, self._file.read( ))
+		if not match:
+			return None
+		return int( match.group( 1 ))
+
+
+class IndexedMzMl( IndexedRawData ):
+	"""
+	Random access to the spectra of an mzML file using the <indexList> at the 
+	end of an indexedmzML file. Plain mzML files are indexed when opened.
+	"""
+
+	startTagPattern = re.compile( br'<spectrum\s[^>]*?\bid="([^"]*)"' )
+	endPattern = re.compile( br'</spectrum\s*>' )
+
+	def _readHeader( self ):
+		"""
+		Internal function. Reads the referenceable param groups and the source
+		file from the beginning of the file.
+		"""
+		self._paramGroups = { }
+		self.data[ 'sourceFile' ] = None
+		source = open( self.filename, 'rb' )
+		try:
+			for event, elem in ElementTree.iterparse( source, ( 'start', 'end' )):
+				tag = _localName( elem.tag )
+				if event == 'start':
+					if tag == 'run':
+						break
+				elif tag == 'referenceableParamGroup':
+					self._paramGroups[ elem.get( 'id' ) ] = _cvParams( elem )
+				elif tag == 'sourceFile' and self.data[ 'sourceFile' ] is None:
+					self.data[ 'sourceFile' ] = _mzMlSourceFile( elem )
+		finally:
+			source.close( )
+
+	def _readIndex( self ):
+		"""
+		Internal function. Reads the spectrum index from the <indexList> of an
+		indexedmzML file.
+
+		rtype: list
+		return: A list of 2 element tuples ( id, offset ) for each spectrum in
+			file order, or None if the file has no index.
+		"""
+		indexOffset = self._readTrailer( br'<indexListOffset>\s*(\d+)\s*</indexListOffset>' )
+		if indexOffset is None:
+			return None
+		self._file.seek( indexOffset )
+		match = re.search( br'<index\s+name="spectrum"\s*>(.*?)</index>', 
+			self._file.read( ), re.S )
+		if not match:
+			return None
+		return [( unescape( id_.decode( 'utf-8' ), { '&quot;' : '"' }), int( offset )) 
+			for id_, offset in re.findall( 
+				br'<offset\s[^>]*?\bidRef="([^"]*)"[^>]*>\s*(\d+)\s*</offset>', 
+				match.group( 1 ))]
+
+	def _scanId( self, id_, i ):
+		return _mzMlScanId( id_, i )
+
+	def _parseScan( self, text, i ):
+		scan, payload = _mzMlScan( ElementTree.fromstring( text ), self._paramGroups )
+		scan[ 'mzArray' ], scan[ 'intensityArray' ] = _decodePeaks( payload )
+		return scan
+
+	def _parseRetentionTime( self, text ):
+		return _mzMlScan( ElementTree.fromstring( text ), 
+			self._paramGroups )[ 0 ][ 'retentionTime' ]
+
+	def _iterScans( self ):
+		return iterMzMl( self.filename, lazy=True )
+
+
+class IndexedMzXml( IndexedRawData ):
+	"""
+	Random access to the scans of an mzXML file using the <index name="scan">
+	section found through the <indexOffset> at the end of the file.
+	"""
+
+	startTagPattern = re.compile( br'<scan\s[^>]*?\bnum="(\d+)"' )
+	# nested scans follow the <peaks> element of their parent, so only the part
+	# of the scan up to the end of <peaks> is read.
+	endPattern = re.compile( br'</peaks\s*>|<peaks\s[^>]*/>' )
+
+	def _readHeader( self ):
+		"""
+		Internal function. Reads the source file from the beginning of the file.
+		"""
+		self.data[ 'sourceFile' ] = None
+		source = open( self.filename, 'rb' )
+		try:
+			for event, elem in ElementTree.iterparse( source, ( 'start', 'end' )):
+				tag = _localName( elem.tag )
+				if event == 'start':
+					if tag == 'scan':
+						break
+				elif tag == 'parentFile':
+					self.data[ 'sourceFile' ] = elem.get( 'fileName' )
+					break
+		finally:
+			source.close( )
+
+	def _readIndex( self ):
+		"""
+		Internal function. Reads the scan index of the file.
+
+		rtype: list
+		return: A list of 2 element tuples ( id, offset ) for each scan in file 
+			order, or None if the file has no index.
+		"""
+		indexOffset = self._readTrailer( br'<indexOffset>\s*(\d+)\s*</indexOffset>' )
+		if indexOffset is None:
+			return None
+		self._file.seek( indexOffset )
+		match = re.search( br'<index\s+name="scan"\s*>(.*?)</index>', 
+			self._file.read( ), re.S )
+		if not match:
+			return None
+		return [( id_.decode( 'utf-8' ), int( offset )) for id_, offset in 
+			re.findall( br'<offset\s[^>]*?\bid="(\d+)"[^>]*>\s*(\d+)\s*</offset>', 
+				match.group( 1 ))]
+
+	def _scanId( self, id_, i ):
+		return int( id_ )
+
+	def _setIndex( self, index ):
+		IndexedRawData._setIndex( self, index )
+		self._enclosingScans = None
+
+	def _parseScan( self, text, i ):
+		scan = ElementTree.fromstring( text + b'</scan>' )
+		scan, payload = _mzXmlScan( scan, _getChildNode( scan, 'peaks' ), None )
+		if scan[ 'msLevel' ] > 1 and scan[ 'parentScan' ] is None and i is not None:
+			# without a precursorScanNum, the parent is the scan this one is 
+			# nested in, if any.
+			if self._enclosingScans is None:
+				self._findEnclosingScans( )
+			scan[ 'parentScan' ] = self._enclosingScans[ i ]
+		scan[ 'mzArray' ], scan[ 'intensityArray' ] = _decodePeaks( payload )
+		return scan
+
+	def _findEnclosingScans( self ):
+		"""
+		Internal function. Finds the scan each scan is nested in, by counting the
+		</scan> end tags between the start of each scan and the next, and stores
+		the num of the enclosing scan, or None, for each scan in the index.
+		"""
+		enclosingScans = [ ]
+		# the positions of the scans open at the start of the current scan
+		openScans = [ ]
+		for i in range( len( self.offsets )):
+			if openScans:
+				enclosingScans.append( int( self.ids[ openScans[ -1 ]]))
+			else:
+				enclosingScans.append( None )
+			openScans.append( i )
+			if i + 1 < len( self.offsets ):
+				self._file.seek( self.offsets[ i ])
+				text = self._file.read( self.offsets[ i + 1 ] - self.offsets[ i ])
+				for j in range( len( re.findall( br'</scan\s*>', text ))):
+					if openScans:
+						openScans.pop( )
+		self._enclosingScans = enclosingScans
+
+	def _parseRetentionTime( self, text ):
+		scan = ElementTree.fromstring( text + b'</scan>' )
+		return _mzXmlScan( scan, _getChildNode( scan, 'peaks' ), 
+			None )[ 0 ][ 'retentionTime' ]
+
+	def _iterScans( self ):
+		return iterMzXml( self.filename, lazy=True )
+
+
+class _IndexedScanList( object ):
+	"""
+	Internal class. A read only sequence of the scans of an IndexedRawData object
+	which are read from the file as they are accessed.
+	"""
+
+	def __init__( self, source ):
+		self.source = source
+
+	def __len__( self ):
+		return len( self.source.offsets )
+
+	def __getitem__( self, index ):
+		if isinstance( index, slice ):
+			return [ self.source._readScan( i ) 
+			         for i in range( *index.indices( len( self )))]
+		if index < 0:
+			index += len( self )
+		if index < 0 or index >= len( self ):
+			raise IndexError( "scan index out of range" )
+		return self.source._readScan( index )
+
+	def __iter__( self ):
+		return self.source._iterScans( )
 
+	def __deepcopy__( self, memo ):
+		# each scan is newly decoded, so there is nothing to share.
+		return list( self )
@@ -87,6 +87,12 @@ def parseOpts( ):
 												"value at each retention time (BPC) instead of the "
 												"total ion chromatogram (TIC)." )
 
+	optparser.add_option( "--headers", action="store_true", default=False,
+	                      dest="fromHeaders", help="Plot the TIC or BPC recorded in "
+												"the scan headers of mzXML and mzML files instead of "
+												"computing it from the peaks, which is much faster. "
+												"Ignored with -m" )
+
 	optparser.add_option( "-m", "--mass", type="float", dest="mass", 
 	                      help="Filter data by a particular mass, a.k.a Selected "
 												"Ion Chromatogram (SIC)" )
@@ -178,6 +184,12 @@ def parseOpts( ):
 	optparser.add_option( "--normalize", action="store_true", dest="normalize",
 	                      help="Normalize all plots to have a maximum value of 1" )
 
+	optparser.add_option( "--cache-dir", dest="cacheDir", metavar="DIR",
+	                      default=mzlib.CACHE_DIR, help="Keep a binary snapshot of "
+												"each raw data file read in DIR, and load it instead "
+												"of parsing the file again while the file is "
+												"unchanged. Defaults to $MZLIB_CACHE_DIR" )
+
 	return optparser.parse_args( )
 
 
@@ -219,33 +231,41 @@ def main( options=None, args=None ):
 			pass
 		
 
+	if getattr( options, 'cacheDir', None ):
+		mzlib.CACHE_DIR = options.cacheDir
+
 	if rawFiles:
 		for r in rawFiles:
-			ref = mzlib.RawData( )
-			if not ( ref.read( r )):
-				sys.stderr.write( "Error: Unable to load data from '%s'" % r )
-				sys.exit( -1 )
+			# pass the filters down to the reader, so that scans and peaks which
+			# aren't plotted are never decoded
+			criteria = { 'level' : 1 }
+			if options.minTime:
+				criteria[ 'minTime' ] = options.minTime
+			if options.maxTime:
+				criteria[ 'maxTime' ] = options.maxTime
+			if options.mass:
+				criteria[ 'minMz' ] = options.mass - options.massWindow
+				criteria[ 'maxMz' ] = options.mass + options.massWindow
 
 			if options.shortFilename:
 				filename = os.path.basename( r )
 			else:
 				filename = r
 
-			# apply any filters
-			if options.mass:
-				ref.onlyMz( options.mass, options.massWindow )
-
-			if options.maxTime or options.minTime:
-				if options.maxTime:
-					ref.onlyScans( options.minTime, options.maxTime )
-				else:
-					ref.onlyScans( options.minTime )
-
-			rt = [ scan[ "retentionTime" ] for scan in ref if scan[ "msLevel" ] == 1 ]
-			if options.bpc:
-				yAxis = ref.bpc( 1 )
+			if getattr( options, 'fromHeaders', False ) and not options.mass:
+				del criteria[ 'level' ]
+				rt, yAxis = mzlib.headerChromatogram( r, 1, options.bpc, **criteria )
 			else:
-				yAxis = ref.tic( 1 )
+				ref = mzlib.RawData( )
+				if not ( ref.read( r, **criteria )):
+					sys.stderr.write( "Error: Unable to load data from '%s'" % r )
+					sys.exit( -1 )
+
+				rt = [ scan[ "retentionTime" ] for scan in ref if scan[ "msLevel" ] == 1 ]
+				if options.bpc:
+					yAxis = ref.bpc( 1 )
+				else:
+					yAxis = ref.tic( 1 )
 
 			if filters:
 				if options.lpfThreshold and options.hpfThreshold:
@@ -45,9 +45,12 @@ import cgitb; cgitb.enable( )
 # local imports
 os.environ[ 'HOME' ] = "/tmp"
 import mzplot
+import mzlib
 
 DATA_ROOT = "/var/mzplot"
 CACHE_DIR = "/tmp/mzplot"
+# where snapshots of the parsed raw data files are kept, see mzlib.DataCache
+DATA_CACHE_DIR = CACHE_DIR + "/data"
 
 class Options( object ):
 	def __init__( self ):
@@ -73,6 +76,7 @@ class Options( object ):
 		self.dpi           = 72
 		self.filterLevel   = 0
 		self.normalize     = False
+		self.fromHeaders   = False
 
 	def hash( self ):
 		optHash = sha1( )
@@ -109,6 +113,7 @@ def main( ):
 
 	if not os.path.exists( CACHE_DIR ):
 		os.makedirs( CACHE_DIR )
+	mzlib.CACHE_DIR = DATA_CACHE_DIR
 
 	fileHash = sha1( )
 	fileHash.update( str( sorted( files )))
@@ -1,22 +1,766 @@
 #!/usr/bin/env python2
 
+import gzip
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+import mzlib
 from mzlib import *
 
-mzXML2 = RawData( "testData/tiny1.mzXML2.0.mzXML" )
-mzXML3 = RawData( "testData/tiny1.mzXML3.0.mzXML" )
-mzData = RawData( "testData/tiny1.mzData1.05.xml" )
-json   = RawData( "testData/tiny1.json" )
-jsonGz = RawData( "testData/tiny1.json.gz" )
+TEST_DATA = os.path.join( os.path.dirname( os.path.abspath( __file__ )), "testData" )
 
-if __name__ == "__main__":
-	print( "mzXML2.getScan( 5.89 )['points'] == mzXML3.getScan( 5.89 )['points']): " +
-		str(mzXML2.getScan( 5.89 )['points'] == mzXML3.getScan( 5.89 )['points']))
-	print( "mzXML2.getScan( 5.89 )['points'] == mzData.getScan( 5.89 )['points']): " +
-		str(mzXML2.getScan( 5.89 )['points'] == mzData.getScan( 5.89 )['points']))
-	print( "mzXML2[:] == mzXML3[:]: " + str(mzXML2[:] == mzXML3[:]))
-	print( "mzXML2[:] == mzData[:]: " + str(mzXML2[:] == mzData[:]))
-	print( "mzXML2[:] == json[:]  : " + str(mzXML2[:] == json[:]  ))
-	print( "mzXML2[:] == jsonGz[:]: " + str(mzXML2[:] == jsonGz[:]))
+def syntheticData( scanCount=60, peakCount=50, seed=0 ):
+	"""
+	Creates a RawData object with alternating level 1 and level 2 scans of
+	random peaks.
+
+	:Parameters:
+		scanCount : int
+			The number of scans.
+		peakCount : int
+			The number of peaks in each scan.
+		seed : int
+			The seed for the random values.
+
+	rtype: RawData
+	return: The new RawData object.
+	"""
+	import numpy
+	random = numpy.random.RandomState( seed )
+	data = RawData( )
+	data.data = { 'sourceFile' : 'synthetic.raw', 'scans' : [ ]}
+	for i in range( scanCount ):
+		mzArray = numpy.sort( random.uniform( 100, 1000, peakCount )).tolist( )
+		intensityArray = random.uniform( 1, 1e5, peakCount ).tolist( )
+		level = i % 2 + 1
+		data.data[ 'scans' ].append({
+			"retentionTime" : ( i + 1 ) / 10.0,
+			"polarity" : 1,
+			"msLevel" : level,
+			"id" : i + 1,
+			"mzRange" : [ 100.0, 1000.0 ],
+			"parentScan" : level > 1 and i or None,
+			"precursorMz" : level > 1 and 500.25 or None,
+			"collisionEnergy" : level > 1 and 35.0 or None,
+			"mzArray" : mzArray,
+			"intensityArray" : intensityArray
+		})
+	return data
+
+
+class TestCase( unittest.TestCase ):
+	"""
+	Common fixtures: a temporary directory and the bundled test files.
+	"""
+
+	def setUp( self ):
+		self.tempDir = tempfile.mkdtemp( )
+		self.mzXML2 = os.path.join( TEST_DATA, "tiny1.mzXML2.0.mzXML" )
+		self.mzXML3 = os.path.join( TEST_DATA, "tiny1.mzXML3.0.mzXML" )
+		self.mzML = os.path.join( TEST_DATA, "tiny.pwiz.1.1.mzML" )
+		# the reader detects mzData by the .mzdata.xml extension
+		self.mzData = self.tempPath( "tiny1.mzdata.xml" )
+		shutil.copy( os.path.join( TEST_DATA, "tiny1.mzData1.05.xml" ),
+			self.mzData )
+
+	def tearDown( self ):
+		shutil.rmtree( self.tempDir )
+
+	def tempPath( self, name ):
+		return os.path.join( self.tempDir, name )
+
+	def assertScansEqual( self, scans, expected, keys=( 'id', 'msLevel' )):
+		scans, expected = list( scans ), list( expected )
+		self.assertEqual( len( scans ), len( expected ))
+		for scan, other in zip( scans, expected ):
+			for key in keys:
+				self.assertEqual( scan[ key ], other[ key ])
+			self.assertEqual( list( scan[ 'mzArray' ]), list( other[ 'mzArray' ]))
+			self.assertEqual( list( scan[ 'intensityArray' ]),
+			                  list( other[ 'intensityArray' ]))
+
+
+class ReaderTest( TestCase ):
+
+	def testFormatsAgree( self ):
+		mzXML2 = RawData( self.mzXML2 )
+		mzXML3 = RawData( self.mzXML3 )
+		mzData = RawData( self.mzData )
+		self.assertScansEqual( mzXML2, mzXML3 )
+		self.assertScansEqual( mzXML2, mzData )
+		self.assertEqual( mzXML2.getScan( 5.89 )[ 'id' ], 19 )
+
+	def testJsonRoundTrip( self ):
+		data = RawData( self.mzXML3 )
+		for name in ( "tiny1.json", "tiny1.json.gz" ):
+			data.write( self.tempPath( name ))
+			self.assertScansEqual( RawData( self.tempPath( name )), data )
+
+	def testCriteriaPushdown( self ):
+		criteria = { 'level' : 1, 'minTime' : 1, 'maxTime' : 5,
+		             'minMz' : 300, 'maxMz' : 700 }
+		source = syntheticData( )
+		for name in ( "data.mzXML", "data.mzML", "data.mzdata.xml", "data.csv" ):
+			source.write( self.tempPath( name ))
+			pushed = RawData( )
+			pushed.read( self.tempPath( name ), **criteria )
+			filtered = RawData( self.tempPath( name ))
+			filtered._applyCriteria( **criteria )
+			self.assertTrue( len( pushed.data[ 'scans' ]))
+			self.assertScansEqual( pushed, filtered )
+
+	def testUseNumpy( self ):
+		import numpy
+		expected = [ RawData( path ) for path in ( self.mzXML2, self.mzData, self.mzML )]
+		mzlib.USE_NUMPY = True
+		try:
+			for path, other in zip(( self.mzXML2, self.mzData, self.mzML ), expected ):
+				data = RawData( path )
+				scan = data.data[ 'scans' ][ 0 ]
+				self.assertTrue( isinstance( scan[ 'mzArray' ], numpy.ndarray ))
+				self.assertFalse( scan[ 'intensityArray' ].flags.writeable )
+				self.assertScansEqual( data, other )
+		finally:
+			mzlib.USE_NUMPY = False
+
+	def testWorkersAndLazy( self ):
+		from multiprocessing.pool import ThreadPool
+		path = self.tempPath( "data.mzXML" )
+		syntheticData( ).write( path )
+		expected = RawData( path )
+		pool = ThreadPool( 2 )
+		try:
+			self.assertScansEqual( iterScans( path, workers=pool ), expected )
+		finally:
+			pool.close( )
+		lazy = list( iterScans( path, lazy=True ))
+		self.assertFalse( lazy[ 0 ].isDecoded( ))
+		self.assertScansEqual( lazy, expected )
+
+
+class LazyScanTest( TestCase ):
+
+	def testDecodeOnAccess( self ):
+		expected = RawData( self.mzML ).data[ 'scans' ]
+		scans = list( iterScans( self.mzML, lazy=True ))
+		scan = scans[ 0 ]
+		self.assertEqual( scan[ 'id' ], expected[ 0 ][ 'id' ])
+		self.assertTrue( 'mzArray' in scan )
+		self.assertEqual( scan.get( 'msLevel' ), 1 )
+		self.assertFalse( scan.isDecoded( ))
+		self.assertEqual( list( scan[ 'intensityArray' ]), 
+		                  list( expected[ 0 ][ 'intensityArray' ]))
+		self.assertTrue( scan.isDecoded( ))
+		# operations on all of the items decode first
+		self.assertEqual( sorted( scans[ 1 ].keys( )), sorted( expected[ 1 ].keys( )))
+		self.assertEqual( scans[ 2 ], expected[ 2 ])
+		self.assertEqual( dict( scans[ 3 ].items( )), expected[ 3 ])
+
+	def testCopies( self ):
+		data = RawData( )
+		data.read( self.mzML, lazy=True )
+		copy = RawData( data )
+		self.assertFalse( copy.data[ 'scans' ][ 0 ].isDecoded( ))
+		self.assertFalse( data.data[ 'scans' ][ 0 ].isDecoded( ))
+		self.assertScansEqual( copy, RawData( self.mzML ))
+		self.assertFalse( data.data[ 'scans' ][ 0 ].isDecoded( ))
+		self.assertEqual( data.data[ 'scans' ][ 0 ].copy( ), 
+		                  RawData( self.mzML ).data[ 'scans' ][ 0 ])
+
+
+class ScanTableTest( TestCase ):
+
+	def matches( self, scan, level=None, polarity=None, minTime=None, 
+	             maxTime=None, minPrecursorMz=None, maxPrecursorMz=None ):
+		rt, precursorMz = scan[ 'retentionTime' ], scan[ 'precursorMz' ]
+		return (( level is None or scan[ 'msLevel' ] == level ) and
+		        ( polarity is None or scan[ 'polarity' ] == polarity ) and
+		        ( minTime is None or ( rt is not None and rt >= minTime )) and
+		        ( maxTime is None or ( rt is not None and rt < maxTime )) and
+		        ( minPrecursorMz is None or ( precursorMz is not None and 
+		          precursorMz >= minPrecursorMz )) and
+		        ( maxPrecursorMz is None or ( precursorMz is not None and 
+		          precursorMz < maxPrecursorMz )))
+
+	def testSelect( self ):
+		data = syntheticData( )
+		data.data[ 'scans' ][ 5 ][ 'retentionTime' ] = None
+		data.data[ 'scans' ][ 7 ][ 'polarity' ] = -1
+		table = data.scanTable( )
+		self.assertEqual( len( table ), 60 )
+		criteria = ( dict( level=1 ), dict( level=2, polarity=1 ), 
+		             dict( polarity=-1 ), dict( minTime=1, maxTime=2.05 ),
+		             dict( minPrecursorMz=500, maxPrecursorMz=501 ),
+		             dict( minPrecursorMz=600 ))
+		for criterion in criteria:
+			expected = [ i for i, scan in enumerate( data.data[ 'scans' ]) 
+			             if self.matches( scan, **criterion )]
+			self.assertEqual( table.select( **criterion ).tolist( ), expected )
+		scans = table.take([ 0, 7 ]).scans( )
+		self.assertEqual([ scan[ 'id' ] for scan in scans ], [ 1, 8 ])
+		self.assertEqual( scans[ 1 ][ 'polarity' ], -1 )
+
+	def testTicAndBpc( self ):
+		data = syntheticData( )
+		scans = data.data[ 'scans' ]
+		for level in ( 0, 1, 2 ):
+			selected = [ scan for scan in scans 
+			             if not level or scan[ 'msLevel' ] == level ]
+			self.assertEqual( data.tic( level ), 
+			                  [ sum( scan[ 'intensityArray' ]) for scan in selected ])
+			self.assertEqual( data.bpc( level ), 
+			                  [ max( scan[ 'intensityArray' ]) for scan in selected ])
+
+
+class HeaderValuesTest( TestCase ):
+
+	def assertHeadersMatchPeaks( self, data ):
+		for level in ( 0, 1, 2 ):
+			for expected, value in zip( data.tic( level ), 
+			                            data.tic( level, fromHeaders=True )):
+				self.assertAlmostEqual( value, expected, 3 )
+			self.assertEqual( data.bpc( level, fromHeaders=True ), data.bpc( level ))
+
+	def testHeaderChromatogram( self ):
+		for path in ( self.mzXML3, self.mzML, self.mzData ):
+			data = RawData( path )
+			for level in ( 0, 1, 2 ):
+				times = [ scan[ 'retentionTime' ] for scan in data 
+				          if not level or scan[ 'msLevel' ] == level ]
+				self.assertEqual( headerChromatogram( path, level ), 
+				                  ( times, data.tic( level, fromHeaders=True )))
+				self.assertEqual( headerChromatogram( path, level, True ), 
+				                  ( times, data.bpc( level, fromHeaders=True )))
+		times, values = headerChromatogram( self.mzML, 0, maxTime=5 )
+		self.assertEqual( times, [ RawData( self.mzML ).getScanById( 4 )[ 'retentionTime' ]])
+		self.assertRaises( ValueError, headerChromatogram, self.mzML, minMz=400 )
+
+	def testFromHeadersIsLazy( self ):
+		scans = list( iterScans( self.mzXML3, lazy=True ))
+		data = RawData( )
+		data.data = { 'scans' : scans }
+		self.assertEqual( data.tic( 0, fromHeaders=True ), [ 16675500.0, 764637.0 ])
+		self.assertFalse( any( scan.isDecoded( ) for scan in scans ))
+		# scans without the header values are computed from the peaks
+		mzData = RawData( self.mzData )
+		self.assertEqual( mzData.tic( 0, fromHeaders=True ), mzData.tic( 0 ))
+		self.assertEqual( mzData.bpc( 0, fromHeaders=True ), mzData.bpc( 0 ))
+
+	def testFilteredReads( self ):
+		criteria = { 'minMz' : 400, 'maxMz' : 500 }
+		for path in ( self.mzXML3, self.mzML ):
+			whole = RawData( path )
+			self.assertNotEqual( whole.tic( 0, fromHeaders=True ), whole.tic( 0 ))
+			for lazy in ( False, True ):
+				data = RawData( )
+				data.read( path, lazy=lazy, **criteria )
+				self.assertHeadersMatchPeaks( data )
+
+	def testFilteredPeaks( self ):
+		for packed in ( False, True ):
+			for method, args in (( 'onlyMz', ( 450, 50 )), ( 'removeMz', ( 450, 50 )),
+			                     ( 'onlyMasses', ([ 200, 600 ], 20 )), 
+			                     ( 'removeMasses', ([ 200, 600 ], 20 ))):
+				data = RawData( self.mzXML3 )
+				if packed:
+					data.pack( )
+				data.scanTable( )
+				getattr( data, method )( *args )
+				self.assertHeadersMatchPeaks( data )
+				self.assertEqual( data.scanTable( ).scans( )[ 0 ][ 'totIonCurrent' ], None )
+
+	def testWritersUsePeaks( self ):
+		data = RawData( self.mzML )
+		data.onlyMz( 450, 50 )
+		for name in ( "data.mzXML", "data.mzML" ):
+			data.write( self.tempPath( name ))
+			self.assertHeadersMatchPeaks( RawData( self.tempPath( name )))
+
+
+class CacheTest( TestCase ):
+
+	def testHeaderValuesSurvive( self ):
+		cache = DataCache( self.tempPath( "cache" ))
+		for path in ( self.mzXML3, self.mzML ):
+			fresh = RawData( path )
+			missed = RawData( )
+			missed.read( path, cache=cache )
+			hit = RawData( )
+			hit.read( path, cache=cache )
+			self.assertTrue( os.path.exists( cache.path( path )))
+			for level in ( 0, 1 ):
+				self.assertEqual( hit.tic( level, fromHeaders=True ), 
+				                  fresh.tic( level, fromHeaders=True ))
+				self.assertEqual( hit.bpc( level, fromHeaders=True ), 
+				                  fresh.bpc( level, fromHeaders=True ))
+			self.assertScansEqual( hit, fresh, ( 'id', 'totIonCurrent', 
+				'basePeakIntensity' ))
+
+	def testTransparent( self ):
+		cache = DataCache( self.tempPath( "cache" ))
+		for path in ( self.mzXML2, self.mzData, self.mzML ):
+			fresh = RawData( path )
+			RawData( ).read( path, cache=cache )
+			hit = RawData( )
+			hit.read( path, cache=cache )
+			self.assertEqual( hit.data, fresh.data )
+			self.assertFalse( hit.isPacked( ))
+			self.assertTrue( isinstance( hit.data[ 'scans' ][ 0 ][ 'mzArray' ], list ))
+			hit.data[ 'scans' ][ 0 ][ 'mzArray' ].append( 1000.0 )
+			self.assertEqual( hit.tic( 0 ), fresh.tic( 0 ))
+
+	def testBinaryRoundTrip( self ):
+		source = syntheticData( )
+		path = self.tempPath( "data.mzbin" )
+		source.writeBinary( path )
+		read = RawData( path )
+		self.assertTrue( read.isPacked( ))
+		self.assertEqual( read.data[ 'sourceFile' ], 'synthetic.raw' )
+		self.assertScansEqual( read, source, ( 'id', 'msLevel', 'retentionTime', 
+			'polarity', 'parentScan', 'precursorMz', 'collisionEnergy', 'mzRange' ))
+		filtered = RawData( )
+		filtered.read( path, level=2, minMz=400, maxMz=600 )
+		expected = syntheticData( )
+		expected._applyCriteria( level=2, minMz=400, maxMz=600 )
+		self.assertScansEqual( filtered, expected )
+
+	def testExtraKeys( self ):
+		source = syntheticData( 4 )
+		source.data[ 'scans' ][ 1 ][ 'charge' ] = 2
+		del source.data[ 'scans' ][ 2 ][ 'collisionEnergy' ]
+		source.writeBinary( self.tempPath( "data.mzbin" ))
+		read = RawData( self.tempPath( "data.mzbin" ))
+		self.assertEqual( read.data[ 'scans' ][ 1 ][ 'charge' ], 2 )
+		self.assertFalse( 'collisionEnergy' in read.data[ 'scans' ][ 2 ])
+		self.assertFalse( 'charge' in read.data[ 'scans' ][ 0 ])
+		self.assertFalse( '_scanKeys' in read.data )
+
+	def testReaderVersion( self ):
+		cache = DataCache( self.tempPath( "cache" ))
+		path = cache.path( self.mzML )
+		mzlib._READER_VERSION += 1
+		try:
+			self.assertNotEqual( cache.path( self.mzML ), path )
+		finally:
+			mzlib._READER_VERSION -= 1
+
+
+class WriterTest( TestCase ):
+
+	def checkSha1( self, path, tag ):
+		text = open( path, 'rb' ).read( )
+		end = text.index( tag ) + len( tag )
+		self.assertEqual( hashlib.sha1( text[ :end ]).hexdigest( ),
+		                  text[ end:end + 40 ])
+
+	def testMzXmlRoundTrip( self ):
+		source = syntheticData( )
+		path = self.tempPath( "data.mzXML" )
+		source.write( path )
+		self.checkSha1( path, b'<sha1>' )
+		with IndexedMzXml( path ) as indexed:
+			self.assertTrue( indexed.indexRebuilt is False )
+			self.assertScansEqual( indexed, source, ( 'id', 'msLevel', 'parentScan' ))
+			self.assertEqual( indexed.getScanById( 31 )[ 'id' ], 31 )
+
+		# streamed from a reader, without a known length
+		streamed = self.tempPath( "streamed.mzXML" )
+		writeMzXml( streamed, iterScans( path ), precision=32 )
+		self.checkSha1( streamed, b'<sha1>' )
+		with IndexedMzXml( streamed ) as indexed:
+			self.assertTrue( indexed.indexRebuilt is False )
+
+		# an unknown polarity is left out
+		source.data[ 'scans' ][ 0 ][ 'polarity' ] = None
+		source.write( path )
+		self.assertEqual( RawData( path ).getScanById( 1 )[ 'polarity' ], None )
+		with IndexedMzXml( path ) as indexed:
+			self.assertEqual( indexed.getScanById( 1 )[ 'polarity' ], None )
+		self.assertEqual( RawData( path ).getScanById( 2 )[ 'polarity' ], 1 )
+
+	def testMzMlRoundTrip( self ):
+		source = syntheticData( )
+		path = self.tempPath( "data.mzML" )
+		source.write( path )
+		self.checkSha1( path, b'<fileChecksum>' )
+		with IndexedMzMl( path ) as indexed:
+			self.assertTrue( indexed.indexRebuilt is False )
+			self.assertScansEqual( indexed, source, ( 'id', 'msLevel', 'parentScan',
+				'precursorMz', 'collisionEnergy' ))
+			self.assertEqual( indexed.data[ 'sourceFile' ], 'synthetic.raw' )
+
+		# streamed from a reader, so the spectra are spooled to count them
+		streamed = self.tempPath( "streamed.mzML" )
+		writeMzMl( streamed, iterScans( self.mzML ))
+		self.checkSha1( streamed, b'<fileChecksum>' )
+		with IndexedMzMl( streamed ) as indexed:
+			self.assertTrue( indexed.indexRebuilt is False )
+			self.assertScansEqual( indexed, RawData( self.mzML ))
+
+		# an unknown polarity is left out
+		source.data[ 'scans' ][ 0 ][ 'polarity' ] = None
+		source.write( path )
+		with IndexedMzMl( path ) as indexed:
+			self.assertEqual( indexed.getScanById( 1 )[ 'polarity' ], None )
 
+	def testMzDataGzRoundTrip( self ):
+		source = syntheticData( )
+		path = self.tempPath( "data.mzdata.gz" )
+		source.write( path )
+		self.assertTrue( gzip.open( path ).read( 5 ).startswith( b'<?xml' ))
+		read = RawData( path )
+		keys = ( 'id', 'msLevel', 'polarity', 'retentionTime', 'parentScan', 
+			'precursorMz', 'collisionEnergy' )
+		self.assertScansEqual( read, source, keys )
 
+		streamed = self.tempPath( "streamed.mzdata.xml.gz" )
+		writeMzData( streamed, iterScans( self.mzXML3 ))
+		text = gzip.open( streamed ).read( )
+		self.assertTrue( b'<spectrumList count="2">' in text )
 
+		# scans without a retention time or m/z range
+		streamed = self.tempPath( "mzml.mzdata.xml" )
+		writeMzData( streamed, iterScans( self.mzML ))
+		self.assertScansEqual( RawData( streamed ), RawData( self.mzML ), 
+			( 'id', 'msLevel', 'polarity', 'retentionTime', 'mzRange' ))
+
+	def testCsvGzRoundTrip( self ):
+		source = syntheticData( )
+		path = self.tempPath( "data.csv.gz" )
+		source.write( path )
+		level1 = [ scan for scan in source if scan[ 'msLevel' ] == 1 ]
+		read = RawData( path )
+		self.assertEqual( read.data[ 'sourceFile' ], 'synthetic.raw' )
+		self.assertEqual( len( read.data[ 'scans' ]), len( level1 ))
+		for scan, expected in zip( read, level1 ):
+			self.assertEqual( scan[ 'retentionTime' ], expected[ 'retentionTime' ])
+			for key in ( 'mzArray', 'intensityArray' ):
+				for value, other in zip( scan[ key ], expected[ key ]):
+					self.assertAlmostEqual( value, other, 5 )
+
+		# some files give the number of points as a float
+		text = gzip.open( path ).read( ).replace( b',peak,50,', b',peak,50.0,' )
+		path = self.tempPath( "float.csv" )
+		open( path, 'wb' ).write( text )
+		self.assertScansEqual( RawData( path ), read )
+
+
+class ScanLookupTest( TestCase ):
+
+	def testGetScan( self ):
+		data = syntheticData( )
+		scans = data.data[ 'scans' ]
+		for retentionTime in ( -1, 0.1, 0.14, 0.16, 2.55, 3.0, 100 ):
+			nearest = min( abs( scan[ 'retentionTime' ] - retentionTime ) 
+			               for scan in scans )
+			scan = data.getScan( retentionTime )
+			self.assertAlmostEqual( abs( scan[ 'retentionTime' ] - retentionTime ),
+			                        nearest )
+		self.assertEqual( data.getScanById( 31 )[ 'retentionTime' ], 3.1 )
+		self.assertEqual( data.getScanById( 1000 ), None )
+
+	def testGetScans( self ):
+		data = syntheticData( )
+		data.data[ 'scans' ].reverse( )
+		data.modified( )
+		scans = data.getScans( 1, 2 )
+		self.assertEqual([ scan[ 'id' ] for scan in scans ], range( 10, 20 ))
+		self.assertEqual( len( data.getScans( )), 60 )
+		self.assertEqual( data.getScans( 10, 20 ), [ ])
+
+	def testGetChildScans( self ):
+		data = syntheticData( )
+		data.data[ 'scans' ][ 5 ][ 'parentScan' ] = 1
+		self.assertEqual([ scan[ 'id' ] for scan in data.getChildScans( 1 )], 
+		                 [ 2, 6 ])
+		self.assertEqual( data.getChildScans( 2 ), [ ])
+		data.onlyScans( 0.25, 100 )
+		self.assertEqual([ scan[ 'id' ] for scan in data.getChildScans( 1 )], [ 6 ])
+		self.assertEqual( data.getScanById( 2 ), None )
+
+
+class ChromatogramTest( TestCase ):
+
+	def bruteForce( self, data, low, high, level ):
+		return [ sum( intensity for mz, intensity in zip( scan[ 'mzArray' ], 
+		                                                 scan[ 'intensityArray' ])
+		              if low <= mz < high )
+		         for scan in data if not level or scan[ 'msLevel' ] == level ]
+
+	def testXic( self ):
+		data = syntheticData( )
+		targets = [ 150, ( 500, 25 ), 999.5, 2000 ]
+		for ppm, tolerance in (( False, 5 ), ( True, 20000 )):
+			for level in ( 0, 1, 2 ):
+				result = data.xic( targets, tolerance, ppm, level )
+				self.assertEqual( len( result ), len( targets ))
+				for row, target in zip( result, targets ):
+					if isinstance( target, tuple ):
+						mz, width = target
+					else:
+						mz, width = target, tolerance
+					if ppm:
+						width = mz * width / 1e6
+					expected = self.bruteForce( data, mz - width, mz + width, level )
+					self.assertEqual( len( row ), len( expected ))
+					for value, other in zip( row, expected ):
+						self.assertAlmostEqual( value, other, 6 )
+
+	def testXicUnsortedPeaks( self ):
+		data = syntheticData( 4 )
+		scan = data.data[ 'scans' ][ 0 ]
+		scan[ 'mzArray' ].reverse( )
+		scan[ 'intensityArray' ].reverse( )
+		self.assertAlmostEqual( data.xic([ 500 ], 200 )[ 0 ][ 0 ],
+		                        self.bruteForce( data, 300, 700, 1 )[ 0 ], 6 )
+
+	def testPackedSic( self ):
+		data = syntheticData( )
+		packed = syntheticData( )
+		packed.pack( )
+		for start, stop in (( 0, 1048576 ), ( 300, 700 ), ( 1500, 1600 )):
+			for level in ( 0, 1, 2 ):
+				expected = data.sic( start, stop, level )
+				self.assertEqual( len( packed.sic( start, stop, level )), 
+				                  len( expected ))
+				for value, other in zip( packed.sic( start, stop, level ), expected ):
+					self.assertAlmostEqual( value, other, 6 )
+
+
+class MassFilterTest( TestCase ):
+
+	def check( self, method, masses, tolerance, ppm, inside ):
+		windows = [ ]
+		for mass in masses:
+			if isinstance( mass, tuple ):
+				mz, width = mass
+			else:
+				mz, width = mass, tolerance
+			if ppm:
+				width = mz * width / 1e6
+			windows.append(( mz - width, mz + width ))
+		source = syntheticData( )
+		for packed in ( False, True ):
+			data = syntheticData( )
+			if packed:
+				data.pack( )
+			getattr( data, method )( masses, tolerance, ppm )
+			for scan, original in zip( data, source ):
+				expected = [( mz, intensity ) for mz, intensity in 
+				            zip( original[ 'mzArray' ], original[ 'intensityArray' ])
+				            if any( low <= mz < high for low, high in windows ) == inside ]
+				self.assertEqual( list( zip( scan[ 'mzArray' ], scan[ 'intensityArray' ])),
+				                  expected )
+
+	def testRemoveMasses( self ):
+		# overlapping windows, and a window with its own tolerance
+		self.check( 'removeMasses', [ 200, 210, ( 600, 40 ), 900 ], 8, False, False )
+		self.check( 'removeMasses', [ 300, 700 ], 20000, True, False )
+
+	def testOnlyMasses( self ):
+		self.check( 'onlyMasses', [ 200, 210, ( 600, 40 ), 900 ], 8, False, True )
+		self.check( 'onlyMasses', [ 300, 700 ], 20000, True, True )
+
+	def testSingleMass( self ):
+		data = syntheticData( )
+		expected = syntheticData( )
+		data.onlyMz( 500, 50 )
+		expected.onlyMasses([ 500 ], 50 )
+		self.assertScansEqual( data, expected )
+		data = syntheticData( )
+		expected = syntheticData( )
+		data.removeMz( 500, 50 )
+		expected.removeMasses([ 500 ], 50 )
+		self.assertScansEqual( data, expected )
+
+
+class MzIndexTest( TestCase ):
+
+	def testChromatogram( self ):
+		data = syntheticData( )
+		index = data.buildMzIndex( )
+		self.assertEqual( len( index ), 60 * 50 )
+		for mz, tolerance, ppm in (( 500, 5, False ), ( 250, 10000, True )):
+			for level in ( 0, 1, 2 ):
+				times, intensities = index.chromatogram( mz, tolerance, ppm, level )
+				expected = data.xic([ mz ], tolerance, ppm, level )[ 0 ]
+				self.assertEqual( times.tolist( ), [ scan[ 'retentionTime' ] 
+					for scan in data if not level or scan[ 'msLevel' ] == level ])
+				for value, other in zip( intensities, expected ):
+					self.assertAlmostEqual( value, other, 6 )
+		times, intensities = index.chromatogram( 500, 5, minTime=1, maxTime=2 )
+		self.assertEqual( len( times ), 5 )
+		self.assertTrue( all( 1 <= t < 2 for t in times ))
+
+	def testReadWrite( self ):
+		index = syntheticData( ).buildMzIndex( )
+		path = self.tempPath( "data.mzidx" )
+		index.write( path )
+		read = MzIndex.read( path )
+		for key in ( 'mzArray', 'intensityArray', 'scanPositions', 
+		             'retentionTimes', 'msLevels' ):
+			self.assertEqual( getattr( read, key ).tolist( ), 
+			                  getattr( index, key ).tolist( ))
+		self.assertEqual( read.peaks( 400, 410 )[ 1 ].tolist( ), 
+		                  index.peaks( 400, 410 )[ 1 ].tolist( ))
+
+
+class MemoTest( TestCase ):
+
+	def testModifiedInvalidates( self ):
+		data = syntheticData( )
+		tic = data.tic( )
+		self.assertEqual( data.tic( ), tic )
+		self.assertEqual( data.memoHits, 1 )
+		data.data[ 'scans' ][ 0 ][ 'intensityArray' ][ 0 ] += 1000
+		# changed directly, so the remembered result is still returned
+		self.assertEqual( data.tic( ), tic )
+		data.modified( )
+		self.assertAlmostEqual( data.tic( )[ 0 ], tic[ 0 ] + 1000 )
+
+	def testMutatorsInvalidate( self ):
+		data = syntheticData( )
+		before = data.tic( )
+		data.onlyScans( 1, 3 )
+		self.assertNotEqual( len( data.tic( )), len( before ))
+
+
+class IndexedTest( TestCase ):
+
+	def testGetScanUnsortedTimes( self ):
+		# the scans of the mzML file are not in order of retention time
+		expected = RawData( self.mzML )
+		with IndexedMzMl( self.mzML ) as indexed:
+			for retentionTime in ( 0, 0.70, 3, 5.89, 5.95, 6, 100 ):
+				self.assertEqual( indexed.getScan( retentionTime )[ 'id' ],
+				                  expected.getScan( retentionTime )[ 'id' ])
+
+	def testGetScanMzXml( self ):
+		path = self.tempPath( "data.mzXML" )
+		syntheticData( ).write( path )
+		with IndexedMzXml( path ) as indexed:
+			self.assertEqual( indexed.getScan( 2.04 )[ 'id' ], 20 )
+			self.assertEqual( indexed.getScanById( 20 )[ 'retentionTime' ], 2.0 )
+
+	def testLookupsAfterFiltering( self ):
+		with IndexedMzXml( self.mzXML3 ) as indexed:
+			self.assertEqual( indexed.getScanById( 20 )[ 'id' ], 20 )
+			indexed.onlyScans( 0, 5.9 )
+			self.assertEqual( indexed.getScanById( 20 ), None )
+			self.assertEqual( indexed.getScan( 6 )[ 'id' ], 19 )
+
+	def testParentScans( self ):
+		# scan 4 names scan 1 as its precursor, not the closest MS1 scan
+		data = syntheticData( 4 )
+		data.data[ 'scans' ][ 3 ][ 'parentScan' ] = 1
+		path = self.tempPath( "data.mzXML" )
+		data.write( path )
+		expected = [ scan[ 'parentScan' ] for scan in iterMzXml( path )]
+		self.assertEqual( expected, [ None, 1, None, 1 ])
+		with IndexedMzXml( path ) as indexed:
+			self.assertEqual([ indexed.getScanById( i )[ 'parentScan' ] 
+			                   for i in range( 1, 5 )], expected )
+
+		# nested scans without a precursorScanNum
+		with IndexedMzXml( self.mzXML3 ) as indexed:
+			self.assertEqual( indexed.getScanById( 20 )[ 'parentScan' ], 19 )
+			self.assertEqual( indexed.getScanById( 19 )[ 'parentScan' ], None )
+
+	def testIterationIsLazy( self ):
+		for cls, path in (( IndexedMzMl, self.mzML ), ( IndexedMzXml, self.mzXML3 )):
+			with cls( path ) as indexed:
+				scans = list( indexed.data[ 'scans' ])
+				self.assertFalse( scans[ 0 ].isDecoded( ))
+				self.assertEqual( len( indexed.scanTable( )), len( scans ))
+				self.assertFalse( scans[ 0 ].isDecoded( ))
+				self.assertScansEqual( scans, RawData( path ))
+
+	def testClose( self ):
+		def openFiles( ):
+			return len( os.listdir( '/proc/self/fd' ))
+		if not os.path.isdir( '/proc/self/fd' ):
+			return
+		before = openFiles( )
+		for cls, path in (( IndexedMzMl, self.mzML ), ( IndexedMzXml, self.mzXML3 )):
+			with cls( path ) as indexed:
+				self.assertEqual( len( indexed.data[ 'scans' ]), 
+				                  len( RawData( path ).data[ 'scans' ]))
+			self.assertTrue( indexed._file.closed )
+		self.assertEqual( openFiles( ), before )
+
+
+class TileIndexTest( TestCase ):
+
+	def bruteForce( self, data, minTime, maxTime, minMz, maxMz ):
+		count = 0
+		for scan in data:
+			if ( scan[ 'msLevel' ] != 1 or 
+			     not minTime <= scan[ 'retentionTime' ] < maxTime ):
+				continue
+			count += len([ mz for mz in scan[ 'mzArray' ] if minMz <= mz < maxMz ])
+		return count
+
+	def testRegions( self ):
+		data = syntheticData( )
+		index = data.buildTileIndex( 7, 9 )
+		for region in (( 1, 3, 300, 700 ), ( 0, 10, 0, 2000 ), 
+		               ( 2.5, 2.6, 100, 150 )):
+			self.assertEqual( len( index.region( *region )[ 0 ]), 
+			                  self.bruteForce( data, *region ))
+
+	def testRegionsOnTheTopEdge( self ):
+		data = syntheticData( )
+		index = data.buildTileIndex( 7, 9 )
+		maxTime = index.rtEdges[ -1 ]
+		maxMz = index.mzEdges[ -1 ]
+		self.assertEqual( len( index.region( minTime=maxTime )[ 0 ]), 50 )
+		self.assertEqual( len( index.region( minMz=maxMz )[ 0 ]), 1 )
+		self.assertEqual( len( index.region( minTime=maxTime + 1 )[ 0 ]), 0 )
+
+
+class ViewTest( TestCase ):
+
+	def testViewDoesNotModify( self ):
+		data = syntheticData( )
+		scanCount = len( data.data[ 'scans' ])
+		view = data.view( level=1, minTime=1, maxTime=3 ).withMasses([ 500 ], 50 )
+		self.assertEqual( len( view ), 10 )
+		for scan in view:
+			self.assertTrue( all( 450 <= mz <= 550 for mz in scan[ 'mzArray' ]))
+		self.assertEqual( len( data.data[ 'scans' ]), scanCount )
+		self.assertEqual( len( data.data[ 'scans' ][ 0 ][ 'mzArray' ]), 50 )
+
+	def testViewMatchesMaterialized( self ):
+		data = syntheticData( )
+		view = data.view( level=1 ).withoutMasses([ 500 ], 100 )
+		copy = RawData( data )
+		copy.onlyScans( 0, 100 )
+		copy._applyCriteria( level=1 )
+		copy.removeMasses([ 500 ], 100 )
+		self.assertScansEqual( view.materialize( ), copy )
+		self.assertEqual( view.tic( ), copy.tic( ))
+
+	def testViewFollowsSource( self ):
+		data = syntheticData( )
+		view = data.view( level=2 )
+		self.assertEqual( len( view ), 30 )
+		data.onlyScans( 0, 1 )
+		self.assertEqual( len( view ), 4 )
+
+	def testViewOfLazyData( self ):
+		path = self.tempPath( "data.mzXML" )
+		syntheticData( ).write( path )
+		expected = RawData( path ).view( level=1 ).withMasses([ 500 ], 50 )
+		lazy = RawData( )
+		lazy.read( path, lazy=True )
+		view = lazy.view( level=1 ).withMasses([ 500 ], 50 )
+		self.assertScansEqual( view, expected )
+		self.assertEqual( view.tic( ), expected.tic( ))
+		self.assertScansEqual( view.materialize( ), expected.materialize( ))
+
+
+if __name__ == "__main__":
+	unittest.main( )